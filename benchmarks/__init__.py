@@ -0,0 +1,5 @@
+"""
+Benchmarks for rendering and managing beocijies sites
+
+Run with `python -m benchmarks --help`
+"""
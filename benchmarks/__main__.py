@@ -0,0 +1,294 @@
+"""
+Benchmark rendering and managing a synthetic beocijies site, saving the
+results as JSON so they can be compared across versions
+"""
+
+import json
+import logging
+import platform
+import random
+import signal
+import subprocess
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from pathlib import Path
+from shutil import rmtree
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import monotonic, perf_counter, sleep
+from typing import Any, Callable, Optional
+
+from benchmarks.generate import SiteParameters, generate_site, user_name, write_page
+from beocijies.configure import (
+    CACHE_DIRECTORY,
+    FILENAME,
+    MANIFEST_FILENAME,
+    UPDATES_DATABASE,
+    add_user,
+    delete_user,
+    rename_user,
+)
+from beocijies.render import Feeds, render
+from beocijies.updates import UpdateStore
+from beocijies.version import __version__
+
+# how long to wait for a live render to pick up an edit
+LIVE_TIMEOUT = 30
+
+
+def main(input_args: Optional[list[str]] = None):
+    """
+    Run the benchmarks from the command line
+    """
+    parser = ArgumentParser(description="Benchmark beocijies")
+    parser.add_argument("--users", type=int, default=SiteParameters.users)
+    parser.add_argument("--static-files", type=int, default=SiteParameters.static_files)
+    parser.add_argument("--entries", type=int, default=SiteParameters.entries)
+    parser.add_argument(
+        "--image-size",
+        type=int,
+        help="The size of each user's update image (requires Pillow)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="How many times to run each benchmark"
+    )
+    parser.add_argument(
+        "--skip-live",
+        action="store_true",
+        help="Don't measure how long live renders take to pick up edits",
+    )
+    parser.add_argument("--output", type=Path, help="Where to save the results")
+    parser.add_argument(
+        "--compare", type=Path, help="Earlier results to compare these against"
+    )
+
+    args = parser.parse_args(input_args)
+
+    logging.getLogger("beocijies").setLevel(logging.WARNING)
+
+    parameters = SiteParameters(
+        users=args.users,
+        static_files=args.static_files,
+        entries=args.entries,
+        image_size=args.image_size,
+    )
+
+    results = run(parameters, args.repeat, live=not args.skip_live)
+
+    if args.output:
+        with args.output.open("w") as stream:
+            json.dump(results, stream, indent=4, sort_keys=True)
+
+    previous = None
+    if args.compare:
+        with args.compare.open("r") as stream:
+            previous = json.load(stream)
+
+    report(results, previous)
+
+
+def run(parameters: SiteParameters, repeat: int = 3, live: bool = True) -> dict:
+    """
+    Generate a site and run every benchmark against it
+
+    repeat: How many times to run each benchmark
+    live: Whether to measure live render latency (which requires
+        starting a separate process)
+    """
+    timings: dict[str, list[float]] = {}
+
+    with TemporaryDirectory() as temporary:
+        start = perf_counter()
+        config, destination = generate_site(Path(temporary), parameters)
+        timings["generate"] = [perf_counter() - start]
+
+        for _ in range(repeat):
+            reset(config, destination)
+            timings.setdefault("render-cold", []).append(time(render, config))
+
+        for _ in range(repeat):
+            timings.setdefault("render-warm", []).append(time(render, config))
+
+        for _ in range(repeat):
+            timings.setdefault("feeds", []).append(refresh_feeds(config, destination))
+
+        for name, timing in config_operations(config, repeat).items():
+            timings[name] = timing
+
+        timings["version"] = [version_startup() for _ in range(repeat)]
+
+        if live:
+            timings["live-latency"] = live_latency(
+                config, destination, parameters.entries, repeat
+            )
+
+    return {
+        "beocijies": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "parameters": parameters.to_json(),
+        "results": {
+            name: {"runs": runs, "min": min(runs), "median": median(runs)}
+            for name, runs in timings.items()
+        },
+    }
+
+
+def time(function: Callable, *args, **kwargs) -> float:
+    start = perf_counter()
+    function(*args, **kwargs)
+    return perf_counter() - start
+
+
+def reset(config: Path, destination: Path):
+    """
+    Remove everything a render leaves behind so the next one is cold
+    """
+    rmtree(destination)
+    destination.mkdir()
+
+    rmtree(config / CACHE_DIRECTORY, ignore_errors=True)
+    (config / MANIFEST_FILENAME).unlink(missing_ok=True)
+
+    for suffix in ("", "-wal", "-shm"):
+        (config / f"{UPDATES_DATABASE}{suffix}").unlink(missing_ok=True)
+
+
+def refresh_feeds(config: Path, destination: Path) -> float:
+    """
+    Time reparsing every page and rebuilding every feed
+    """
+    with (config / FILENAME).open("r") as stream:
+        settings = json.load(stream)
+
+    users = {"index", *settings["users"]}
+    feeds = Feeds(
+        config,
+        destination,
+        settings["name"],
+        "https://localhost",
+        settings["users"],
+    )
+
+    # so every page is reparsed
+    store = UpdateStore(config / UPDATES_DATABASE)
+    store.forget_pages()
+    store.close()
+
+    try:
+        return time(feeds.refresh, users, users)
+    finally:
+        feeds.close()
+
+
+def config_operations(config: Path, repeat: int) -> dict[str, list[float]]:
+    """
+    Time adding, renaming and removing users
+    """
+    timings: dict[str, list[float]] = {"add": [], "rename": [], "remove": []}
+
+    for number in range(repeat):
+        name = f"benchmark-{number}"
+
+        timings["add"].append(time(add_user, config, name))
+        timings["rename"].append(time(rename_user, config, name, f"{name}-renamed"))
+        timings["remove"].append(
+            time(delete_user, config, f"{name}-renamed", delete_files=True)
+        )
+
+    return timings
+
+
+def version_startup() -> float:
+    """
+    Time running `beocijies version` in a new process
+    """
+    return time(
+        subprocess.run,
+        [sys.executable, "-m", "beocijies.cli", "version"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def live_latency(
+    config: Path, destination: Path, entries: int, repeat: int
+) -> list[float]:
+    """
+    Time how long a live render takes to write an edited page to disk
+
+    entries: How many h-entries the edited page should have
+    """
+    name = user_name(0)
+    page = destination / name / "index.html"
+    generator = random.Random(0)
+
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "beocijies.cli",
+            "render",
+            "--live",
+            "--no-notify",
+            "--directory",
+            str(config),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    timings = []
+    try:
+        # the first edit waits for the render to start up
+        for attempt in range(repeat + 1):
+            marker = f"edit-{attempt}"
+            write_page(config, name, entries, generator, marker=marker)
+            start = monotonic()
+
+            while marker not in _read(page):
+                if monotonic() - start > LIVE_TIMEOUT:
+                    raise TimeoutError("live render didn't pick up an edit")
+
+                sleep(0.001)
+
+            if attempt:
+                timings.append(monotonic() - start)
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait(LIVE_TIMEOUT)
+
+    return timings
+
+
+def _read(path: Path) -> str:
+    try:
+        return path.read_text()
+    except FileNotFoundError:
+        return ""
+
+
+def report(results: dict[str, Any], previous: Optional[dict[str, Any]] = None):
+    """
+    Print results (and how they compare to earlier results)
+    """
+    print(f"beocijies {results['beocijies']} on Python {results['python']}")
+    print(", ".join(f"{key}: {value}" for key, value in results["parameters"].items()))
+
+    if previous and previous["parameters"] != results["parameters"]:
+        print("warning: earlier results were for a different site")
+
+    for name, result in results["results"].items():
+        line = f"{name:>14}: {result['median'] * 1000:10.1f}ms"
+
+        if previous and name in previous["results"]:
+            old = previous["results"][name]["median"]
+            line = f"{line} (was {old * 1000:.1f}ms, {result['median'] / old:.2f}x)"
+
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Generate synthetic beocijies sites to benchmark against
+"""
+
+import random
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from beocijies.configure import add_user, create
+
+PAGE_TEMPLATE = """{{% extends "#base.html.jinja2" %}}
+{{% block head %}}
+    <title>{{{{me}}}}'s {{{{site_name}}}} page</title>
+{{% endblock %}}
+{{% block body %}}
+    <h1>{{{{me}}}}</h1>
+    <!-- {marker} -->
+{entries}
+{{% endblock %}}
+"""
+
+ENTRY_TEMPLATE = """    <article class="h-entry" id="post-{number}">
+        <h2 class="p-name">Post {number}</h2>
+        <time class="dt-published" datetime="{published}">{published}</time>
+        <div class="e-content">
+            <p>{text}</p>
+            <img src="{image}" alt="an image">
+        </div>
+    </article>"""
+
+WORDS = (
+    "beocijies",
+    "cat",
+    "dog",
+    "garden",
+    "lorem",
+    "ipsum",
+    "update",
+    "website",
+    "zine",
+)
+
+
+@dataclass(frozen=True)
+class SiteParameters:
+    """
+    The shape of a generated site
+
+    users: How many users the site has (not counting the index)
+    static_files: How many static files each user has
+    entries: How many h-entries each user's page has
+    image_size: The width and height of each user's update image. If
+        None, users don't have update images.
+    static_size: The size (in bytes) of each static file
+    seed: The seed for any random content
+    """
+
+    users: int = 20
+    static_files: int = 5
+    entries: int = 10
+    image_size: Optional[int] = None
+    static_size: int = 4096
+    seed: int = 0
+
+    def to_json(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def user_name(number: int) -> str:
+    return f"user-{number}"
+
+
+def generate_site(
+    directory: Path, parameters: SiteParameters = SiteParameters()
+) -> tuple[Path, Path]:
+    """
+    Create a site using the real configuration APIs. Returns the
+    configuration directory and the destination.
+    """
+    generator = random.Random(parameters.seed)
+
+    config = directory / "config"
+    destination = directory / "site"
+
+    create(config, destination, "benchmark", compress=())
+
+    for number in range(parameters.users):
+        name = user_name(number)
+        add_user(config, name, public=number % 4 != 0)
+
+        static = config / "static" / name
+        for file_number in range(parameters.static_files):
+            (static / f"file-{file_number}.bin").write_bytes(
+                generator.randbytes(parameters.static_size)
+            )
+
+        if parameters.image_size:
+            write_image(static / "update-1.jpg", parameters.image_size, generator)
+
+        write_page(config, name, parameters.entries, generator)
+
+    return config, destination
+
+
+def write_page(
+    config: Path,
+    name: str,
+    entries: int,
+    generator: random.Random,
+    marker: str = "",
+):
+    """
+    Write a user's template with a number of h-entries
+
+    marker: Text to include in a comment on the page (so edits can be
+        spotted in the output)
+    """
+    (config / "templates" / f"{name}.html.jinja2").write_text(
+        PAGE_TEMPLATE.format(
+            marker=marker,
+            entries="\n".join(
+                ENTRY_TEMPLATE.format(
+                    number=number,
+                    published=(
+                        f"2025-{number % 12 + 1:02}-{number % 28 + 1:02}"
+                        f"T{number % 24:02}:00:00+0000"
+                    ),
+                    text=" ".join(generator.choices(WORDS, k=50)),
+                    image="file-0.bin",
+                )
+                for number in range(entries)
+            ),
+        )
+    )
+
+
+def write_image(path: Path, size: int, generator: random.Random):
+    """
+    Write a noisy JPEG (so it doesn't compress unrealistically well).
+    Nothing is written if Pillow isn't installed.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+
+    image = Image.frombytes("RGB", (size, size), generator.randbytes(size * size * 3))
+    image.save(path, "JPEG", quality=90)
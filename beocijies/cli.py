@@ -2,23 +2,39 @@
 Run beocijies from the command line
 """
 
+import json
 import logging
 import re
+import sys
 from argparse import ArgumentParser
 from os import environ
 from pathlib import Path
 from typing import List, Optional
 
 from beocijies.configure import (
-    add_user,
+    DEFAULT_FEED_ENTRIES,
+    FILENAME,
+    User,
+    add_users,
     create,
-    delete_user,
+    delete_users,
+    find_destination,
     forget_users,
     grab_users,
+    load_users,
     rename_user,
 )
-from beocijies.render import LinkType, render
+from beocijies.images import DEFAULT_WIDTHS
+from beocijies.publish import (
+    DEFAULT_COMPRESSION,
+    DEFAULT_GENERATIONS,
+    Compression,
+    PublishMode,
+    rollback,
+)
+from beocijies.timings import Profiler
 from beocijies.version import __version__
+from beocijies.watch import DEFAULT_DEBOUNCE
 
 
 def main(input_args: Optional[List[str]] = None):
@@ -108,9 +124,71 @@ def main(input_args: Optional[List[str]] = None):
         const=True,
         help="Don't serve the site on www.DOMAIN",
     )
+    create_parser.add_argument(
+        "--generations",
+        type=int,
+        default=DEFAULT_GENERATIONS,
+        help="How many fresh renders of the site to keep for rolling back",
+    )
+    create_parser.add_argument(
+        "--publish",
+        choices=[mode.value for mode in PublishMode],
+        default=PublishMode.AUTO.value,
+        help=(
+            "How to publish static files (each option falls back to the "
+            "options after it). auto never hardlinks: hardlinked files share "
+            "edits to the originals with the live site as soon as they're made"
+        ),
+    )
+    create_parser.add_argument(
+        "--compress",
+        nargs="*",
+        choices=[compression.value for compression in Compression],
+        default=[compression.value for compression in DEFAULT_COMPRESSION],
+        help="Precompress pages, feeds and text files (pass nothing to disable)",
+    )
+    create_parser.add_argument(
+        "--fingerprint",
+        action="store_true",
+        help=(
+            "Also publish static files under content-hashed names "
+            "that browsers can cache forever"
+        ),
+    )
+    create_parser.add_argument(
+        "--image-widths",
+        nargs="*",
+        type=int,
+        default=list(DEFAULT_WIDTHS),
+        help=(
+            "The widths to resize update images to, if Pillow is installed "
+            "(pass nothing to disable)"
+        ),
+    )
+
+    create_parser.add_argument(
+        "--feed-entries",
+        type=int,
+        default=DEFAULT_FEED_ENTRIES,
+        help=(
+            "The most entries to put in each feed, with older entries moved to "
+            "archive feeds (0 for no limit)"
+        ),
+    )
+    create_parser.add_argument(
+        "--feed-retention",
+        type=int,
+        help="The most entries to keep for each user (by default, keep them all)",
+    )
 
     add_parser = subparsers.add_parser("add", help="Add a beocijies user")
-    add_parser.add_argument("name", help="The name of the user")
+    add_parser.add_argument("names", nargs="*", help="The names of the users")
+    add_parser.add_argument(
+        "--from",
+        dest="users_file",
+        type=Path,
+        help="A JSON or CSV file listing users to add",
+    )
     add_parser.add_argument(
         "--directory",
         type=Path,
@@ -158,7 +236,13 @@ def main(input_args: Optional[List[str]] = None):
     )
 
     delete_parser = subparsers.add_parser("remove", help="Remove a beocijies user")
-    delete_parser.add_argument("name", help="The name of the user")
+    delete_parser.add_argument("names", nargs="*", help="The names of the users")
+    delete_parser.add_argument(
+        "--from",
+        dest="users_file",
+        type=Path,
+        help="A JSON or CSV file listing users to remove",
+    )
     delete_parser.add_argument(
         "--delete", action="store_true", help="Delete files associated with the user"
     )
@@ -248,23 +332,140 @@ def main(input_args: Optional[List[str]] = None):
         "--relative",
         dest="link_type",
         action="store_const",
-        const=LinkType.RELATIVE,
+        const="relative",
         help="Render users with relative links",
     )
     link_group.add_argument(
         "--absolute",
         dest="link_type",
         action="store_const",
-        const=LinkType.ABSOLUTE,
+        const="absolute",
         help="Render users with absolute links",
     )
     render_parser.add_argument(
         "--fresh", action="store_true", help="delete existing files"
     )
+    render_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="How many processes to render pages with",
+    )
+
+    render_parser.add_argument(
+        "--profile",
+        type=Path,
+        help="Save a JSON report of how long each part of the render took",
+    )
+    render_parser.add_argument(
+        "--profiler",
+        choices=[profiler.value for profiler in Profiler],
+        help=(
+            "Include results from cProfile or tracemalloc in the report "
+            "(only the main process is profiled)"
+        ),
+    )
+    render_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        help=(
+            "How long (in seconds) changes need to settle before live renders "
+            "act on them"
+        ),
+    )
+    render_parser.add_argument(
+        "--reload",
+        nargs="?",
+        type=int,
+        const=True,
+        metavar="PORT",
+        help=(
+            "Reload pages open in a browser when they're rerendered by a live "
+            "render to the test destination (serving reload events on PORT, "
+            "if given)"
+        ),
+    )
+    render_parser.add_argument(
+        "--metrics",
+        type=Path,
+        help=(
+            "Write Prometheus metrics to this file "
+            "(e.g., for node_exporter's textfile collector)"
+        ),
+    )
+    render_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port (on localhost)",
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve a rendered site locally for testing"
+    )
+    serve_parser.add_argument(
+        "--directory",
+        type=Path,
+        default=Path.cwd(),
+        help="The beocijies configuration directory",
+    )
+    serve_destination_group = serve_parser.add_mutually_exclusive_group()
+    serve_destination_group.add_argument(
+        "--production",
+        action="store_true",
+        help="Serve destination not test-destination",
+    )
+    serve_destination_group.add_argument(
+        "--destination", type=Path, help="Serve this location"
+    )
+    serve_parser.add_argument(
+        "--port", type=int, help="The port to serve the site on (default: 8000)"
+    )
+    serve_parser.add_argument(
+        "--address", help="The address to serve the site on (default: 127.0.0.1)"
+    )
+    serve_parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help=(
+            "Render pages the first time they're requested (and again after "
+            "they change) instead of serving what was last rendered"
+        ),
+    )
+
+    rollback_parser = subparsers.add_parser(
+        "rollback", help="Switch back to the previous fresh render of a site"
+    )
+    rollback_parser.add_argument(
+        "--directory",
+        type=Path,
+        default=Path.cwd(),
+        help="The beocijies configuration directory",
+    )
+    rollback_destination_group = rollback_parser.add_mutually_exclusive_group()
+    rollback_destination_group.add_argument(
+        "--production",
+        action="store_true",
+        help="Roll back destination not test-destination",
+    )
+    rollback_destination_group.add_argument(
+        "--destination", type=Path, help="Roll back this location"
+    )
+
+    compile_parser = subparsers.add_parser(
+        "compile", help="Precompile templates to speed up rendering"
+    )
+    compile_parser.add_argument(
+        "--directory",
+        type=Path,
+        default=Path.cwd(),
+        help="The beocijies configuration directory",
+    )
 
     subparsers.add_parser("version", help="Print beocijies version then exit")
 
-    args = parser.parse_args()
+    args = parser.parse_args(input_args)
 
     logger = logging.getLogger("beocijies")
     logger.setLevel(level=args.log_level)
@@ -276,6 +477,17 @@ def main(input_args: Optional[List[str]] = None):
         if args.httpd and args.httpd.is_dir():
             args.httpd = args.httpd / "httpd-vhosts.conf"
 
+    if args.command in ("add", "remove"):
+        # remove only needs the names
+        public = args.command == "add" and args.public
+
+        users = [User(name, public) for name in args.names]
+        if args.users_file:
+            users.extend(load_users(args.users_file, public=public))
+
+        if not users:
+            parser.error(f"{args.command} needs at least one user")
+
     if args.command == "create":
         if args.domain is None:
             args.domain = environ.get("HOST", "localhost")
@@ -305,23 +517,24 @@ def main(input_args: Optional[List[str]] = None):
             httpd=args.httpd,
             protocol=args.protocol,
             local=args.local,
+            generations=args.generations,
+            publish=PublishMode(args.publish),
+            compress=[Compression(value) for value in args.compress],
+            image_widths=args.image_widths,
+            fingerprint=args.fingerprint,
+            feed_entries=args.feed_entries,
+            feed_retention=args.feed_retention,
         )
     elif args.command == "add":
-        add_user(
-            args.directory,
-            args.name,
-            public=args.public,
-            nginx=args.nginx,
-            httpd=args.httpd,
-        )
+        add_users(args.directory, users, nginx=args.nginx, httpd=args.httpd)
     elif args.command == "rename":
         rename_user(
             args.directory, args.old, args.new, nginx=args.nginx, httpd=args.httpd
         )
     elif args.command == "remove":
-        delete_user(
+        delete_users(
             args.directory,
-            args.name,
+            [user.name for user in users],
             delete_files=args.delete,
             nginx=args.nginx,
             httpd=args.httpd,
@@ -331,9 +544,15 @@ def main(input_args: Optional[List[str]] = None):
     elif args.command == "disconnect":
         forget_users(args.directory, args.name)
     elif args.command == "render":
+        from beocijies.reload import DEFAULT_RELOAD_PORT
+        from beocijies.render import LinkType, render
+
         if args.notify is None:
             args.notify = args.live
 
+        if args.reload is True:
+            args.reload = DEFAULT_RELOAD_PORT
+
         render(
             args.directory,
             destination=args.destination or args.production,
@@ -341,8 +560,38 @@ def main(input_args: Optional[List[str]] = None):
             live=args.live,
             notify=args.notify,
             fresh=args.fresh,
-            link_type=args.link_type,
+            link_type=LinkType(args.link_type) if args.link_type else None,
+            jobs=args.jobs,
+            profile=args.profile,
+            profiler=Profiler(args.profiler) if args.profiler else None,
+            metrics_file=args.metrics,
+            metrics_port=args.metrics_port,
+            debounce=args.debounce,
+            reload_port=args.reload,
         )
+    elif args.command == "serve":
+        from beocijies.serve import DEFAULT_SERVE_PORT, SERVE_ADDRESS, serve
+
+        serve(
+            args.directory,
+            args.destination or args.production,
+            port=DEFAULT_SERVE_PORT if args.port is None else args.port,
+            address=args.address or SERVE_ADDRESS,
+            lazy=args.lazy,
+        )
+    elif args.command == "rollback":
+        with (args.directory / FILENAME).open("r") as stream:
+            config = json.load(stream)
+
+        destination = find_destination(config, args.destination or args.production)
+
+        # scripts need to be able to tell nothing was rolled back
+        if rollback(destination) is None:
+            sys.exit(1)
+    elif args.command == "compile":
+        from beocijies.render import compile_templates
+
+        compile_templates(args.directory)
     elif args.command == "version":
         print(__version__)
     else:
@@ -2,25 +2,41 @@
 Configure the website
 """
 
+import csv
 import json
 import logging
 import re
+from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
 from shutil import copy2, move, rmtree
-from typing import Any, Optional, Union
-
-import requests
-from jinja2 import Template
-
+from typing import Any, Iterable, Optional, Union
+
+from beocijies.images import DEFAULT_WIDTHS
+from beocijies.publish import (
+    DEFAULT_COMPRESSION,
+    DEFAULT_GENERATIONS,
+    FINGERPRINT_PATTERN,
+    Compression,
+    PublishMode,
+)
 from beocijies.version import __version__
 
 FILENAME = "settings.json"
 UPDATES_FILENAME = "updates.json"
+UPDATES_DATABASE = "updates.sqlite3"
+MANIFEST_FILENAME = "manifest.json"
+CACHE_DIRECTORY = "cache"
+COMPILED_TEMPLATES = "templates.zip"
+
+DEFAULT_FEED_ENTRIES = 50
 
 SAFE_NAME = re.compile(r"^[A-Za-z0-9-]+$")
 FORBIDDEN_NAMES = {"#base", "#default"}
 
+# how yes is written in user lists
+TRUE_VALUES = {"1", "public", "true", "y", "yes"}
+
 ROBOTS_TEMPLATE = """{% for agent in disallowed or () %}
 User-agent: {{agent}}
 Disallow: /
@@ -44,7 +60,12 @@ BASE_TEMPLATE = """<!DOCTYPE html>
             {% if me != "index" %}<a href="../index.html">a {{site_name}} site</a><br>{% endif %}
             <em>last updated {{page_date}}</em><br>
             {% if latest_image -%}
-                <img style="max-width: 100%; max-height: 500px;" src="{{latest_image}}" alt="{{me}} updating their {{site_name}} site">
+                <picture>
+                    {% for source in latest_image_sources or () -%}
+                    <source type="{{source.type}}" srcset="{{source.srcset}}" sizes="(max-width: 960px) 100vw, 960px">
+                    {% endfor -%}
+                    <img style="max-width: 100%; max-height: 500px;" src="{{latest_image}}"{% if latest_image_srcset %} srcset="{{latest_image_srcset}}" sizes="(max-width: 960px) 100vw, 960px"{% endif %} alt="{{me}} updating their {{site_name}} site" loading="lazy" decoding="async">
+                </picture>
             {%- endif %}
             <hr>
             {% if has_feed %}🛜 <a href="./atom.xml">Atom</a>/<a href="./rss.xml">RSS</a>
@@ -73,7 +94,10 @@ NGINX_TEMPLATE = """server {
     listen [::]:80;
 
     location {{url_path}} {
-        root {{path}};
+        root {{path}};{% if "gzip" in compress %}
+        gzip_static on;{% endif %}{% if "br" in compress %}
+        brotli_static on;{% endif %}{% if fingerprint %}
+{{cache_headers}}{% endif %}
     }
 }
 {% for user in users if not user == "index" %}
@@ -83,19 +107,42 @@ server {
     listen [::]:80;
 
     location / {
-        root {{path}}/{{user}}/;
+        root {{path}}/{{user}}/;{% if "gzip" in compress %}
+        gzip_static on;{% endif %}{% if "br" in compress %}
+        brotli_static on;{% endif %}{% if fingerprint %}
+{{cache_headers}}{% endif %}
     }
 }
 {% endfor %}
 """  # noqa: E501
 
+# fingerprinted files never change, everything else should be checked
+NGINX_CACHE_HEADERS = """
+        location ~ "{{pattern}}" {
+            add_header Cache-Control "public, max-age=31536000, immutable";
+        }
+
+        location ~ "\\.(html|xml|json)$" {
+            add_header Cache-Control "no-cache";
+        }"""
+
+HTTPD_CACHE_HEADERS = """
+    <IfModule mod_headers.c>
+        <FilesMatch "\\.(html|xml|json)$">
+            Header set Cache-Control "no-cache"
+        </FilesMatch>
+        <FilesMatch "{{pattern}}">
+            Header set Cache-Control "public, max-age=31536000, immutable"
+        </FilesMatch>
+    </IfModule>"""
+
 HTTPD_TEMPLATE = """
 <VirtualHost *:80>
     {% if url_path %}<Directory "{{url_path}}">
         {% endif %}DocumentRoot "{{path}}"{% if url_path %}
     </Directory>{% endif %}
     ServerName {% if prefix %}{{prefix}}.{{domain}}{% else %}{{domain}}{% if not local%}
-    ServerAlias www.{{domain}}{% endif %}{% endif %}
+    ServerAlias www.{{domain}}{% endif %}{% endif %}{% if fingerprint %}{{cache_headers}}{% endif %}
 </VirtualHost>
 {% for user in users if not user == "index" %}
 <VirtualHost *:80>
@@ -103,7 +150,7 @@ HTTPD_TEMPLATE = """
         {% endif %}DocumentRoot "{{path}}/{{user}}"{% if url_path %}
     </Directory>{% endif %}
     ServerName {% if prefix %}{{prefix}}.{{user}}.{{domain}}{% else %}{{user}}.{{domain}}{% if not local%}
-    ServerAlias www.{{user}}.{{domain}}{% endif %}{% endif %}
+    ServerAlias www.{{user}}.{{domain}}{% endif %}{% endif %}{% if fingerprint %}{{cache_headers}}{% endif %}
 </VirtualHost>
 {% endfor %}
 """  # noqa: E501
@@ -117,6 +164,22 @@ class Feed(Enum):
     PUBLIC = "public"
 
 
+@dataclass(frozen=True)
+class User:
+    """
+    A user to add to (or update on) the site
+
+    name: the name of the user
+    public: whether the user should be included in the public index
+    feed: Whether to include the user in feed updates. If not supplied,
+        the feed will be PUBLIC if public=True and PERSONAL if not.
+    """
+
+    name: str
+    public: bool = True
+    feed: Optional[Feed] = None
+
+
 def create(
     directory: Path,
     destination: Path,
@@ -134,6 +197,13 @@ def create(
     nginx: Optional[Path] = None,
     httpd: Optional[Path] = None,
     protocol: str = "https",
+    generations: int = DEFAULT_GENERATIONS,
+    publish: PublishMode = PublishMode.AUTO,
+    compress: Iterable[Compression] = DEFAULT_COMPRESSION,
+    image_widths: Iterable[int] = DEFAULT_WIDTHS,
+    fingerprint: bool = False,
+    feed_entries: int = DEFAULT_FEED_ENTRIES,
+    feed_retention: Optional[int] = None,
 ):
     """
     Create a beocijies site
@@ -159,8 +229,27 @@ def create(
     nginx: where to save nginx configurations
     httpd: where to save apache configurations (experimental)
     protocol: http or https
+    generations: How many fresh renders of the site to keep around for
+        rolling back to
+    publish: How to publish static files. By default, the cheapest
+        option that gives the site its own copy (e.g., reflinking) will
+        be used. Hardlinks are cheaper but share edits to the source
+        with the live site immediately, so they have to be asked for.
+    compress: Which precompressed copies of pages, feeds, and text
+        files to create for the web server (brotli requires the brotli
+        module and the ngx_brotli module for NGINX).
+    image_widths: The widths update images are resized to (if Pillow
+        is installed). If empty, update images are used as-is.
+    fingerprint: Also publish static files under names containing a
+        hash of their contents so browsers can cache them forever (use
+        the asset function in templates to get the name). The web
+        server configuration will tell browsers to do so.
+    feed_entries: The most entries to put in each feed. Older entries
+        are paged into Atom archive feeds. 0 means no limit.
+    feed_retention: The most entries to keep for each user. Older
+        entries are dropped from feeds entirely.
     """
-    config: dict[str, Optional[Union[str, bool, dict]]] = {
+    config: dict[str, Optional[Union[str, bool, int, list, dict]]] = {
         "version": __version__,
         "destination": str(destination.absolute()),
         "name": name,
@@ -175,6 +264,13 @@ def create(
             "disallowed": disallowed_agents,
         },
         "subdomains": subdomains,
+        "generations": generations,
+        "publish": publish.value,
+        "compress": [compression.value for compression in compress],
+        "image-widths": list(image_widths),
+        "fingerprint": fingerprint,
+        "feed-entries": feed_entries,
+        "feed-retention": feed_retention,
         "users": {},
         "neighbours": {},
     }
@@ -198,6 +294,10 @@ def create(
 
     save_config(config, directory)
 
+    # jinja2 (and requests) are slow to import, so they're only
+    # imported by the commands that use them
+    from jinja2 import Template
+
     static = directory / "static"
     static.mkdir(exist_ok=True)
 
@@ -223,23 +323,19 @@ def create(
         with default_template.open("w") as stream:
             stream.write(DEFAULT_TEMPLATE)
 
-    if existing_users:
-        for name, info in existing_users.items():
-            if name == "index":
-                continue
+    users = []
+    for name, info in existing_users.items():
+        if name == "index":
+            continue
 
-            feed_value = info.pop("feed", None)
-            feed = Feed(feed_value) if feed_value else None
+        feed_value = info.pop("feed", None)
+        feed = Feed(feed_value) if feed_value else None
 
-            add_user(directory, name, feed=feed, **info)
+        users.append(User(name, feed=feed, **info))
 
-    add_user(
-        directory,
-        "index",
-        feed=Feed.PUBLIC,
-        nginx=nginx,
-        httpd=httpd,
-    )
+    users.append(User("index", feed=Feed.PUBLIC))
+
+    add_users(directory, users, nginx=nginx, httpd=httpd)
 
 
 def add_user(
@@ -266,44 +362,73 @@ def add_user(
     nginx: where to save nginx configurations
     httpd: where to save apache configurations (experimental)
     """
-    if feed is None:
-        feed = Feed.PUBLIC if public else Feed.PERSONAL
+    add_users(directory, [User(name, public, feed)], nginx=nginx, httpd=httpd)
+
+
+def add_users(
+    directory: Path,
+    users: Iterable[User],
+    *,
+    nginx: Optional[Path] = None,
+    httpd: Optional[Path] = None,
+):
+    """
+    Add (or update) several users at once. The config file and web
+    server configurations are only written once, and nothing is changed
+    if any of the names are forbidden.
+
+    rerunning will not erase or overwrite any existing template or
+    static files
+
+    directory: the directory containing the config file
+    users: the users to add
+    nginx: where to save nginx configurations
+    httpd: where to save apache configurations (experimental)
+    """
+    users = list(users)
 
-    check_name(name)
+    for user in users:
+        check_name(user.name)
 
     path = directory / FILENAME
 
     with path.open("r") as stream:
         config = json.load(stream)
 
-    if name in config["users"]:
-        LOGGER.info("updating existing user %s", name)
-        added = False
-    else:
-        LOGGER.info("creating user %s", name)
-        added = True
+    added = False
+    for user in users:
+        if user.name in config["users"]:
+            LOGGER.info("updating existing user %s", user.name)
+        else:
+            LOGGER.info("creating user %s", user.name)
+            added = True
+
+        feed = user.feed
+        if feed is None:
+            feed = Feed.PUBLIC if user.public else Feed.PERSONAL
 
-    user_config: dict[str, Union[str, bool]] = {"feed": feed.value}
+        user_config: dict[str, Union[str, bool]] = {"feed": feed.value}
 
-    if name != "index":
-        user_config["public"] = public
+        if user.name != "index":
+            user_config["public"] = user.public
 
-    config["users"][name] = user_config
+        config["users"][user.name] = user_config
 
     save_config(config, directory)
 
     templates = directory / "templates"
 
-    template = templates / f"{name}.html.jinja2"
+    for user in users:
+        template = templates / f"{user.name}.html.jinja2"
 
-    if not template.exists():
-        LOGGER.debug("Creating template %s", template)
-        copy2(templates / "#default.html.jinja2", template)
-        # The page was last updated now, not default template edit time
-        template.touch(exist_ok=True)
+        if not template.exists():
+            LOGGER.debug("Creating template %s", template)
+            copy2(templates / "#default.html.jinja2", template)
+            # The page was last updated now, not default template edit time
+            template.touch(exist_ok=True)
 
-    LOGGER.debug("Creating static directory")
-    (directory / "static" / name).mkdir(exist_ok=True)
+        LOGGER.debug("Creating static directory for %s", user.name)
+        (directory / "static" / user.name).mkdir(exist_ok=True)
 
     if nginx:
         _write_nginx(nginx, config, certbot=added)
@@ -402,33 +527,62 @@ def delete_user(
     nginx: where to save nginx configurations
     httpd: where to save apache configurations (experimental)
     """
+    delete_users(directory, [name], delete_files=delete_files, nginx=nginx, httpd=httpd)
+
+
+def delete_users(
+    directory: Path,
+    names: Iterable[str],
+    *,
+    delete_files: bool = False,
+    nginx: Optional[Path] = None,
+    httpd: Optional[Path] = None,
+):
+    """
+    Delete several existing users at once. The config file and web
+    server configurations are only written once, and nothing is changed
+    if any of the users don't exist.
+
+    The site will not be updated until it is rerendered
+
+    directory: the directory containing the config file
+    names: the users to delete
+    delete_files: Delete the users' templates and static files as well
+    nginx: where to save nginx configurations
+    httpd: where to save apache configurations (experimental)
+    """
+    names = list(dict.fromkeys(names))
+
     path = directory / FILENAME
 
     with path.open("r") as stream:
         config = json.load(stream)
 
-    if name not in config["users"]:
-        raise ValueError(f"User doesn't exist: {name}")
+    for name in names:
+        if name not in config["users"]:
+            raise ValueError(f"User doesn't exist: {name}")
 
-    LOGGER.info("Deleting user %s", name)
+    for name in names:
+        LOGGER.info("Deleting user %s", name)
 
-    del config["users"][name]
+        del config["users"][name]
 
     save_config(config, directory)
 
     if delete_files:
         templates = directory / "templates"
 
-        template = templates / f"{name}.html.jinja2"
+        for name in names:
+            template = templates / f"{name}.html.jinja2"
 
-        if template.exists():
-            LOGGER.debug("Deleting template %s", template)
-            template.unlink()
+            if template.exists():
+                LOGGER.debug("Deleting template %s", template)
+                template.unlink()
 
-        static = directory / "static" / name
-        if static.is_dir():
-            LOGGER.debug("Deleting static directory")
-            rmtree(static)
+            static = directory / "static" / name
+            if static.is_dir():
+                LOGGER.debug("Deleting static directory for %s", name)
+                rmtree(static)
 
     if nginx:
         _write_nginx(nginx, config, certbot=False)
@@ -437,6 +591,59 @@ def delete_user(
         _write_httpd(httpd, config, certbot=False)
 
 
+def load_users(path: Path, public: bool = True) -> list[User]:
+    """
+    Load a list of users from a JSON or CSV file.
+
+    JSON files can either be a list (of names or objects with a name
+    and, optionally, public and feed) or an object mapping names to
+    their settings (like the users in the config file). CSV files need
+    a header with a name column and, optionally, public and feed
+    columns.
+
+    path: the file to load
+    public: whether users are public if the file doesn't say
+    """
+    if path.suffix.lower() == ".json":
+        with path.open("r") as stream:
+            data = json.load(stream)
+
+        if isinstance(data, dict):
+            entries = [{**info, "name": name} for name, info in data.items()]
+        else:
+            entries = [
+                {"name": entry} if isinstance(entry, str) else entry for entry in data
+            ]
+    else:
+        with path.open("r", newline="") as stream:
+            reader = csv.DictReader(stream)
+
+            if "name" not in (reader.fieldnames or ()):
+                raise ValueError(f"{path} needs a name column")
+
+            entries = [
+                {key: value for key, value in row.items() if value not in (None, "")}
+                for row in reader
+            ]
+
+    users = []
+    for entry in entries:
+        if not entry.get("name"):
+            raise ValueError(f"User without a name in {path}")
+
+        user_public = entry.get("public", public)
+        if isinstance(user_public, str):
+            user_public = user_public.strip().lower() in TRUE_VALUES
+
+        feed = entry.get("feed")
+
+        users.append(
+            User(entry["name"], bool(user_public), Feed(feed) if feed else None)
+        )
+
+    return users
+
+
 def grab_users(directory: Path, name: str, domain: str):
     """
     Grab/Update a user list for another site
@@ -445,6 +652,8 @@ def grab_users(directory: Path, name: str, domain: str):
     name: how to refer to the other site
     domain: the domain for the other site
     """
+    import requests
+
     path = directory / FILENAME
 
     with path.open("r") as stream:
@@ -515,6 +724,12 @@ def _write_nginx(directory: Path, config: dict[str, Any], certbot: bool = True):
     prefix = config.get("prefix")
     users = config["users"] if config["subdomains"] else {}
 
+    compress = config.get(
+        "compress", [compression.value for compression in DEFAULT_COMPRESSION]
+    )
+
+    from jinja2 import Template
+
     nginx_template = Template(NGINX_TEMPLATE)
     if prefix:
         nginx_file = directory / f"{prefix}.{domain}"
@@ -530,6 +745,11 @@ def _write_nginx(directory: Path, config: dict[str, Any], certbot: bool = True):
                 users=users,
                 path=config["destination"],
                 url_safe_name=url_safe_name,
+                compress=compress,
+                fingerprint=config.get("fingerprint", False),
+                cache_headers=Template(NGINX_CACHE_HEADERS).render(
+                    pattern=FINGERPRINT_PATTERN
+                ),
             )
         )
 
@@ -571,6 +791,8 @@ def _write_httpd(path: Path, config: dict[str, Any], certbot: bool = True):
     prefix = config.get("prefix")
     users = config["users"] if config["subdomains"] else {}
 
+    from jinja2 import Template
+
     httpd_template = Template(HTTPD_TEMPLATE)
     with path.open("w") as stream:
         stream.write(
@@ -582,6 +804,10 @@ def _write_httpd(path: Path, config: dict[str, Any], certbot: bool = True):
                 users=users,
                 path=config["destination"],
                 url_safe_name=url_safe_name,
+                fingerprint=config.get("fingerprint", False),
+                cache_headers=Template(HTTPD_CACHE_HEADERS).render(
+                    pattern=FINGERPRINT_PATTERN
+                ),
             )
         )
 
@@ -623,3 +849,23 @@ def save_config(config: dict, directory: Path):
             sort_keys=True,
             indent=4,
         )
+
+
+def find_destination(
+    config: dict[str, Any], destination: Optional[Union[bool, Path]] = None
+) -> Path:
+    """
+    Figure out where a site should be rendered to
+
+    config: The site's configuration
+    destination: Either, a location, True, to use the main destination
+        in the config, or False/None to default to a test destination if
+        it is defined.
+    """
+    if isinstance(destination, Path):
+        return destination
+
+    if destination:
+        return Path(config["destination"])
+
+    return Path(config.get("test-destination", config["destination"]))
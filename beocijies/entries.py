@@ -0,0 +1,328 @@
+"""
+Find h-entries in rendered pages without building the whole document
+"""
+
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Iterator, Optional, Union
+
+# these never have contents
+VOID_ELEMENTS = frozenset(
+    {
+        "area",
+        "base",
+        "basefont",
+        "bgsound",
+        "br",
+        "col",
+        "command",
+        "embed",
+        "frame",
+        "hr",
+        "image",
+        "img",
+        "input",
+        "isindex",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "nextid",
+        "param",
+        "source",
+        "spacer",
+        "track",
+        "wbr",
+    }
+)
+
+# text within these isn't part of an element's text
+STRING_CONTAINERS = frozenset({"rp", "rt", "script", "style", "template"})
+
+# whitespace within these is kept as-is
+PRESERVE_WHITESPACE = frozenset({"pre", "textarea"})
+
+# text directly within these is written out as-is
+CDATA_ELEMENTS = frozenset({"script", "style"})
+
+ASCII_WHITESPACE = " \t\n\f\r"
+
+# attributes that hold a space-separated list
+LIST_ATTRIBUTES = frozenset(
+    {"accept-charset", "accesskey", "class", "dropzone", "headers", "rel", "rev"}
+)
+
+
+class Hidden(str):
+    """
+    Text that isn't part of an element's text (e.g., scripts)
+    """
+
+
+class Markup(str):
+    """
+    Something that isn't text (e.g., a comment), already serialized
+    """
+
+
+class CData(Markup):
+    """
+    A CDATA section, which is part of an element's text
+    """
+
+    text = ""
+
+
+class Element:
+    """
+    An element within an h-entry
+    """
+
+    __slots__ = ("name", "attributes", "classes", "children")
+
+    def __init__(self, name: str, attributes: dict[str, str]):
+        self.name = name
+        self.attributes = attributes
+        self.classes = attributes.get("class", "").split()
+        self.children: list[Union[Element, str]] = []
+
+    def find(self, class_name: str, name: Optional[str] = None) -> Optional["Element"]:
+        """
+        Find the first element within this one with a class (and
+        optionally, a specific tag name)
+        """
+        for element in self.descendants():
+            if class_name in element.classes and name in (None, element.name):
+                return element
+
+        return None
+
+    def descendants(self) -> Iterator["Element"]:
+        """
+        Every element within this one, in document order
+        """
+        for child in self.children:
+            if isinstance(child, Element):
+                yield child
+                yield from child.descendants()
+
+    @property
+    def text(self) -> str:
+        """
+        All the text within this element (not including comments,
+        scripts, and the like)
+        """
+        return "".join(self._strings())
+
+    def _strings(self) -> Iterator[str]:
+        for child in self.children:
+            if isinstance(child, Element):
+                yield from child._strings()
+            elif isinstance(child, CData):
+                yield child.text
+            elif not isinstance(child, (Hidden, Markup)):
+                yield child
+
+    def __str__(self) -> str:
+        parts: list[str] = []
+        self._serialize(parts)
+        return "".join(parts)
+
+    def _serialize(self, parts: list[str]):
+        parts.append(f"<{self.name}")
+        for key, value in sorted(self.attributes.items()):
+            if key in LIST_ATTRIBUTES:
+                value = " ".join(value.split())
+            parts.append(f" {key}={_quote(_escape(value))}")
+
+        if self.name in VOID_ELEMENTS and not self.children:
+            parts.append("/>")
+            return
+
+        parts.append(">")
+
+        for child in self.children:
+            if isinstance(child, Element):
+                child._serialize(parts)
+            elif isinstance(child, Markup) or self.name in CDATA_ELEMENTS:
+                parts.append(child)
+            else:
+                parts.append(_escape(child))
+
+        parts.append(f"</{self.name}>")
+
+
+class EntryParser(HTMLParser):
+    """
+    Collect every h-entry in a page (in document order, including
+    entries within entries). Anything outside of an entry is skipped.
+
+    Elements are nested, text is decoded, whitespace is collapsed, and
+    entries are serialized the same way BeautifulSoup's html.parser
+    builder would so entries are unchanged from when they were parsed
+    with it.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.entries: list[Element] = []
+
+        # every open element: its name, whether its text is hidden,
+        # whether its whitespace is preserved, and the element if it's
+        # part of an entry
+        self._open: list[tuple[str, bool, bool, Optional[Element]]] = []
+
+        # text is collected until the next tag so it can be checked as
+        # a whole
+        self._text: list[str] = []
+
+        # void elements that weren't written as self-closing. a closing
+        # tag for one of these is skipped entirely
+        self._closed: list[str] = []
+
+    @property
+    def _current(self) -> Optional[Element]:
+        return self._open[-1][3] if self._open else None
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        self._start(tag, attrs)
+
+        if tag in VOID_ELEMENTS:
+            self._closed.append(tag)
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        self._start(tag, attrs)
+        self._end(tag)
+
+    def handle_endtag(self, tag: str):
+        if tag in self._closed:
+            self._closed.remove(tag)
+        else:
+            self._end(tag)
+
+    def _start(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        self._flush()
+
+        attributes = {key: value or "" for key, value in attrs}
+        parent = self._current
+
+        element = None
+        if parent is not None or "h-entry" in attributes.get("class", "").split():
+            element = Element(tag, attributes)
+
+            if parent is not None:
+                parent.children.append(element)
+
+            if "h-entry" in element.classes:
+                self.entries.append(element)
+
+        if tag not in VOID_ELEMENTS:
+            if self._open:
+                _, hidden, preserve, _ = self._open[-1]
+            else:
+                hidden = preserve = False
+
+            self._open.append(
+                (
+                    tag,
+                    hidden or tag in STRING_CONTAINERS,
+                    preserve or tag in PRESERVE_WHITESPACE,
+                    element,
+                )
+            )
+
+    def _end(self, tag: str):
+        self._flush()
+
+        # close everything back to the most recent matching element.
+        # closing tags that don't match anything are ignored
+        for index in range(len(self._open) - 1, -1, -1):
+            if self._open[index][0] == tag:
+                del self._open[index:]
+                break
+
+    def handle_data(self, data: str):
+        if self._current is not None:
+            self._text.append(data)
+
+    def handle_entityref(self, name: str):
+        self.handle_data(html5.get(f"{name};", f"&{name}"))
+
+    def handle_charref(self, name: str):
+        self.handle_data(unescape(f"&#{name};"))
+
+    def handle_comment(self, data: str):
+        self._add_markup(Markup(f"<!--{data}-->"))
+
+    def handle_decl(self, decl: str):
+        decl = decl.removeprefix("DOCTYPE ")
+        self._add_markup(Markup(f"<!DOCTYPE {decl}>\n"))
+
+    def handle_pi(self, data: str):
+        self._add_markup(Markup(f"<?{data}>"))
+
+    def unknown_decl(self, data: str):
+        if data.upper().startswith("CDATA["):
+            text = data[6:]
+            cdata = CData(f"<![CDATA[{text}]]>")
+            cdata.text = text
+            self._add_markup(cdata)
+        else:
+            self._add_markup(Markup(f"<?{data}?>"))
+
+    def _add_markup(self, markup: Markup):
+        self._flush()
+
+        parent = self._current
+        if parent is not None:
+            parent.children.append(markup)
+
+    def _flush(self):
+        if not self._text:
+            return
+
+        text = "".join(self._text)
+        self._text = []
+
+        parent = self._current
+        if parent is None:
+            return
+
+        _, hidden, preserve, _ = self._open[-1]
+
+        # whitespace between elements is reduced to one character
+        if not preserve and not text.strip(ASCII_WHITESPACE):
+            text = "\n" if "\n" in text else " "
+
+        parent.children.append(Hidden(text) if hidden else text)
+
+
+def find_entries(text: str) -> list[Element]:
+    """
+    Find every h-entry in a page
+    """
+    parser = EntryParser()
+    parser.feed(text)
+    parser.close()
+
+    return parser.entries
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _quote(value: str) -> str:
+    if '"' in value:
+        if "'" in value:
+            escaped = value.replace('"', "&quot;")
+            return f'"{escaped}"'
+
+        return f"'{value}'"
+
+    return f'"{value}"'
@@ -0,0 +1,397 @@
+"""
+Resize update images into smaller, modern formats (if Pillow is
+installed)
+"""
+
+import json
+import logging
+import re
+from dataclasses import dataclass
+from enum import Enum
+from hashlib import sha256
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from beocijies.publish import fingerprint, write_file
+
+LOGGER = logging.getLogger("beocijies")
+
+# bump this whenever processing changes so cached images are remade
+PROCESSING_VERSION = 1
+
+DEFAULT_WIDTHS = (480, 960, 1920)
+
+
+class ImageFormat(Enum):
+    """
+    Formats resized images are saved in. Browsers use the first format
+    they support, so these are from smallest to most compatible.
+    """
+
+    AVIF = "avif"
+    WEBP = "webp"
+    JPEG = "jpeg"
+
+    @property
+    def suffix(self) -> str:
+        if self == ImageFormat.JPEG:
+            return ".jpg"
+
+        return f".{self.value}"
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.value}"
+
+    @property
+    def available(self) -> bool:
+        # Pillow is slow to import, so it's only imported once it's needed
+        try:
+            from PIL import features
+        except ImportError:
+            return False
+
+        if self == ImageFormat.JPEG:
+            return True
+
+        return bool(features.check(self.value))
+
+    @property
+    def options(self) -> dict[str, Any]:
+        if self == ImageFormat.JPEG:
+            return {"quality": 80, "optimize": True, "progressive": True}
+
+        if self == ImageFormat.WEBP:
+            return {"quality": 75, "method": 6}
+
+        return {"quality": 60}
+
+
+@dataclass(frozen=True)
+class Variant:
+    """
+    One resized copy of an image
+    """
+
+    format: ImageFormat
+    width: int
+    height: int
+
+    def name(self, stem: str) -> str:
+        """
+        What to call this copy on the site
+        """
+        return f"{stem}-{self.width}w{self.format.suffix}"
+
+
+@dataclass
+class ProcessedImage:
+    key: str
+    width: int
+    height: int
+    variants: list[Variant]
+
+    def name(self, variant: Variant, stem: str, fingerprinted: bool = False) -> str:
+        """
+        What to call a resized copy on the site
+
+        fingerprinted: Include the image's cache key in the name
+        """
+        name = variant.name(stem)
+
+        if fingerprinted:
+            name = fingerprint(name, self.key)
+
+        return name
+
+    def context(self, stem: str, fingerprinted: bool = False) -> dict[str, Any]:
+        """
+        Template arguments for showing this image. latest_image is the
+        largest JPEG (for browsers that don't understand srcset),
+        latest_image_srcset lists every JPEG, and latest_image_sources
+        lists the srcset for each other format (for <picture> tags).
+        """
+        srcsets: dict[ImageFormat, str] = {}
+        for image_format in ImageFormat:
+            variants = [
+                variant for variant in self.variants if variant.format == image_format
+            ]
+            if variants:
+                srcsets[image_format] = ", ".join(
+                    f"{self.name(variant, stem, fingerprinted)} {variant.width}w"
+                    for variant in variants
+                )
+
+        largest = max(
+            (
+                variant
+                for variant in self.variants
+                if variant.format == ImageFormat.JPEG
+            ),
+            key=lambda variant: variant.width,
+        )
+
+        return {
+            "latest_image": self.name(largest, stem, fingerprinted),
+            "latest_image_srcset": srcsets.pop(ImageFormat.JPEG),
+            "latest_image_sources": [
+                {"type": image_format.mime_type, "srcset": srcset}
+                for image_format, srcset in srcsets.items()
+            ],
+        }
+
+
+@dataclass(frozen=True)
+class ImageProcessor:
+    """
+    Resize images, keeping the results in a content-addressed cache so
+    each image is only ever processed once.
+
+    cache: Where to keep processed images
+    widths: The widths to resize images to. Images are never enlarged.
+    formats: What formats to save (JPEG is always included)
+    """
+
+    cache: Path
+    widths: tuple[int, ...] = DEFAULT_WIDTHS
+    formats: tuple[ImageFormat, ...] = (ImageFormat.AVIF, ImageFormat.WEBP)
+
+    def key(self, digest: str) -> str:
+        """
+        Where an image (and these settings) live in the cache
+
+        digest: The SHA-256 digest of the original image
+        """
+        settings = json.dumps(
+            [
+                PROCESSING_VERSION,
+                digest,
+                sorted(self.widths),
+                sorted(image_format.value for image_format in self.formats),
+            ]
+        )
+
+        return sha256(settings.encode("utf-8")).hexdigest()
+
+    def path(self, key: str, variant: Variant) -> Path:
+        """
+        Where a processed copy of an image is cached
+        """
+        return self.cache / key[:2] / f"{key}-{variant.width}w{variant.format.suffix}"
+
+    def cached(self, key: str) -> Optional[dict[str, Any]]:
+        """
+        The cached results of processing an image (if it has been)
+        """
+        try:
+            with (self.cache / key[:2] / f"{key}.json").open("r") as stream:
+                return json.load(stream)
+        except FileNotFoundError:
+            return None
+
+    def process(self, source: Path, digest: str) -> Optional[ProcessedImage]:
+        """
+        Get the resized copies of an image, processing it if it hasn't
+        been already. Returns None if the image can't be processed.
+        """
+        key = self.key(digest)
+        results = self.cached(key)
+
+        if results is None:
+            LOGGER.info("resizing %s", source)
+            error = self._process(source, key)
+
+            if error:
+                LOGGER.warning("couldn't resize %s: %s", source, error)
+
+            results = self.cached(key)
+            assert results is not None
+
+        if results.get("error"):
+            return None
+
+        return ProcessedImage(
+            key,
+            results["width"],
+            results["height"],
+            [
+                Variant(ImageFormat(image_format), width, height)
+                for image_format, width, height in results["variants"]
+            ],
+        )
+
+    def prune(self, digests: Iterable[str]) -> int:
+        """
+        Remove cached images that aren't copies of any of these
+        originals (e.g., images that were replaced or deleted, or that
+        were processed with other settings). Returns how many images
+        were removed.
+
+        digests: The SHA-256 digests of the originals to keep
+        """
+        if not self.cache.is_dir():
+            return 0
+
+        keep = {self.key(digest) for digest in digests}
+
+        removed = set()
+        for directory in self.cache.iterdir():
+            if not directory.is_dir():
+                continue
+
+            for path in directory.iterdir():
+                # e.g., KEY.json, KEY-480w.avif (skipping temporary files)
+                key = path.name.split("-", 1)[0].split(".", 1)[0]
+                if key and key not in keep:
+                    LOGGER.debug("removing cached image %s", path)
+                    path.unlink()
+                    removed.add(key)
+
+            if not any(directory.iterdir()):
+                directory.rmdir()
+
+        if removed:
+            LOGGER.info("removed %d unused images from the cache", len(removed))
+
+        return len(removed)
+
+    def process_all(self, images: Iterable[tuple[Path, str]], jobs: int = 1):
+        """
+        Process any images that aren't cached, in parallel.
+
+        images: (path, SHA-256 digest) pairs
+        jobs: How many processes to resize images with
+        """
+        missing = {}
+        for source, digest in images:
+            key = self.key(digest)
+            if key not in missing and self.cached(key) is None:
+                missing[key] = source
+
+        if not missing:
+            return
+
+        LOGGER.info("resizing %d images", len(missing))
+
+        if jobs > 1 and len(missing) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(min(jobs, len(missing))) as pool:
+                errors = list(pool.map(self._process, missing.values(), missing.keys()))
+        else:
+            errors = [self._process(source, key) for key, source in missing.items()]
+
+        for source, error in zip(missing.values(), errors):
+            if error:
+                LOGGER.warning("couldn't resize %s: %s", source, error)
+
+    def _process(self, source: Path, key: str) -> Optional[str]:
+        """
+        Resize an image into the cache, returning an error message if
+        it couldn't be. Errors are cached too so broken images aren't
+        retried until they change.
+        """
+        index = self.cache / key[:2] / f"{key}.json"
+        index.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            results = self._resize(source, key)
+        except Exception as exception:
+            write_file(index, json.dumps({"error": str(exception)}))
+            return str(exception)
+
+        # written last so a cached image is always complete
+        write_file(index, json.dumps(results))
+
+        return None
+
+    def _resize(self, source: Path, key: str) -> dict[str, Any]:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            raise RuntimeError("Pillow isn't installed")
+
+        with Image.open(source) as original:
+            icc_profile = original.info.get("icc_profile")
+
+            # phones store rotation as metadata, which is about to be
+            # stripped along with everything else
+            image = ImageOps.exif_transpose(original)
+
+        if image.mode not in ("RGB", "RGBA"):
+            if "transparency" in image.info or image.mode.endswith("A"):
+                image = image.convert("RGBA")
+            else:
+                image = image.convert("RGB")
+
+        width, height = image.size
+
+        widths = sorted({size for size in self.widths if size < width})
+        widths.append(min(width, max(self.widths)))
+
+        formats = [
+            image_format
+            for image_format in ImageFormat
+            if image_format == ImageFormat.JPEG
+            or (image_format in self.formats and image_format.available)
+        ]
+
+        variants = []
+        for resized_width in sorted(set(widths)):
+            resized_height = max(round(height * resized_width / width), 1)
+            resized = image.resize(
+                (resized_width, resized_height), Image.Resampling.LANCZOS
+            )
+
+            for image_format in formats:
+                variant = Variant(image_format, resized_width, resized_height)
+
+                converted = resized
+                if image_format == ImageFormat.JPEG and resized.mode != "RGB":
+                    converted = resized.convert("RGB")
+
+                # nothing from the original is kept other than the
+                # colour profile (no exif, gps, etc.)
+                stream = BytesIO()
+                options = dict(image_format.options)
+                if icc_profile:
+                    options["icc_profile"] = icc_profile
+                converted.save(stream, image_format.value.upper(), **options)
+
+                write_file(self.path(key, variant), stream.getvalue())
+                variants.append([variant.format.value, variant.width, variant.height])
+
+        return {"width": width, "height": height, "variants": variants}
+
+
+def latest_update(directory: Path) -> Optional[Path]:
+    """
+    Find the newest update image in a directory
+    """
+    latest = None
+    latest_number = -1
+
+    if not directory.is_dir():
+        return None
+
+    for path in directory.iterdir():
+        if path.is_file():
+            number = update_number(path)
+            if number is not None and number > latest_number:
+                latest = path
+                latest_number = number
+
+    return latest
+
+
+def update_number(path: Path) -> Optional[int]:
+    """
+    Get the number of an update image (or None if it isn't one)
+    """
+    match = re.search(r"^update-(\d+)$", path.stem)
+
+    if match:
+        return int(match.group(1))
+
+    return None
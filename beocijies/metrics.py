@@ -0,0 +1,336 @@
+"""
+Metrics for keeping an eye on long-running (live) renders, in
+Prometheus' text format
+"""
+
+import logging
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from threading import Lock, Thread
+from time import time
+from typing import Any, Optional
+
+from beocijies.publish import write_file
+
+LOGGER = logging.getLogger("beocijies")
+
+# the address metrics are served on (they're not meant to be public)
+METRICS_ADDRESS = "127.0.0.1"
+
+# how often (in seconds) idle live renders should update their
+# heartbeat, so a render that's stuck can be told apart from one that
+# has nothing to do
+HEARTBEAT_INTERVAL = 60
+
+# in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class MetricType(Enum):
+    COUNTER = "counter"
+    GAUGE = "gauge"
+    HISTOGRAM = "histogram"
+
+
+@dataclass(frozen=True)
+class Metric:
+    """
+    Something to measure
+
+    name: The name Prometheus will know it by
+    type: What kind of metric it is
+    description: What it measures
+    buckets: The upper bounds of a histogram's buckets
+    labels: The labels values are split by
+    """
+
+    name: str
+    type: MetricType
+    description: str
+    buckets: tuple[float, ...] = ()
+    labels: tuple[str, ...] = ()
+
+
+RENDERS = Metric(
+    "beocijies_renders_total",
+    MetricType.COUNTER,
+    "Passes the renderer has made over changed pages",
+)
+RENDER_DURATION = Metric(
+    "beocijies_render_duration_seconds",
+    MetricType.HISTOGRAM,
+    "How long it took to render changes once they were noticed",
+    DURATION_BUCKETS,
+)
+SCAN_DURATION = Metric(
+    "beocijies_scan_duration_seconds",
+    MetricType.HISTOGRAM,
+    "How long it took to work out which pages changes affected",
+    DURATION_BUCKETS,
+)
+PAGES_RENDERED = Metric(
+    "beocijies_pages_rendered_total",
+    MetricType.COUNTER,
+    "Pages that were rendered because they changed",
+    labels=("user",),
+)
+PAGE_FAILURES = Metric(
+    "beocijies_page_failures_total",
+    MetricType.COUNTER,
+    "Attempts to render a page that failed",
+    labels=("user",),
+)
+BROKEN_PAGES = Metric(
+    "beocijies_broken_pages",
+    MetricType.GAUGE,
+    "Pages that failed the last time they were rendered",
+)
+FILES_COPIED = Metric(
+    "beocijies_files_copied_total",
+    MetricType.COUNTER,
+    "Static files published to the site",
+)
+BYTES_PUBLISHED = Metric(
+    "beocijies_bytes_published_total",
+    MetricType.COUNTER,
+    "Bytes of pages and static files published to the site",
+)
+LAST_RENDER = Metric(
+    "beocijies_last_render_timestamp_seconds",
+    MetricType.GAUGE,
+    "When the renderer last finished rendering changes",
+)
+HEARTBEAT = Metric(
+    "beocijies_heartbeat_timestamp_seconds",
+    MetricType.GAUGE,
+    "When the renderer last checked in (at least every minute while live)",
+)
+
+METRICS = (
+    RENDERS,
+    RENDER_DURATION,
+    SCAN_DURATION,
+    PAGES_RENDERED,
+    PAGE_FAILURES,
+    BROKEN_PAGES,
+    FILES_COPIED,
+    BYTES_PUBLISHED,
+    LAST_RENDER,
+    HEARTBEAT,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+@dataclass
+class Histogram:
+    """
+    Observations sorted into buckets (not cumulative, unlike how
+    they're exported)
+    """
+
+    buckets: list[int]
+    sum: float = 0.0
+    count: int = 0
+
+
+@dataclass
+class Metrics:
+    """
+    The current value of every metric. Metrics can be written to a file
+    (e.g., for node_exporter's textfile collector) and/or served over
+    HTTP on localhost.
+
+    path: Where to write metrics to
+    port: The port to serve metrics on
+    """
+
+    path: Optional[Path] = None
+    port: Optional[int] = None
+    values: dict[tuple[Metric, Labels], float] = field(default_factory=dict)
+    histograms: dict[tuple[Metric, Labels], Histogram] = field(default_factory=dict)
+    _lock: Lock = field(default_factory=Lock, repr=False)
+    _server: Any = field(default=None, repr=False)
+
+    def increment(self, metric: Metric, amount: float = 1, **labels: str):
+        assert metric.type == MetricType.COUNTER
+        assert set(labels) == set(metric.labels)
+        key = (metric, _labels(labels))
+
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, metric: Metric, value: float, **labels: str):
+        """
+        Set a gauge (or a counter being tracked elsewhere)
+        """
+        assert metric.type != MetricType.HISTOGRAM
+        assert set(labels) == set(metric.labels)
+
+        with self._lock:
+            self.values[(metric, _labels(labels))] = value
+
+    def observe(self, metric: Metric, value: float, **labels: str):
+        assert metric.type == MetricType.HISTOGRAM
+        assert set(labels) == set(metric.labels)
+        key = (metric, _labels(labels))
+
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(
+                    [0] * (len(metric.buckets) + 1)
+                )
+
+            for index, bound in enumerate(metric.buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(metric.buckets)
+
+            histogram.buckets[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def heartbeat(self):
+        """
+        Note that the renderer is still alive (and write out metrics)
+        """
+        self.set(HEARTBEAT, time())
+        self.write()
+
+    def text(self) -> str:
+        """
+        Every metric in Prometheus' text format
+        """
+        lines = []
+        with self._lock:
+            for metric in METRICS:
+                lines.append(f"# HELP {metric.name} {metric.description}")
+                lines.append(f"# TYPE {metric.name} {metric.type.value}")
+
+                if metric.type == MetricType.HISTOGRAM:
+                    lines.extend(self._histogram_lines(metric))
+                    continue
+
+                samples = sorted(
+                    (labels, value)
+                    for (other, labels), value in self.values.items()
+                    if other == metric
+                )
+
+                # unlabelled counters start at 0
+                counter = metric.type == MetricType.COUNTER
+                if counter and not (samples or metric.labels):
+                    samples = [((), 0)]
+
+                for labels, value in samples:
+                    lines.append(
+                        f"{metric.name}{_format_labels(labels)} {_format(value)}"
+                    )
+
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(self, metric: Metric) -> list[str]:
+        lines = []
+        for (other, labels), histogram in sorted(
+            self.histograms.items(), key=lambda item: item[0][1]
+        ):
+            if other != metric:
+                continue
+
+            total = 0
+            for bound, amount in zip(
+                (*(_format(bound) for bound in metric.buckets), "+Inf"),
+                histogram.buckets,
+            ):
+                total += amount
+                bucket = _format_labels((*labels, ("le", bound)))
+                lines.append(f"{metric.name}_bucket{bucket} {total}")
+
+            lines.append(
+                f"{metric.name}_sum{_format_labels(labels)} {_format(histogram.sum)}"
+            )
+            lines.append(f"{metric.name}_count{_format_labels(labels)} {total}")
+
+        return lines
+
+    def write(self):
+        """
+        Write metrics to a file (if a path was supplied)
+        """
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_file(self.path, self.text())
+
+    def serve(self):
+        """
+        Start serving metrics in the background (if a port was supplied)
+        """
+        if self.port is None or self._server is not None:
+            return
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+
+                body = metrics.text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                LOGGER.debug("metrics: " + format, *args)
+
+        self._server = ThreadingHTTPServer((METRICS_ADDRESS, self.port), MetricsHandler)
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, daemon=True).start()
+
+        LOGGER.info(
+            "serving metrics at http://%s:%d/metrics",
+            METRICS_ADDRESS,
+            self._server.server_address[1],
+        )
+
+    def close(self):
+        """
+        Write metrics one last time and stop serving them
+        """
+        self.write()
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
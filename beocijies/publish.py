@@ -0,0 +1,405 @@
+"""
+Publish rendered files without ever exposing half-written files
+"""
+
+import errno
+import gzip
+import logging
+import os
+from datetime import datetime
+from enum import Enum
+from pathlib import Path, PurePosixPath
+from shutil import copy2, copystat, move, rmtree
+from threading import Thread
+from typing import Callable, Iterable, Optional, Union
+from uuid import uuid4
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None  # type: ignore
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+LOGGER = logging.getLogger("beocijies")
+
+# from <linux/fs.h>
+FICLONE = 0x40049409
+
+DEFAULT_GENERATIONS = 3
+
+FINGERPRINT_LENGTH = 12
+
+# matches fingerprinted names (for web server configuration)
+FINGERPRINT_PATTERN = rf"\.[0-9a-f]{{{FINGERPRINT_LENGTH}}}(\.[A-Za-z0-9]+)?$"
+
+# static files worth precompressing
+TEXT_SUFFIXES = {
+    ".css",
+    ".csv",
+    ".htm",
+    ".html",
+    ".ics",
+    ".js",
+    ".json",
+    ".md",
+    ".mjs",
+    ".svg",
+    ".txt",
+    ".xml",
+}
+
+
+class Compression(Enum):
+    """
+    Precompressed copies of text files that web servers can send as-is
+    instead of compressing files on every request
+    """
+
+    GZIP = "gzip"
+    BROTLI = "br"
+
+    @property
+    def suffix(self) -> str:
+        if self == Compression.GZIP:
+            return ".gz"
+
+        return ".br"
+
+    @property
+    def available(self) -> bool:
+        return self == Compression.GZIP or brotli is not None
+
+    def compress(self, data: bytes) -> bytes:
+        if self == Compression.GZIP:
+            # no timestamp so the same file always compresses the same
+            return gzip.compress(data, compresslevel=9, mtime=0)
+
+        return brotli.compress(data, quality=11)
+
+
+DEFAULT_COMPRESSION = (Compression.GZIP,)
+
+
+def fingerprint(name: str, digest: str) -> str:
+    """
+    Add (part of) a file's digest to its name so that the name only
+    ever refers to one version of the file and browsers can cache it
+    forever (e.g., fonts/comic.ttf -> fonts/comic.0123456789ab.ttf).
+
+    name: A (relative) path
+    digest: The hex digest of the file's contents
+    """
+    path = PurePosixPath(name)
+
+    return str(
+        path.with_name(f"{path.stem}.{digest[:FINGERPRINT_LENGTH]}{path.suffix}")
+    )
+
+
+def write_file(
+    path: Path, contents: Union[str, bytes], compress: Iterable[Compression] = ()
+) -> bool:
+    """
+    Atomically write a file. Anyone reading the file will either see
+    the old version or the new version, never a partial file.
+
+    If the file already has these contents, it's left alone (keeping
+    its modification time, so web servers can keep telling browsers
+    their cached copy is still good). Returns whether the file was
+    written.
+
+    compress: Write compressed copies of the file alongside it (e.g.,
+        index.html.gz). These are only regenerated if the contents of
+        the file change (or they're missing).
+    """
+    if isinstance(contents, str):
+        contents = contents.encode("utf-8")
+
+    try:
+        unchanged = (
+            path.stat().st_size == len(contents) and path.read_bytes() == contents
+        )
+    except FileNotFoundError:
+        unchanged = False
+
+    if unchanged:
+        write_sidecars(path, contents, compress, replace=False)
+        return False
+
+    temporary = _temporary_path(path)
+
+    # unlike tempfile, this respects the umask so the web server can
+    # still read the file
+    descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(descriptor, "wb") as stream:
+            stream.write(contents)
+
+        os.replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+    write_sidecars(path, contents, compress)
+
+    return True
+
+
+def write_sidecars(
+    path: Path,
+    contents: bytes,
+    compress: Iterable[Compression],
+    *,
+    replace: bool = True,
+):
+    """
+    Write compressed copies of a file alongside it.
+
+    replace: Whether to replace existing compressed copies
+    """
+    for compression in compress:
+        sidecar = path.with_name(f"{path.name}{compression.suffix}")
+
+        if not replace and sidecar.exists():
+            continue
+
+        compressed = compression.compress(contents)
+
+        if len(compressed) < len(contents):
+            write_file(sidecar, compressed)
+        else:
+            # not worth it. the server will serve the original
+            sidecar.unlink(missing_ok=True)
+
+
+class PublishMode(Enum):
+    """
+    How static files are published. Each mode falls back to the next
+    (more expensive) mode when it isn't possible for a file.
+    """
+
+    AUTO = "auto"  # the cheapest option that isn't a hardlink
+    HARDLINK = "hardlink"  # source and destination on the same filesystem
+    REFLINK = "reflink"  # copy-on-write filesystems (e.g., btrfs, xfs)
+    RANGE = "range"  # a kernel-side copy with copy_file_range
+    COPY = "copy"  # a full copy
+
+
+def publish_file(
+    source: Path, target: Path, mode: PublishMode = PublishMode.AUTO
+) -> PublishMode:
+    """
+    Atomically publish a file (and its metadata) with the cheapest
+    strategy allowed, returning the strategy that was used.
+
+    Hardlinked files share their contents (and metadata) with the
+    source, so any edits to the source that don't replace it will show
+    up immediately (half-saved, and without waiting for a render). AUTO
+    never hardlinks, they have to be asked for.
+    """
+    temporary = _temporary_path(target)
+    strategies = list(STRATEGIES)
+    if mode == PublishMode.AUTO:
+        strategies.remove(PublishMode.HARDLINK)
+    else:
+        cheapest = strategies.index(mode)
+        strategies = strategies[cheapest:]
+
+    try:
+        for strategy in strategies:
+            try:
+                STRATEGIES[strategy](source, temporary)
+            except OSError as exception:
+                if strategy == PublishMode.COPY:
+                    raise
+
+                LOGGER.debug("can't %s %s: %s", strategy.value, source, exception)
+                temporary.unlink(missing_ok=True)
+            else:
+                os.replace(temporary, target)
+
+                # renaming a hardlink over another link to the same file
+                # does nothing (leaving the temporary link behind)
+                temporary.unlink(missing_ok=True)
+
+                return strategy
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+    raise AssertionError("copying should never be skipped")
+
+
+def _hardlink(source: Path, target: Path):
+    os.link(source, target)
+
+
+def _reflink(source: Path, target: Path):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflinks not supported")
+
+    with source.open("rb") as source_stream, target.open("xb") as target_stream:
+        fcntl.ioctl(target_stream.fileno(), FICLONE, source_stream.fileno())
+
+    copystat(source, target)
+
+
+def _copy_range(source: Path, target: Path):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOTSUP, "copy_file_range not supported")
+
+    with source.open("rb") as source_stream, target.open("xb") as target_stream:
+        remaining = os.fstat(source_stream.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(
+                source_stream.fileno(), target_stream.fileno(), remaining
+            )
+            if copied == 0:
+                break
+            remaining -= copied
+
+    copystat(source, target)
+
+
+def _copy(source: Path, target: Path):
+    copy2(source, target)
+
+
+# from cheapest to most expensive
+STRATEGIES: dict[PublishMode, Callable[[Path, Path], None]] = {
+    PublishMode.HARDLINK: _hardlink,
+    PublishMode.REFLINK: _reflink,
+    PublishMode.RANGE: _copy_range,
+    PublishMode.COPY: _copy,
+}
+
+
+def _temporary_path(path: Path) -> Path:
+    # in the same directory so the rename is atomic
+    return path.with_name(f".{path.name}.{uuid4().hex}.tmp")
+
+
+def generations_directory(destination: Path) -> Path:
+    """
+    Where complete renders of a destination are stored. The destination
+    itself is a symlink to one of these.
+    """
+    return destination.parent / f".{destination.name}.generations"
+
+
+def start_generation(destination: Path) -> Path:
+    """
+    Create an empty directory to render a new version of the site in
+    """
+    name = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    generation = generations_directory(destination) / name
+    generation.mkdir(parents=True)
+
+    LOGGER.debug("rendering new generation to %s", generation)
+
+    return generation
+
+
+def publish_generation(
+    destination: Path, generation: Path, keep: int = DEFAULT_GENERATIONS
+):
+    """
+    Atomically replace the site at destination with a generation.
+
+    destination: Where the site is served from
+    generation: The new version of the site
+    keep: How many generations (including this one) to keep around for
+        rolling back. Older generations are deleted in the background.
+    """
+    if destination.exists() and not destination.is_symlink():
+        # this only happens the first time, so there's no way around
+        # there being a (very short) moment with no site.
+        LOGGER.warning("moving existing site at %s into a generation", destination)
+        previous = generations_directory(destination) / "0-original"
+        move(str(destination), str(previous))
+
+    LOGGER.info("publishing %s", generation.name)
+    _point(destination, generation)
+
+    prune_generations(destination, keep)
+
+
+def rollback(destination: Path) -> Optional[Path]:
+    """
+    Switch a site back to the generation before the current one,
+    returning the generation rolled back to (if there is one).
+    """
+    if not destination.is_symlink():
+        raise ValueError(f"{destination} was not published as a generation")
+
+    current = destination.resolve()
+    older = [
+        generation
+        for generation in _list_generations(destination)
+        if generation.name < current.name
+    ]
+
+    if not older:
+        LOGGER.error("no older generation to roll back to")
+        return None
+
+    previous = older[-1]
+    LOGGER.info("rolling back to %s", previous.name)
+    _point(destination, previous)
+
+    return previous
+
+
+def prune_generations(destination: Path, keep: int = DEFAULT_GENERATIONS) -> Thread:
+    """
+    Delete all but the current generation and the (keep - 1) before it.
+    Generations newer than the current one were never published (e.g.,
+    the render failed) so they are deleted as well.
+
+    Deletion happens in a background thread, which is returned.
+    """
+    current = destination.resolve()
+    older = [
+        generation
+        for generation in _list_generations(destination)
+        if generation.name < current.name
+    ]
+    start = max(len(older) - keep + 1, 0)
+    kept = {current, *older[start:]}
+
+    old = [
+        generation
+        for generation in _list_generations(destination)
+        if generation not in kept
+    ]
+
+    thread = Thread(target=_delete, args=(old,), name="beocijies-prune")
+    thread.start()
+
+    return thread
+
+
+def _list_generations(destination: Path) -> list[Path]:
+    directory = generations_directory(destination)
+
+    if not directory.is_dir():
+        return []
+
+    return sorted(path.resolve() for path in directory.iterdir() if path.is_dir())
+
+
+def _point(destination: Path, generation: Path):
+    # a relative link keeps working if the parent directory moves
+    temporary = _temporary_path(destination)
+    temporary.symlink_to(os.path.relpath(generation, destination.parent))
+    os.replace(temporary, destination)
+
+
+def _delete(paths: list[Path]):
+    for path in paths:
+        LOGGER.debug("deleting old generation %s", path.name)
+        rmtree(path, ignore_errors=True)
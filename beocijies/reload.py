@@ -0,0 +1,218 @@
+"""
+Tell browsers showing pages that are being edited to reload them, using
+server-sent events
+"""
+
+import asyncio
+import logging
+from threading import Event, Thread
+from typing import Iterable, Optional
+
+LOGGER = logging.getLogger("beocijies")
+
+DEFAULT_RELOAD_PORT = 35729
+
+# the address the reload server listens on (it's only meant for
+# browsers on the computer doing the rendering)
+RELOAD_ADDRESS = "127.0.0.1"
+
+# how often (in seconds) to send something to idle browsers so their
+# connections aren't dropped
+KEEPALIVE_INTERVAL = 15
+
+# added to pages so they reload when they're rerendered
+RELOAD_SNIPPET = """<script>
+new EventSource("{url}/events/{user}").onmessage = function () {{
+    location.reload();
+}};
+</script>
+"""
+
+
+class ReloadServer:
+    """
+    A small server (running in the background) that browsers can listen
+    to for when the page they're showing has been rerendered
+
+    port: The port to listen on. 0 picks any free port.
+    address: The address to listen on
+    """
+
+    def __init__(self, port: int = DEFAULT_RELOAD_PORT, address: str = RELOAD_ADDRESS):
+        self.port = port
+        self.address = address
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._clients: dict[str, set[asyncio.Queue]] = {}
+        self._handlers: set[asyncio.Task] = set()
+        self._started = Event()
+        self._error: Optional[Exception] = None
+        self._thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.address}:{self.port}"
+
+    def start(self):
+        """
+        Start listening (raising an error if that isn't possible)
+        """
+        self._thread = Thread(target=asyncio.run, args=(self._serve(),), daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+        if self._error is not None:
+            raise self._error
+
+        LOGGER.info("pages will reload when they change (using %s)", self.url)
+
+    def reload(self, users: Iterable[str]):
+        """
+        Tell browsers showing these users' pages to reload
+        """
+        users = set(users)
+        if self._loop is not None and users:
+            self._loop.call_soon_threadsafe(self._reload, users)
+
+    def close(self):
+        """
+        Stop listening (disconnecting any browsers)
+        """
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _reload(self, users: set[str]):
+        for user in users:
+            for queue in self._clients.get(user, ()):
+                queue.put_nowait(user)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+
+        try:
+            server = await asyncio.start_server(self._handle, self.address, self.port)
+        except OSError as exception:
+            self._error = exception
+            self._started.set()
+            return
+
+        self.port = server.sockets[0].getsockname()[1]
+        self._started.set()
+
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close()
+
+            # let browsers go (instead of having their connections
+            # cancelled out from under them)
+            for queues in self._clients.values():
+                for queue in queues:
+                    queue.put_nowait(None)
+
+            if self._handlers:
+                await asyncio.wait(self._handlers, timeout=1)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        if task is not None:
+            self._handlers.add(task)
+
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+
+            # the headers don't matter
+            while (await reader.readline()).strip():
+                pass
+
+            if len(request) < 2 or request[0] != "GET":
+                writer.write(_response("405 Method Not Allowed"))
+                return
+
+            prefix, _, user = request[1].split("?")[0].partition("/events/")
+            if prefix or not user:
+                writer.write(_response("404 Not Found"))
+                return
+
+            queue: asyncio.Queue = asyncio.Queue()
+            self._clients.setdefault(user, set()).add(queue)
+
+            try:
+                writer.write(
+                    _response(
+                        "200 OK",
+                        {
+                            "Content-Type": "text/event-stream",
+                            "Cache-Control": "no-cache",
+                        },
+                    )
+                )
+                # tells the browser how long to wait before reconnecting
+                writer.write(b"retry: 1000\n\n")
+                await writer.drain()
+
+                while True:
+                    try:
+                        message = await asyncio.wait_for(
+                            queue.get(), KEEPALIVE_INTERVAL
+                        )
+                    except asyncio.TimeoutError:
+                        writer.write(b": keepalive\n\n")
+                    else:
+                        # the server is stopping
+                        if message is None:
+                            break
+
+                        LOGGER.debug("reloading page for %s", user)
+                        writer.write(b"data: reload\n\n")
+
+                    await writer.drain()
+            finally:
+                self._clients[user].discard(queue)
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
+            if task is not None:
+                self._handlers.discard(task)
+
+
+def _response(status: str, headers: Optional[dict[str, str]] = None) -> bytes:
+    lines = [
+        f"HTTP/1.1 {status}",
+        # pages are often opened straight from the disk
+        "Access-Control-Allow-Origin: *",
+    ]
+
+    if headers is None:
+        lines.extend(("Content-Length: 0", "Connection: close"))
+    else:
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def add_reload_snippet(text: str, url: str, user: str) -> str:
+    """
+    Add the reload script to a page (just before the end of the body,
+    if there is one)
+    """
+    snippet = RELOAD_SNIPPET.format(url=url, user=user)
+
+    end = text.lower().rfind("</body>")
+    if end < 0:
+        return text + snippet
+
+    return text[:end] + snippet + text[end:]
@@ -4,342 +4,2181 @@ Render the beocijies sites
 
 import json
 import logging
+import os
+import pickle
 import re
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
+from hashlib import sha256
+from logging.handlers import QueueHandler
 from pathlib import Path
-from shutil import copy2, rmtree
-from time import sleep
+from queue import SimpleQueue
+from signal import SIG_IGN, SIGINT, signal
+from threading import Condition, Lock, Thread
+from time import monotonic, perf_counter, time
 from typing import Any, Callable, Iterable, Optional, Union
 from xml.etree import ElementTree
 
-from bs4 import BeautifulSoup
-from jinja2 import Environment, FileSystemLoader
-from notifypy import Notify  # type: ignore
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
+    meta,
+)
+
+from beocijies.configure import (
+    CACHE_DIRECTORY,
+    COMPILED_TEMPLATES,
+    DEFAULT_FEED_ENTRIES,
+    FILENAME,
+    MANIFEST_FILENAME,
+    UPDATES_DATABASE,
+    UPDATES_FILENAME,
+    Feed,
+    find_destination,
+)
+from beocijies.entries import find_entries
+from beocijies.images import (
+    DEFAULT_WIDTHS,
+    ImageFormat,
+    ImageProcessor,
+    latest_update,
+    update_number,
+)
+from beocijies.metrics import (
+    BROKEN_PAGES,
+    BYTES_PUBLISHED,
+    FILES_COPIED,
+    HEARTBEAT,
+    HEARTBEAT_INTERVAL,
+    LAST_RENDER,
+    PAGE_FAILURES,
+    PAGES_RENDERED,
+    RENDER_DURATION,
+    RENDERS,
+    SCAN_DURATION,
+    Metrics,
+)
+from beocijies.publish import (
+    DEFAULT_COMPRESSION,
+    DEFAULT_GENERATIONS,
+    FINGERPRINT_PATTERN,
+    TEXT_SUFFIXES,
+    Compression,
+    PublishMode,
+    fingerprint,
+    publish_file,
+    publish_generation,
+    start_generation,
+    write_file,
+    write_sidecars,
+)
+from beocijies.reload import ReloadServer, add_reload_snippet
+from beocijies.timings import (
+    PROFILER_SIZE,
+    Profiler,
+    Timings,
+    count,
+    recording,
+    slowest,
+    timed,
+)
+from beocijies.updates import UpdateStore
+from beocijies.version import __version__
+from beocijies.watch import DEFAULT_DEBOUNCE, PollingWatcher, Scheduler, get_watcher
 
-from beocijies.configure import FILENAME, UPDATES_FILENAME, Feed
+# reminder to self: you can do this from 3.11+
+try:
+    from datetime import UTC  # type: ignore
+except ImportError:
+    from datetime import timedelta, timezone
+
+    UTC = timezone(timedelta(0))
+
+LOGGER = logging.getLogger("beocijies")
+
+POST_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+ATOM_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+RSS_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S %z"
+
+# when empty feeds were last updated
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+# RFC 5005 (Feed Paging and Archiving)
+HISTORY_NAMESPACE = "http://purl.org/syndication/history/1.0"
+
+MANIFEST_VERSION = 1
+
+# how often (in seconds) lazy renderers check whether they've been closed
+CLOSE_INTERVAL = 0.25
+
+# the minimum number of seconds between feed updates during live renders
+FEED_INTERVAL = 5
+
+# template arguments for resized update images
+IMAGE_KEYS = ("latest_image_srcset", "latest_image_sources")
+
+
+class LinkType(Enum):
+    ABSOLUTE = "absolute"
+    RELATIVE = "relative"
+
+
+@dataclass(frozen=True)
+class Stamp:
+    """
+    What a file looked like the last time it was read or written
+    """
+
+    inode: int
+    size: int
+    modified: int  # nanoseconds
+    digest: str
+
+    @classmethod
+    def of(
+        cls,
+        path: Path,
+        digest: Optional[str] = None,
+        *,
+        stat: Optional[os.stat_result] = None,
+    ) -> "Stamp":
+        """
+        Stamp a file. If a digest isn't supplied, the file will be
+        hashed.
+        """
+        if stat is None:
+            stat = path.stat()
+            count("files-stated")
+
+        if digest is None:
+            count("files-hashed")
+            count("bytes-hashed", stat.st_size)
+
+            hasher = sha256()
+            with path.open("rb") as stream:
+                for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+
+        return cls(stat.st_ino, stat.st_size, stat.st_mtime_ns, digest)
+
+    def matches(self, stat: os.stat_result) -> bool:
+        """
+        Check if a file appears to be unchanged (without reading it)
+        """
+        return (self.inode, self.size, self.modified) == (
+            stat.st_ino,
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+
+@dataclass
+class PageInfo:
+    template: Path
+    kwargs: dict[str, Any]
+    number: Optional[int] = None
+    last: dict[Path, Stamp] = field(default_factory=dict)
+    dependencies: set[Path] = field(default_factory=set)
+    context: Optional[str] = None
+    image: Optional[str] = None  # the newest update image
+    assets: dict[str, str] = field(default_factory=dict)  # fingerprinted names
+    timings: Timings = field(default_factory=Timings)
+    written: bool = False  # whether the last update changed any files
+
+
+@dataclass
+class Site:
+    """
+    Everything (other than the page itself) needed to render a page.
+    This needs to be picklable so it can be sent to worker processes.
+    """
+
+    directory: Path
+    destination: Path
+    link_format: str
+    index_link_format: str
+    public_users: set[str]
+    neighbours: dict[str, dict[str, str]]
+    publish: PublishMode = PublishMode.AUTO
+    compress: tuple[Compression, ...] = DEFAULT_COMPRESSION
+    images: Optional[ImageProcessor] = None
+    fingerprint: bool = False
+    reload: Optional[str] = None  # the reload server's URL
+
+    @property
+    def templates(self) -> Path:
+        return self.directory / "templates"
+
+    @property
+    def static(self) -> Path:
+        return self.directory / "static"
+
+    def user_destination(self, user: str) -> Path:
+        """
+        Where a user's page is rendered to
+        """
+        if user == "index":
+            return self.destination
+
+        return self.destination / user
+
+    def get_user(self, user: str) -> Callable[[str, Optional[str]], str]:
+        """
+        Get the function a user's page uses to link to other users
+        """
+
+        def link_user(name: str, site: Optional[str] = None) -> str:
+            text = name
+
+            if site:
+                text = f"{name} ({site})"
+                if site in self.neighbours:
+                    if name in self.neighbours[site]:
+                        text = f"<a href={self.neighbours[site][name]!r}>{text}</a>"
+            elif name in self.public_users:
+                if user == "index":
+                    format_string = self.index_link_format
+                else:
+                    format_string = self.link_format
+
+                text = f"<a href={format_string.format(name)!r}>{name}</a>"
+
+            return text
+
+        return link_user
+
+    def get_asset(self, info: PageInfo) -> Callable[[str], str]:
+        """
+        Get the function a page uses to find the fingerprinted name of
+        one of its static files
+        """
+
+        def asset(path: str) -> str:
+            name = path.removeprefix("./")
+
+            if name in info.assets:
+                return info.assets[name]
+
+            if self.fingerprint:
+                LOGGER.warning("no static file named %s", path)
+
+            return path
+
+        return asset
+
+
+class TemplateGraph:
+    """
+    Track which templates extend/include/import which other templates
+    so that edits to shared templates (e.g., #base.html.jinja2) can be
+    used to figure out which pages need to be rerendered.
+    """
+
+    def __init__(self, environment: Environment, templates: Path):
+        self.environment = environment
+        self.templates = templates
+        self._references: dict[str, tuple[int, set[str]]] = {}
+
+    def references(self, name: str) -> set[str]:
+        """
+        The templates a template directly references. Templates
+        referenced dynamically (e.g., with a variable) can't be found.
+        """
+        path = self.templates / name
+
+        try:
+            modified_time = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return set()
+
+        cached = self._references.get(name)
+        if cached and cached[0] == modified_time:
+            return cached[1]
+
+        try:
+            ast = self.environment.parse(path.read_text())
+        except Exception:
+            # rendering will fail and report this properly
+            LOGGER.debug("couldn't parse template %s", name)
+            references: set[str] = set()
+        else:
+            references = {
+                reference
+                for reference in meta.find_referenced_templates(ast)
+                if reference is not None
+            }
+
+        self._references[name] = (modified_time, references)
+
+        return references
+
+    def dependencies(self, name: str) -> set[Path]:
+        """
+        Every template a template depends on, directly or indirectly.
+        """
+        found: set[str] = set()
+        names = [name]
+        while names:
+            for reference in self.references(names.pop()):
+                if reference not in found and reference != name:
+                    found.add(reference)
+                    names.append(reference)
+
+        return {self.templates / reference for reference in found}
+
+
+# reminder to self: Union -> | as of min 3.10
+def render(
+    directory: Path,
+    *,
+    users: Optional[set[str]] = None,
+    destination: Optional[Union[bool, Path]] = None,
+    link_type: Optional[LinkType] = None,
+    live: bool = False,
+    notify: bool = False,
+    fresh: bool = False,
+    jobs: int = 1,
+    profile: Optional[Path] = None,
+    profiler: Optional[Profiler] = None,
+    metrics_file: Optional[Path] = None,
+    metrics_port: Optional[int] = None,
+    debounce: float = DEFAULT_DEBOUNCE,
+    reload_port: Optional[int] = None,
+):
+    """
+    Render a website
+
+    directory: the directory containing the config file
+    users: Optionally, a list of users to render pages for. If not
+        supplied, all users and the index will be updated.
+    destination: Either, the location to render the site at, True, to
+        use the main destination in the config, or False/None to default
+        to a test destination if it is defined.
+    link_type: Either relative or absolute, or None to default based on
+        whether the site uses subdomains
+    live: Watch for new changes and continue to update as they appear.
+    notify: Send a desktop notification if rendering fails
+    fresh: Rerender the whole site from scratch (removing any extra
+        files). The new site is built separately and then swapped in.
+        If supplied, a user list cannot be supplied
+    jobs: How many processes to render pages with
+    profile: Where to save a JSON report of how long each part of the
+        render took
+    profiler: Also profile the render with cProfile or tracemalloc (and
+        include the results in the report). Only the main process is
+        profiled.
+    metrics_file: Where to write Prometheus metrics for the render (kept
+        up to date during live renders)
+    metrics_port: A port to serve Prometheus metrics on (on localhost)
+    debounce: How long (in seconds) changes need to settle before live
+        renders act on them
+    reload_port: Serve reload events on this port and add a script to
+        pages that reloads them when they're rerendered. Only used for
+        live renders to the test destination.
+    """
+    timings = Timings()
+    pages: dict[str, PageInfo] = {}
+
+    metrics = None
+    if metrics_file or metrics_port is not None:
+        metrics = Metrics(metrics_file, metrics_port)
+        metrics.serve()
+
+    python_profile = None
+    if profiler == Profiler.CPROFILE:
+        import cProfile
+
+        python_profile = cProfile.Profile()
+        python_profile.enable()
+    elif profiler == Profiler.TRACEMALLOC:
+        tracemalloc.start()
+
+    start = perf_counter()
+    try:
+        with recording(timings):
+            _render(
+                directory,
+                pages,
+                users=users,
+                destination=destination,
+                link_type=link_type,
+                live=live,
+                notify=notify,
+                fresh=fresh,
+                jobs=jobs,
+                timings=timings,
+                metrics=metrics,
+                debounce=debounce,
+                reload_port=reload_port,
+            )
+    finally:
+        total = perf_counter() - start
+
+        if metrics:
+            metrics.close()
+
+        if python_profile:
+            python_profile.disable()
+
+        report = _timing_report(timings, pages, total)
+        _summarize(report, logging.INFO if profile else logging.DEBUG)
+
+        if python_profile:
+            report["cprofile"] = _cprofile_report(python_profile)
+
+            if profile:
+                python_profile.dump_stats(profile.with_suffix(".pstats"))
+        elif profiler == Profiler.TRACEMALLOC:
+            report["tracemalloc"] = _tracemalloc_report()
+            tracemalloc.stop()
+
+        if profile:
+            write_file(profile, json.dumps(report, indent=4, sort_keys=True))
+
+
+def _render(
+    directory: Path,
+    pages: dict[str, PageInfo],
+    *,
+    users: Optional[set[str]] = None,
+    destination: Optional[Union[bool, Path]] = None,
+    link_type: Optional[LinkType] = None,
+    live: bool = False,
+    notify: bool = False,
+    fresh: bool = False,
+    jobs: int = 1,
+    timings: Optional[Timings] = None,
+    metrics: Optional[Metrics] = None,
+    debounce: float = DEFAULT_DEBOUNCE,
+    reload_port: Optional[int] = None,
+):
+    """
+    Render a website (see render). The state of each page is added to
+    pages as the site is rendered.
+
+    timings: The timings being recorded for the render (to update
+        metrics from)
+    metrics: Metrics to keep up to date as the site is rendered
+    """
+    with (directory / FILENAME).open("r") as stream:
+        config = json.load(stream)
+
+    destination = find_destination(config, destination)
+
+    # pages shouldn't try to reach a reload server on visitors' computers
+    testing = destination != Path(config["destination"]) and destination == Path(
+        config.get("test-destination", config["destination"])
+    )
+    if reload_port is not None and not (live and testing):
+        LOGGER.warning("pages only reload for live renders to the test destination")
+        reload_port = None
+
+    if not users:
+        users = set({"index", *config["users"]})
+    elif fresh:
+        raise ValueError("Users cannot be supplied if fresh is true")
+
+    templates = directory / "templates"
+    static = directory / "static"
+    site_name = config["name"]
+    generations = config.get("generations", DEFAULT_GENERATIONS)
+
+    # fresh renders are built separately and then swapped in so the
+    # live site is never empty or half-rendered
+    public_destination = destination
+    generation = None
+    if fresh:
+        LOGGER.info("rendering a fresh copy of the site")
+        generation = destination = start_generation(public_destination)
+
+    site = _create_site(directory, config, destination, link_type)
+
+    destination.mkdir(exist_ok=True, parents=True)
+
+    manifest = {} if fresh else _load_manifest(directory, public_destination)
+    files = _load_stamps(manifest.get("files", {}), site)
+
+    with timed("static"):
+        copied = _copy_base_files(site, config, files)
+
+    for user in users:
+        pages[user] = _create_page(site, config, user)
+
+    for user, info in pages.items():
+        if user in manifest.get("pages", {}):
+            _restore_page(info, manifest["pages"][user], site)
+
+    failing_users = set()
+    broken_users = set()
+    updated = set()
+
+    # whether anything in the manifest has changed since it was saved
+    dirty = copied
+
+    feeds = None
+    if Feed(config["users"].get("index", {}).get("feed", "personal")) != Feed.NONE:
+        feeds = Feeds(
+            directory,
+            destination,
+            site_name,
+            _root_url(config),
+            config["users"],
+            site.compress,
+            config.get("feed-entries", DEFAULT_FEED_ENTRIES),
+            config.get("feed-retention"),
+        )
+
+    # live renders keep feeds up to date as pages change
+    refresher = FeedRefresher(feeds) if live and feeds else None
+
+    # pages rendered in this process are handed straight to the feeds
+    # (instead of being read back from the disk)
+    rendered: Optional[dict[str, str]] = {} if feeds else None
+
+    # bursts of changes are coalesced so each page is rendered once the
+    # burst is over (instead of, e.g., on a half-copied image)
+    scheduler = None
+    if live:
+        scheduler = Scheduler(
+            get_watcher((templates, static)),
+            lambda path: _find_changed_users((path,), templates, static, pages),
+            debounce,
+        )
+    pending = set(pages)
+
+    reloader = None
+    if reload_port is not None:
+        reloader = ReloadServer(reload_port)
+        reloader.start()
+        site.reload = reloader.url
+
+    if jobs > 1:
+        LOGGER.debug("rendering with %d processes", jobs)
+        pool: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(
+            jobs,
+            initializer=_start_worker,
+            initargs=(site, LOGGER.getEffectiveLevel(), not live),
+        )
+    else:
+        pool = None
+        environment = _create_environment(site, compiled=not live)
+        graph = TemplateGraph(environment, templates)
+
+    try:
+        started = perf_counter()
+        loop = True
+        while loop:
+            try:
+                if site.images:
+                    with timed("images"):
+                        _prepare_images(site, pages, pending, jobs)
+
+                if pool:
+                    results: Iterable[tuple[str, bool, Optional[Exception]]] = (
+                        _handle_worker_result(pages, *result)
+                        for result in pool.map(
+                            _update_page_in_worker,
+                            [(user, pages[user]) for user in sorted(pending)],
+                        )
+                    )
+                else:
+                    results = (
+                        (
+                            user,
+                            *_try_update_page(
+                                user, pages[user], environment, graph, site, rendered
+                            ),
+                        )
+                        for user in sorted(pending)
+                    )
+
+                changed_users = set()
+                with timed("pages"):
+                    for user, changed, error in results:
+                        if error is not None:
+                            broken_users.add(user)
+
+                            if metrics:
+                                metrics.increment(PAGE_FAILURES, user=user)
+
+                            if user not in failing_users and notify:
+                                failing_users.add(user)
+                                send_notification(f"Building page for {user} failed")
+
+                            if not live:
+                                raise error
+
+                            changed = True
+                        elif changed:
+                            broken_users.discard(user)
+
+                            if user in failing_users and notify:
+                                failing_users.remove(user)
+                                send_notification(f"Page for {user} fixed")
+
+                        if changed:
+                            updated.add(user)
+                            changed_users.add(user)
+                            dirty = True
+
+                            if metrics and error is None:
+                                metrics.increment(PAGES_RENDERED, user=user)
+
+                # pages that rerendered to the same bytes look the same
+                if reloader:
+                    reloader.reload(
+                        user
+                        for user in changed_users - broken_users
+                        if pages[user].written
+                    )
+
+                if refresher and changed_users:
+                    refresher.refresh(
+                        _page_digests(pages, changed_users, site), rendered
+                    )
+
+                if refresher and rendered:
+                    rendered.clear()
+
+                if live and dirty:
+                    with timed("manifest"):
+                        _save_manifest(
+                            directory,
+                            public_destination,
+                            site,
+                            files,
+                            pages,
+                            broken_users,
+                        )
+                    dirty = False
+
+                # live renders need to go live before they finish
+                if live and generation:
+                    with timed("publish"):
+                        publish_generation(public_destination, generation, generations)
+                    generation = None
+
+                if metrics:
+                    _record_pass(
+                        metrics,
+                        timings or Timings(),
+                        pages,
+                        broken_users,
+                        perf_counter() - started,
+                    )
+
+                loop = live
+                if scheduler:
+                    # idle renders check in so they aren't mistaken for
+                    # stuck ones
+                    timeout = HEARTBEAT_INTERVAL if metrics else None
+                    ready = scheduler.wait(timeout)
+                    while metrics and ready == set():
+                        metrics.heartbeat()
+                        ready = scheduler.wait(timeout)
+
+                    started = perf_counter()
+                    pending = set(pages) if ready is None else ready
+
+                    if metrics:
+                        metrics.observe(SCAN_DURATION, scheduler.scan_duration)
+            except KeyboardInterrupt:
+                LOGGER.info("stopping")
+                loop = False
+    finally:
+        # live renders save as they go
+        if dirty or not live:
+            with timed("manifest"):
+                _save_manifest(
+                    directory, public_destination, site, files, pages, broken_users
+                )
+
+        if scheduler:
+            scheduler.close()
+
+        if reloader:
+            reloader.close()
+
+        if pool:
+            pool.shutdown()
+
+        if refresher:
+            refresher.close()
+
+    LOGGER.info(f"updated pages for {', '.join(sorted(updated))}")
+
+    if site.images:
+        _prune_image_cache(directory, site.images)
+
+    if feeds:
+        if not refresher and updated:
+            feeds.refresh(
+                updated,
+                users,
+                {
+                    user: digest
+                    for user, digest in _page_digests(pages, updated, site).items()
+                    if digest is not None
+                },
+                rendered,
+            )
+
+        feeds.close()
+
+    if generation:
+        with timed("publish"):
+            publish_generation(public_destination, generation, generations)
+
+
+class LazyRenderer:
+    """
+    Render pages the first time they're asked for instead of rendering
+    the whole site up front. Pages are kept until their template or
+    static files change. Pages are rendered exactly as render() would
+    render them (but feeds aren't updated).
+
+    directory: the directory containing the config file
+    destination: Either, the location to render the site at, True, to
+        use the main destination in the config, or False/None to default
+        to a test destination if it is defined.
+    link_type: Either relative or absolute, or None to default based on
+        whether the site uses subdomains
+    debounce: How long (in seconds) changes need to settle before pages
+        are rerendered
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        destination: Optional[Union[bool, Path]] = None,
+        link_type: Optional[LinkType] = None,
+        debounce: float = DEFAULT_DEBOUNCE,
+    ):
+        with (directory / FILENAME).open("r") as stream:
+            config = json.load(stream)
+
+        self.directory = directory
+        self.destination = find_destination(config, destination)
+        self.site = _create_site(directory, config, self.destination, link_type)
+        self.destination.mkdir(exist_ok=True, parents=True)
+
+        manifest = _load_manifest(directory, self.destination)
+        self.files = _load_stamps(manifest.get("files", {}), self.site)
+        _copy_base_files(self.site, config, self.files)
+
+        self.pages = {
+            user: _create_page(self.site, config, user)
+            for user in {"index", *config["users"]}
+        }
+        for user, info in self.pages.items():
+            if user in manifest.get("pages", {}):
+                _restore_page(info, manifest["pages"][user], self.site)
+
+        self.environment = _create_environment(self.site, compiled=False)
+        self.graph = TemplateGraph(self.environment, self.site.templates)
+
+        # pages known to be up to date
+        self.current: set[str] = set()
+        self.broken: set[str] = set()
+        self.lock = Lock()
+
+        watcher = get_watcher((self.site.templates, self.site.static))
+
+        # polling watchers only report changes if given a full interval
+        self.timeout = CLOSE_INTERVAL
+        if isinstance(watcher, PollingWatcher):
+            self.timeout = watcher.interval
+
+        self.scheduler = Scheduler(
+            watcher,
+            lambda path: _find_changed_users(
+                (path,), self.site.templates, self.site.static, self.pages
+            ),
+            debounce,
+        )
+        self.closed = False
+        self.thread = Thread(target=self._watch, daemon=True)
+        self.thread.start()
+
+    def ensure(self, user: str) -> bool:
+        """
+        Make sure a user's page is up to date, rendering it if it isn't.
+        Returns whether the user has a page.
+        """
+        info = self.pages.get(user)
+        if info is None:
+            return False
+
+        with self.lock:
+            if user in self.current:
+                return True
+
+            if self.site.images:
+                _prepare_images(self.site, self.pages, {user}, 1)
+
+            _, error = _try_update_page(
+                user, info, self.environment, self.graph, self.site
+            )
+
+            # broken pages are tried again on the next request
+            if error is None:
+                self.broken.discard(user)
+                self.current.add(user)
+            else:
+                self.broken.add(user)
+
+        return True
+
+    def close(self):
+        """
+        Stop watching for changes and save what was rendered
+        """
+        self.closed = True
+        self.thread.join()
+        self.scheduler.close()
+
+        with self.lock:
+            _save_manifest(
+                self.directory,
+                self.destination,
+                self.site,
+                self.files,
+                self.pages,
+                self.broken,
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _watch(self):
+        while not self.closed:
+            changed = self.scheduler.wait(timeout=self.timeout)
+
+            with self.lock:
+                if changed is None:
+                    self.current.clear()
+                else:
+                    self.current -= changed
+
+
+def _root_url(config: dict[str, Any]) -> str:
+    """
+    The URL of a site's main page (without a trailing slash)
+    """
+    if config.get("prefix"):
+        prefix = f"{config['prefix']}."
+    elif config.get("local", False):
+        prefix = ""
+    else:
+        prefix = "www."
+
+    return f"{config['protocol']}://{prefix}{config['domain']}"
+
+
+def _create_site(
+    directory: Path,
+    config: dict[str, Any],
+    destination: Path,
+    link_type: Optional[LinkType] = None,
+) -> Site:
+    """
+    Gather everything (other than the pages themselves) needed to
+    render a site
+
+    directory: the directory containing the config file
+    config: The site's configuration
+    destination: Where pages are being rendered to
+    link_type: Either relative or absolute, or None to default based on
+        whether the site uses subdomains
+    """
+    if link_type is None:
+        if config["subdomains"]:
+            link_type = LinkType.ABSOLUTE
+        else:
+            link_type = LinkType.RELATIVE
+
+    if link_type == LinkType.ABSOLUTE:
+        link_format = index_link_format = f"{_root_url(config)}/{{}}"
+    else:
+        link_format = "../{}/index.html"
+        index_link_format = "./{}/index.html"
+
+    public_users = {
+        user for user, info in config["users"].items() if info.get("public", False)
+    }
+
+    compress = []
+    for value in config.get(
+        "compress", [compression.value for compression in DEFAULT_COMPRESSION]
+    ):
+        compression = Compression(value)
+        if compression.available:
+            compress.append(compression)
+        else:
+            LOGGER.warning("%s compression unavailable", value)
+
+    images = None
+    widths = tuple(config.get("image-widths", DEFAULT_WIDTHS))
+    if widths:
+        if ImageFormat.JPEG.available:
+            images = ImageProcessor(
+                directory / CACHE_DIRECTORY / "images",
+                widths,
+                tuple(
+                    image_format
+                    for image_format in (ImageFormat.AVIF, ImageFormat.WEBP)
+                    if image_format.available
+                ),
+            )
+        else:
+            LOGGER.debug("Pillow not installed, update images won't be resized")
+
+    return Site(
+        directory,
+        destination,
+        link_format,
+        index_link_format,
+        public_users,
+        config["neighbours"],
+        PublishMode(config.get("publish", PublishMode.AUTO.value)),
+        tuple(compress),
+        images,
+        config.get("fingerprint", False),
+    )
+
+
+def _create_page(site: Site, config: dict[str, Any], user: str) -> PageInfo:
+    """
+    Set up a user's page (with everything its template is rendered with)
+    """
+    return PageInfo(
+        site.templates / f"{user}.html.jinja2",
+        {
+            "me": user,
+            "language": config.get("language"),
+            "site_url": config["domain"],
+            "site_name": config["name"],
+            "users": site.public_users,
+            "neighbours": site.neighbours,
+            "has_feed": Feed.NONE
+            != Feed(config["users"].get(user, {}).get("feed", "personal")),
+        },
+    )
+
+
+def _copy_base_files(
+    site: Site, config: dict[str, Any], files: dict[Path, Stamp]
+) -> bool:
+    """
+    Copy any files in the root of the static directory and write the
+    list of public users. Returns whether any files were copied.
+    """
+    copied = False
+    for path in site.static.iterdir():
+        if path.is_file():
+            if _copy_if_changed(path, site.destination / path.name, files, site):
+                copied = True
+
+    write_file(
+        site.destination / "users.json",
+        json.dumps(
+            {user: f"{_root_url(config)}/{user}" for user in site.public_users},
+            indent=4,
+            sort_keys=True,
+        ),
+        site.compress,
+    )
+
+    return copied
+
+
+def _record_pass(
+    metrics: Metrics,
+    timings: Timings,
+    pages: dict[str, PageInfo],
+    broken_users: set[str],
+    duration: float,
+):
+    """
+    Update metrics after a pass over changed pages
+    """
+    counts = _total_counts(timings, pages)
+
+    metrics.increment(RENDERS)
+    metrics.observe(RENDER_DURATION, duration)
+    metrics.set(BROKEN_PAGES, len(broken_users))
+    metrics.set(FILES_COPIED, counts.get("files-copied", 0))
+    metrics.set(
+        BYTES_PUBLISHED,
+        counts.get("bytes-copied", 0) + counts.get("bytes-written", 0),
+    )
+
+    now = time()
+    metrics.set(LAST_RENDER, now)
+    metrics.set(HEARTBEAT, now)
+    metrics.write()
+
+
+def _total_counts(timings: Timings, pages: dict[str, PageInfo]) -> dict[str, int]:
+    """
+    Combine the counts for a render and each page
+    """
+    counts = Timings(counts=dict(timings.counts))
+    for info in pages.values():
+        counts.add(Timings(counts=info.timings.counts))
+
+    return counts.counts
+
+
+def _timing_report(
+    timings: Timings, pages: dict[str, PageInfo], total: float
+) -> dict[str, Any]:
+    """
+    Combine the timings for a render (and each page) into a report
+    """
+    templates: dict[str, float] = {}
+    for info in pages.values():
+        name = info.template.name
+        templates[name] = templates.get(name, 0.0) + info.timings.times.get(
+            "template", 0.0
+        )
+
+    users = {
+        user: info.timings.times.get("update", 0.0) for user, info in pages.items()
+    }
+
+    return {
+        "version": __version__,
+        "total": total,
+        "phases": timings.times,
+        "counts": _total_counts(timings, pages),
+        "users": {user: info.timings.to_json() for user, info in pages.items()},
+        "templates": templates,
+        "slowest": {
+            "users": [[user, users[user]] for user in slowest(users)],
+            "templates": [[name, templates[name]] for name in slowest(templates)],
+        },
+    }
+
+
+def _summarize(report: dict[str, Any], level: int):
+    LOGGER.log(
+        level,
+        "rendered in %.3fs (%s)",
+        report["total"],
+        ", ".join(
+            f"{phase}: {seconds:.3f}s" for phase, seconds in report["phases"].items()
+        ),
+    )
+
+    for kind in ("users", "templates"):
+        if report["slowest"][kind]:
+            LOGGER.log(
+                level,
+                "slowest %s: %s",
+                kind,
+                ", ".join(
+                    f"{name} ({seconds:.3f}s)"
+                    for name, seconds in report["slowest"][kind]
+                ),
+            )
+
+
+def _cprofile_report(python_profile: Any) -> list[dict[str, Any]]:
+    """
+    The functions that took the longest (including calls they made)
+    """
+    import pstats
+
+    stats = pstats.Stats(python_profile)
+
+    functions = []
+    for function, (_, calls, own, cumulative, _) in stats.stats.items():  # type: ignore
+        filename, line, name = function
+        functions.append(
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "time": own,
+                "cumulative": cumulative,
+            }
+        )
+
+    functions.sort(key=lambda function: function["cumulative"], reverse=True)
+
+    return functions[:PROFILER_SIZE]
+
+
+def _tracemalloc_report() -> dict[str, Any]:
+    """
+    How much memory the render used, and where it was allocated
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+
+    return {
+        "current": current,
+        "peak": peak,
+        "allocations": [
+            {
+                "location": f"{statistic.traceback[0].filename}:"
+                f"{statistic.traceback[0].lineno}",
+                "size": statistic.size,
+                "count": statistic.count,
+            }
+            for statistic in snapshot.statistics("lineno")[:PROFILER_SIZE]
+        ],
+    }
+
+
+def compile_templates(directory: Path) -> Path:
+    """
+    Precompile a site's templates into an archive that renders will
+    load instead of the templates (for as long as none of the templates
+    change). Returns the location of the archive.
+
+    directory: the directory containing the config file
+    """
+    cache = directory / CACHE_DIRECTORY
+    cache.mkdir(parents=True, exist_ok=True)
+    archive = cache / COMPILED_TEMPLATES
+
+    templates = directory / "templates"
+    stamps = _template_stamps(templates)
+
+    environment = Environment(loader=FileSystemLoader(templates))
+    temporary = archive.with_name(f".{archive.name}.tmp")
+    try:
+        environment.compile_templates(
+            temporary,
+            zip="deflated",
+            log_function=LOGGER.debug,
+            ignore_errors=False,
+        )
+        os.replace(temporary, archive)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+    # templates changed while compiling will be caught next render
+    write_file(
+        archive.with_suffix(".json"), json.dumps(stamps, indent=4, sort_keys=True)
+    )
+
+    LOGGER.info("compiled %d templates to %s", len(stamps), archive)
+
+    return archive
+
+
+def _template_stamps(templates: Path) -> dict[str, list[int]]:
+    stamps = {}
+    for path in templates.rglob("*"):
+        if path.is_file():
+            stat = path.stat()
+            stamps[path.relative_to(templates).as_posix()] = [
+                stat.st_size,
+                stat.st_mtime_ns,
+            ]
+
+    return stamps
+
+
+def _compiled_templates(site: Site) -> Optional[Path]:
+    """
+    Find the precompiled templates archive if it matches the templates
+    """
+    archive = site.directory / CACHE_DIRECTORY / COMPILED_TEMPLATES
+
+    try:
+        with archive.with_suffix(".json").open("r") as stream:
+            stamps = json.load(stream)
+    except FileNotFoundError:
+        return None
+
+    if not archive.exists():
+        return None
+
+    if stamps != _template_stamps(site.templates):
+        LOGGER.info("templates changed since they were compiled, ignoring archive")
+        return None
+
+    return archive
+
+
+def _create_environment(site: Site, compiled: bool = True) -> Environment:
+    """
+    Create the environment pages are rendered with. Compiled templates
+    are cached on disk so unchanged templates don't need to be
+    recompiled each render.
+
+    compiled: Use templates precompiled with compile_templates (if they
+        are up to date). Live renders shouldn't, as templates will change.
+    """
+    if compiled:
+        archive = _compiled_templates(site)
+        if archive:
+            LOGGER.debug("using precompiled templates from %s", archive)
+            return Environment(loader=ModuleLoader(archive))
+
+    cache = site.directory / CACHE_DIRECTORY / "jinja"
+    cache.mkdir(parents=True, exist_ok=True)
+
+    return Environment(
+        loader=FileSystemLoader(site.templates),
+        bytecode_cache=FileSystemBytecodeCache(str(cache)),
+    )
+
+
+def _update_page(
+    user: str,
+    info: PageInfo,
+    environment: Environment,
+    graph: TemplateGraph,
+    site: Site,
+    rendered: Optional[dict[str, str]] = None,
+) -> bool:
+    """
+    Copy any new static files for a user and rerender their page if
+    anything has changed. Returns whether anything changed (which
+    doesn't mean any files did: a page can rerender to the same bytes).
+
+    rendered: If supplied, the page is added to this (by user) if it's
+        rerendered
+    """
+    changed = False
+    assets: dict[str, str] = {}
+
+    # everything copied into the site for this page (so fingerprinted
+    # copies of old versions of files can be removed)
+    published: set[Path] = set()
+
+    user_destination = site.user_destination(user)
+    user_static = site.static / user
+    directories = [user_static]
+    while directories:
+        current_directory = directories.pop(0)
+        dest = user_destination / current_directory.relative_to(user_static)
+        dest.mkdir(exist_ok=True, parents=True)
+        for path in current_directory.iterdir():
+            if path.is_dir():
+                directories.append(path)
+            elif path.name.lower() != ".ds_store":  # thanks apple
+                target = user_destination / path.relative_to(user_static)
+                published.add(target)
+                if _copy_if_changed(path, target, info.last, site):
+                    changed = True
+
+                    if current_directory == user_static:
+                        number = update_number(path)
+                        if number is not None:
+                            if info.number is None or number > info.number:
+                                info.number = number
+                                info.image = path.name
+
+                if site.fingerprint:
+                    name = path.relative_to(user_static).as_posix()
+                    assets[name] = fingerprint(name, info.last[path].digest)
+                    target = user_destination / assets[name]
+                    published.add(target)
+                    if _copy_if_changed(path, target, info.last, site):
+                        changed = True
+
+    info.assets = assets
+
+    if info.image:
+        info.kwargs["latest_image"] = assets.get(info.image, info.image)
+
+        if site.images and _publish_image(user, info, site, published):
+            changed = True
+
+    if _remove_old_fingerprints(info, user_destination, published):
+        changed = True
+
+    # so far, everything that changed was a file
+    info.written = changed
+
+    template_changed = False
+
+    stamp = _check_stamp(info.template, info.last)
+    if stamp:
+        info.last[info.template] = stamp
+        info.kwargs["page_date"] = datetime.fromtimestamp(
+            stamp.modified // 1_000_000_000
+        ).strftime("%Y-%m-%d %H:%M:%S")
+        template_changed = True
+
+    # changes to templates this page extends/includes don't change the
+    # page date, but they do need to be rerendered
+    for dependency in info.dependencies:
+        try:
+            stamp = _check_stamp(dependency, info.last)
+        except FileNotFoundError:
+            continue
+
+        if stamp:
+            info.last[dependency] = stamp
+            template_changed = True
+
+    if template_changed:
+        changed = True
+
+        # references may have been added or removed
+        info.dependencies = graph.dependencies(info.template.name)
+        for dependency in info.dependencies:
+            if dependency not in info.last and dependency.exists():
+                info.last[dependency] = Stamp.of(dependency)
+
+    # the page may have been deleted or rendered with other settings
+    page = user_destination / "index.html"
+    context = _context_digest(site, info)
+    if context != info.context or not _is_intact(page, info.last):
+        changed = True
+
+    if changed:
+        template = environment.get_template(info.template.name)
+
+        LOGGER.info("rendering page for %s", user)
+        with timed("template"):
+            text = template.render(
+                user=site.get_user(user), asset=site.get_asset(info), **info.kwargs
+            )
+
+        if site.reload:
+            text = add_reload_snippet(text, site.reload, user)
+
+        contents = text.encode("utf-8")
+        count("pages-rendered")
+        if write_file(page, contents, site.compress):
+            count("bytes-written", len(contents))
+            info.written = True
+
+        info.last[page] = Stamp.of(page, sha256(contents).hexdigest())
+        info.context = context
+
+        if rendered is not None:
+            rendered[user] = text
+
+    return changed
+
+
+def _publish_image(user: str, info: PageInfo, site: Site, published: set[Path]) -> bool:
+    """
+    Publish the resized copies of a user's newest update image, pointing
+    the page at them. Returns whether any copies were published.
+
+    published: The copies are added to this
+    """
+    assert site.images is not None and info.image is not None
+
+    source = site.static / user / info.image
+    stamp = info.last.get(source)
+    if stamp is None:
+        if not source.exists():
+            return False
+
+        stamp = Stamp.of(source)
+
+    processed = site.images.process(source, stamp.digest)
+
+    if processed is None:
+        for key in IMAGE_KEYS:
+            info.kwargs.pop(key, None)
+
+        return False
+
+    changed = False
+    stem = Path(info.image).stem
+    user_destination = site.user_destination(user)
+    for variant in processed.variants:
+        cached = site.images.path(processed.key, variant)
+        target = user_destination / processed.name(variant, stem, site.fingerprint)
+        published.add(target)
+        if _copy_if_changed(cached, target, info.last, site):
+            changed = True
+
+    info.kwargs.update(processed.context(stem, site.fingerprint))
+
+    return changed
+
+
+def _remove_old_fingerprints(
+    info: PageInfo, user_destination: Path, published: set[Path]
+) -> bool:
+    """
+    Remove fingerprinted copies of files that have since changed (or
+    been deleted). Every version of a file gets its own fingerprinted
+    name, so otherwise they'd pile up forever. Returns whether any
+    copies were removed.
+    """
+    old = [
+        path
+        for path in info.last
+        if path.is_relative_to(user_destination)
+        and path not in published
+        and re.search(FINGERPRINT_PATTERN, path.name)
+    ]
+
+    for path in old:
+        LOGGER.info("removing %s", path)
+        path.unlink(missing_ok=True)
+        for compression in Compression:
+            path.with_name(f"{path.name}{compression.suffix}").unlink(missing_ok=True)
+
+        del info.last[path]
+
+    return bool(old)
+
+
+def _prepare_images(site: Site, pages: dict[str, PageInfo], users: set[str], jobs: int):
+    """
+    Resize any new update images ahead of rendering so they can be
+    processed in parallel.
+    """
+    assert site.images is not None
+
+    images = []
+    for user in users:
+        latest = latest_update(site.static / user)
+        if latest is None:
+            continue
+
+        stamp = pages[user].last.get(latest)
+        if stamp is None or not stamp.matches(latest.stat()):
+            stamp = Stamp.of(latest)
+
+        images.append((latest, stamp.digest))
+
+    site.images.process_all(images, jobs)
 
-# reminder to self: you can do this from 3.11+
-try:
-    from datetime import UTC  # type: ignore
-except ImportError:
-    from datetime import timedelta, timezone
 
-    UTC = timezone(timedelta(0))
+def _prune_image_cache(directory: Path, images: ImageProcessor):
+    """
+    Remove resized images from the cache once no page (in any
+    destination) shows them
+    """
+    path = directory / MANIFEST_FILENAME
+    if not path.exists():
+        return
 
-LOGGER = logging.getLogger("beocijies")
+    with path.open("r") as stream:
+        manifest = json.load(stream)
 
-POST_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
-ATOM_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
-RSS_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S %z"
+    if manifest.get("version") != MANIFEST_VERSION:
+        return
 
+    digests = set()
+    for state in manifest["destinations"].values():
+        for user, page in state.get("pages", {}).items():
+            if not page.get("image"):
+                continue
 
-class LinkType(Enum):
-    ABSOLUTE = "absolute"
-    RELATIVE = "relative"
+            source = str(Path("static") / user / page["image"])
+            stamp = page["last"]["inputs"].get(source)
 
+            # without knowing which image it is, nothing can be removed
+            if stamp is None:
+                return
 
-@dataclass
-class PageInfo:
-    template: Path
-    kwargs: dict[str, Any]
-    number: Optional[int] = None
-    last: dict[Path, int] = field(default_factory=dict)
+            digests.add(stamp[3])
 
+    images.prune(digests)
 
-# reminder to self: Union -> | as of min 3.10
-def render(
-    directory: Path,
-    *,
-    users: Optional[set[str]] = None,
-    destination: Optional[Union[bool, Path]] = None,
-    link_type: Optional[LinkType] = None,
-    live: bool = False,
-    notify: bool = False,
-    fresh: bool = False,
-):
+
+def _page_digests(
+    pages: dict[str, PageInfo], users: Iterable[str], site: Site
+) -> dict[str, Optional[str]]:
     """
-    Render a website
+    The SHA-256 digests of users' rendered pages (if they were rendered)
+    """
+    digests = {}
+    for user in users:
+        stamp = pages[user].last.get(site.user_destination(user) / "index.html")
+        digests[user] = stamp.digest if stamp else None
 
-    directory: the directory containing the config file
-    users: Optionally, a list of users to render pages for. If not
-        supplied, all users and the index will be updated.
-    destination: Either, the location to render the site at, True, to
-        use the main destination in the config, or False/None to default
-        to a test destination if it is defined.
-    link_type: Either relative or absolute, or None to default based on
-        whether the site uses subdomains
-    live: Watch for new changes and continue to update as they appear.
-    notify: Send a desktop notification if rendering fails
-    fresh: Delete existing files before rendering. If supplied, a user
-        list cannot be supplied
+    return digests
+
+
+def _context_digest(site: Site, info: PageInfo) -> str:
     """
-    with (directory / FILENAME).open("r") as stream:
-        config = json.load(stream)
+    Summarize the settings a page is rendered with
+    """
+    context = json.dumps(
+        [
+            site.link_format,
+            site.index_link_format,
+            site.public_users,
+            site.neighbours,
+            site.reload,
+            info.kwargs,
+            info.assets,
+        ],
+        sort_keys=True,
+        default=sorted,  # sets
+    )
 
-    if destination is True:
-        destination = Path(config["destination"])
-    elif not destination:
-        destination = Path(config.get("test-destination", config["destination"]))
+    return sha256(context.encode("utf-8")).hexdigest()
 
-    if link_type is None:
-        if config["subdomains"]:
-            link_type = LinkType.ABSOLUTE
-        else:
-            link_type = LinkType.RELATIVE
 
-    if not users:
-        users = set({"index", *config["users"]})
-    elif fresh:
-        raise ValueError("Users cannot be supplied if fresh is true")
+def _check_stamp(path: Path, last: dict[Path, Stamp]) -> Optional[Stamp]:
+    """
+    Check whether a file has changed since it was last seen, returning
+    its new stamp if it has (and None if it hasn't). Files that have
+    been touched without their contents changing have their stamp
+    updated but aren't considered changed.
+    """
+    stat = path.stat()
+    count("files-stated")
+    previous = last.get(path)
 
-    environment = Environment(loader=FileSystemLoader((directory / "templates")))
-    templates = directory / "templates"
-    static = directory / "static"
-    domain = config["domain"]
+    if previous and previous.matches(stat):
+        return None
 
-    if config.get("prefix"):
-        prefix = f"{config['prefix']}."
-    elif config.get("local", False):
-        prefix = ""
-    else:
-        prefix = "www."
+    stamp = Stamp.of(path, stat=stat)
 
-    protocol = config["protocol"]
-    if link_type == LinkType.ABSOLUTE:
-        link_format = index_link_format = f"{protocol}://{prefix}{domain}/{{}}"
-    else:
-        link_format = "../{}/index.html"
-        index_link_format = "./{}/index.html"
+    if previous and previous.digest == stamp.digest:
+        last[path] = stamp
+        return None
 
-    neighbours = config["neighbours"]
-    public_users = {
-        user for user, info in config["users"].items() if info.get("public", False)
-    }
-    language = config.get("language")
-    site_name = config["name"]
+    return stamp
 
-    def get_user(user: str) -> Callable[[str, Optional[str]], str]:
-        def link_user(name: str, site: Optional[str] = None) -> str:
-            text = name
 
-            if site:
-                text = f"{name} ({site})"
-                if site in neighbours:
-                    if name in neighbours[site]:
-                        text = f"<a href={neighbours[site][name]!r}>{text}</a>"
-            elif name in public_users:
-                if user == "index":
-                    format_string = index_link_format
-                else:
-                    format_string = link_format
+def _is_intact(path: Path, last: dict[Path, Stamp]) -> bool:
+    """
+    Check that an output file is still what was last written there.
+    """
+    stamp = last.get(path)
 
-                text = f"<a href={format_string.format(name)!r}>{name}</a>"
+    if stamp is None:
+        return False
 
-            return text
+    count("files-stated")
+    try:
+        return stamp.matches(path.stat())
+    except FileNotFoundError:
+        return False
 
-        return link_user
 
-    if fresh and destination.exists():
-        LOGGER.info("deleting existing rendered site")
-        rmtree(destination)
-    destination.mkdir(exist_ok=True, parents=True)
+def _copy_if_changed(
+    source: Path, target: Path, last: dict[Path, Stamp], site: Site
+) -> bool:
+    """
+    Copy a file if it has changed (or if the copy is missing or has
+    been modified). Returns whether the file was copied.
+    """
+    stamp = _check_stamp(source, last)
 
-    # copy any files in the base
-    for path in static.iterdir():
-        if path.is_file():
-            copy2(path, destination)
+    if stamp is None:
+        if _is_intact(target, last):
+            return False
 
-    with (destination / "users.json").open("w") as stream:
-        json.dump(
-            {user: f"{protocol}://{prefix}{domain}/{user}" for user in public_users},
-            stream,
-            indent=4,
-            sort_keys=True,
-        )
+        stamp = last[source]
 
-    pages = {
-        user: PageInfo(
-            templates / f"{user}.html.jinja2",
-            {
-                "me": user,
-                "language": language,
-                "site_url": domain,
-                "site_name": site_name,
-                "user": get_user(user),
-                "users": public_users,
-                "neighbours": neighbours,
-                "has_feed": Feed.NONE
-                != Feed(config["users"].get(user, {}).get("feed", "personal")),
-            },
-        )
-        for user in users
+    strategy = publish_file(source, target, site.publish)
+    LOGGER.info("copying %s (%s)", source, strategy.value)
+    count("files-copied")
+    count("bytes-copied", stamp.size)
+
+    if site.compress and target.suffix.lower() in TEXT_SUFFIXES:
+        write_sidecars(target, target.read_bytes(), site.compress)
+
+    last[source] = stamp
+    last[target] = Stamp.of(target, stamp.digest)
+
+    return True
+
+
+def _load_manifest(directory: Path, destination: Path) -> dict[str, Any]:
+    """
+    Load what was rendered the last time this destination was rendered
+    """
+    path = directory / MANIFEST_FILENAME
+
+    if not path.exists():
+        return {}
+
+    with path.open("r") as stream:
+        manifest = json.load(stream)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        LOGGER.info("ignoring outdated build manifest")
+        return {}
+
+    return manifest["destinations"].get(str(destination.absolute()), {})
+
+
+# Paths are saved relative to the site directory and the destination so
+# that stamps survive a fresh render being swapped in as the destination
+
+
+def _load_stamps(stamps: dict[str, dict[str, list]], site: Site) -> dict[Path, Stamp]:
+    loaded = {
+        site.directory / path: Stamp(*stamp)
+        for path, stamp in stamps.get("inputs", {}).items()
     }
+    loaded.update(
+        (site.destination / path, Stamp(*stamp))
+        for path, stamp in stamps.get("outputs", {}).items()
+    )
 
-    failing_users = set()
-    updated = set()
+    return loaded
+
+
+def _dump_stamps(stamps: dict[Path, Stamp], site: Site) -> dict[str, dict[str, list]]:
+    dumped: dict[str, dict[str, list]] = {"inputs": {}, "outputs": {}}
+
+    for path, stamp in stamps.items():
+        if path.is_relative_to(site.destination):
+            kind = "outputs"
+            path = path.relative_to(site.destination)
+        else:
+            kind = "inputs"
+            if path.is_relative_to(site.directory):
+                path = path.relative_to(site.directory)
+
+        dumped[kind][str(path)] = [
+            stamp.inode,
+            stamp.size,
+            stamp.modified,
+            stamp.digest,
+        ]
+
+    return dumped
+
+
+def _restore_page(info: PageInfo, state: dict[str, Any], site: Site):
+    info.last = _load_stamps(state["last"], site)
+    info.number = state["number"]
+    info.dependencies = {site.directory / path for path in state["dependencies"]}
+    info.context = state["context"]
+    info.image = state.get("image", state.get("latest_image"))
+
+    for key in ("latest_image", "page_date", *IMAGE_KEYS):
+        if key in state:
+            info.kwargs[key] = state[key]
+
+
+def _save_manifest(
+    directory: Path,
+    destination: Path,
+    site: Site,
+    files: dict[Path, Stamp],
+    pages: dict[str, PageInfo],
+    broken: set[str],
+):
+    """
+    Save what was rendered so the next render can skip anything that
+    hasn't changed.
+
+    destination: Where the site is served from (which may not be where
+        it's being rendered to).
+    broken: Users whose pages failed to render. Their page will be
+        rerendered next time.
+    """
+    path = directory / MANIFEST_FILENAME
+
+    manifest: dict[str, Any] = {"version": MANIFEST_VERSION, "destinations": {}}
+    if path.exists():
+        with path.open("r") as stream:
+            existing = json.load(stream)
+
+        if existing.get("version") == MANIFEST_VERSION:
+            manifest = existing
+
+    # pages that weren't rendered this time are still where they were
+    state = manifest["destinations"].setdefault(str(destination.absolute()), {})
+    state["files"] = _dump_stamps(files, site)
+    state.setdefault("pages", {})
+
+    for user, info in pages.items():
+        last = dict(info.last)
+        if user in broken:
+            last.pop(site.user_destination(user) / "index.html", None)
+
+        page_state: dict[str, Any] = {
+            "last": _dump_stamps(last, site),
+            "number": info.number,
+            "dependencies": sorted(
+                str(dependency.relative_to(site.directory))
+                for dependency in info.dependencies
+            ),
+            "context": info.context,
+            "image": info.image,
+        }
+
+        for key in ("latest_image", "page_date", *IMAGE_KEYS):
+            if key in info.kwargs:
+                page_state[key] = info.kwargs[key]
 
-    loop = True
-    while loop:
+        state["pages"][user] = page_state
+
+    write_file(path, json.dumps(manifest, sort_keys=True))
+
+
+def _try_update_page(
+    user: str,
+    info: PageInfo,
+    environment: Environment,
+    graph: TemplateGraph,
+    site: Site,
+    rendered: Optional[dict[str, str]] = None,
+) -> tuple[bool, Optional[Exception]]:
+    """
+    Update a page, logging (and returning) rather than raising errors
+    """
+    with recording(info.timings):
         try:
-            for user, info in pages.items():
-                changed = False
+            with timed("update"):
+                return (
+                    _update_page(user, info, environment, graph, site, rendered),
+                    None,
+                )
+        except Exception as exception:
+            LOGGER.exception("updating page for %s failed", user)
+            return True, exception
 
-                if user == "index":
-                    user_destination = destination
-                else:
-                    user_destination = destination / user
-
-                user_static = static / user
-                directories = [user_static]
-                while directories:
-                    current_directory = directories.pop(0)
-                    dest = user_destination / current_directory.relative_to(user_static)
-                    dest.mkdir(exist_ok=True, parents=True)
-                    for path in current_directory.iterdir():
-                        if path.is_dir():
-                            directories.append(path)
-                        elif path.name.lower() != ".ds_store":  # thanks apple
-                            modified_time = int(path.stat().st_mtime)
-                            last_modified = info.last.get(path)
-                            if last_modified is None or modified_time != last_modified:
-                                info.last[path] = modified_time
-                                changed = True
-                                LOGGER.info("copying %s", path)
-                                copy2(
-                                    path,
-                                    user_destination / path.relative_to(user_static),
-                                )
-
-                                if current_directory == user_static:
-                                    match = re.search(r"^update-(\d+)$", path.stem)
-                                    if match:
-                                        number = int(match.group(1))
-
-                                        if info.number is None or number > info.number:
-                                            info.number = number
-                                            info.kwargs["latest_image"] = path.name
-
-                modified_time = int(info.template.stat().st_mtime)
-                last_modified = info.last.get(info.template)
-                if last_modified is None or modified_time != last_modified:
-                    info.last[info.template] = modified_time
-                    info.kwargs["page_date"] = datetime.fromtimestamp(
-                        modified_time
-                    ).strftime("%Y-%m-%d %H:%M:%S")
-                    changed = True
 
-                if changed:
-                    template = environment.get_template(info.template.name)
+# worker process state for parallel rendering
+_worker: Optional[tuple[Site, Environment, TemplateGraph]] = None
+_records: "SimpleQueue[logging.LogRecord]" = SimpleQueue()
 
-                    try:
-                        LOGGER.info("rendering page for %s", user)
-                        with (user_destination / "index.html").open("w") as stream:
-                            stream.write(template.render(**info.kwargs))
-                    except Exception:
-                        LOGGER.exception("updating page for %s failed", user)
 
-                        if user not in failing_users and notify:
-                            failing_users.add(user)
-                            send_notification(f"Building page for {user} failed")
+def _start_worker(site: Site, level: int, compiled: bool):
+    global _worker
 
-                        if not live:
-                            raise
-                    else:
-                        if user in failing_users and notify:
-                            failing_users.remove(user)
-                            send_notification(f"Page for {user} fixed")
+    # the parent process is responsible for stopping live renders
+    signal(SIGINT, SIG_IGN)
 
-                    updated.add(user)
+    environment = _create_environment(site, compiled)
+    _worker = (site, environment, TemplateGraph(environment, site.templates))
 
-            loop = live
-            if loop:
-                sleep(2)
+    # hang on to logs so the parent process can log them in order
+    LOGGER.handlers = [QueueHandler(_records)]
+    LOGGER.propagate = False
+    LOGGER.setLevel(level)
 
-        except KeyboardInterrupt:
-            LOGGER.info("stopping")
-            loop = False
 
-    LOGGER.info(f"updated pages for {', '.join(sorted(updated))}")
+def _update_page_in_worker(
+    arguments: tuple[str, PageInfo],
+) -> tuple[str, PageInfo, bool, Optional[Exception], list[logging.LogRecord]]:
+    assert _worker is not None
+    user, info = arguments
+    site, environment, graph = _worker
 
-    global_feed = Feed(config["users"].get("index", {}).get("feed", "personal"))
-    if global_feed != Feed.NONE and updated:
-        updates_file = directory / UPDATES_FILENAME
+    changed, error = _try_update_page(user, info, environment, graph, site)
 
-        if updates_file.exists():
-            with updates_file.open("r") as stream:
-                updates = json.load(stream)
-        else:
-            updates = {}
+    if error is not None:
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = RuntimeError(f"updating page for {user} failed: {error}")
 
-        for user in updated:
-            user_feed = Feed(config["users"].get(user, {}).get("feed", "personal"))
+    records = []
+    while not _records.empty():
+        records.append(_records.get())
 
-            if user == "index":
-                listed_user = None
-                user_page = destination / "index.html"
-                user_root = f"{protocol}://{prefix}{domain}"
-            else:
-                listed_user = user
-                user_page = destination / user / "index.html"
-                user_root = f"{protocol}://{prefix}{domain}/{user}"
+    return user, info, changed, error, records
+
+
+def _handle_worker_result(
+    pages: dict[str, PageInfo],
+    user: str,
+    info: PageInfo,
+    changed: bool,
+    error: Optional[Exception],
+    records: list[logging.LogRecord],
+) -> tuple[str, bool, Optional[Exception]]:
+    pages[user] = info
 
-            updates[user] = parse_entries(
-                user_page, user_root, static / user, site_name, user=listed_user
+    for record in records:
+        LOGGER.handle(record)
+
+    return user, changed, error
+
+
+def _find_changed_users(
+    paths: Iterable[Path], templates: Path, static: Path, pages: dict[str, PageInfo]
+) -> set[str]:
+    """
+    Figure out which users' pages are affected by a set of changed
+    files. A template change affects every page that depends on it.
+    Files in the root of the static directory are only copied at the
+    start of a render so they don't belong to any user.
+    """
+    users: set[str] = set()
+
+    for path in paths:
+        if path.is_relative_to(templates):
+            users.update(
+                user
+                for user, info in pages.items()
+                if path == info.template or path in info.dependencies
             )
+        elif path.is_relative_to(static):
+            parts = path.relative_to(static).parts
 
-        with updates_file.open("w") as stream:
-            json.dump(updates, stream, indent=4, sort_keys=True)
+            if len(parts) > 1 and parts[0] in pages:
+                users.add(parts[0])
 
-        for user in users:
-            user_feed = Feed(config["users"].get(user, {}).get("feed", "personal"))
-            if user_feed != Feed.NONE:
-                root_url = f"{protocol}://{prefix}{domain}/{user}/"
+    return users
+
+
+@dataclass
+class Feeds:
+    """
+    Everything needed to turn rendered pages into Atom/RSS feeds
+
+    directory: the directory containing the config file
+    destination: Where the site is being rendered to
+    site_name: The name of the site
+    root_url: The URL of the main page (without a trailing slash)
+    users: The users section of the site's configuration
+    compress: Which precompressed copies of feeds to write
+    entries: The most entries to put in each feed document (older
+        entries are moved into archive documents for user feeds, and
+        left out of the global feed). 0 means no limit.
+    retention: The most entries to keep for each user. Older entries
+        are forgotten.
+    """
+
+    directory: Path
+    destination: Path
+    site_name: str
+    root_url: str
+    users: dict[str, dict[str, Any]]
+    compress: tuple[Compression, ...] = ()
+    entries: int = DEFAULT_FEED_ENTRIES
+    retention: Optional[int] = None
+    store: Optional[UpdateStore] = None
+    stale: bool = True
+
+    def feed(self, user: str) -> Feed:
+        return Feed(self.users.get(user, {}).get("feed", "personal"))
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def refresh(
+        self,
+        updated: Iterable[str],
+        users: Iterable[str],
+        digests: Optional[dict[str, str]] = None,
+        texts: Optional[dict[str, str]] = None,
+    ):
+        """
+        Update the entries for pages that have changed and rerender
+        feeds.
+
+        updated: Users whose pages have changed since their entries
+            were last parsed
+        users: Users whose feeds should be rerendered. The global feed
+            is rerendered whenever a public user's entries change.
+        digests: The SHA-256 digests of users' pages (if known), so
+            pages that haven't changed don't need to be read
+        texts: The contents of users' pages (if they're still in
+            memory from rendering them), so they don't need to be read
+        """
+        if digests is None:
+            digests = {}
+
+        if texts is None:
+            texts = {}
+
+        if self.store is None:
+            self.store = UpdateStore(self.directory / UPDATES_DATABASE)
+            self.store.migrate(self.directory / UPDATES_FILENAME, self.retention)
+
+            # which pages were parsed used to be kept here
+            (self.directory / CACHE_DIRECTORY / "entries.json").unlink(missing_ok=True)
+
+        store = self.store
+
+        for user in updated:
+            with timed("entries"):
+                self._refresh_user(user, store, digests.get(user), texts.get(user))
+
+        with timed("feeds"):
+            self._build(users, store)
+
+    def _refresh_user(
+        self,
+        user: str,
+        store: UpdateStore,
+        digest: Optional[str],
+        text: Optional[str] = None,
+    ):
+        """
+        Update the stored entries for a user whose page has changed
+        """
+        if user == "index":
+            listed_user = None
+            user_page = self.destination / "index.html"
+            user_root = self.root_url
+        else:
+            listed_user = user
+            user_page = self.destination / user / "index.html"
+            user_root = f"{self.root_url}/{user}"
+
+        entries, digest = self._extract(
+            user, store, user_page, user_root, listed_user, digest, text
+        )
+
+        update = _update_entry(
+            user_root, self.directory / "static" / user, self.site_name, listed_user
+        )
+        if update:
+            entries[""] = update
+
+        store.replace(user, entries, self.retention, (digest, user_root))
 
-                user_entries = updates.get(user, {})
+        if self.feed(user) == Feed.PUBLIC:
+            self.stale = True
+
+    def _build(self, users: Iterable[str], store: UpdateStore):
+        """
+        Rerender users' feeds (and the global feed if it's out of date)
+        """
+        for user in users:
+            # the index page's feed would be written to the site root,
+            # where the global feed replaces it
+            if user != "index" and self.feed(user) != Feed.NONE:
+                root_url = f"{self.root_url}/{user}/"
 
                 LOGGER.info("rendering feed for %s", user)
-                posts = sort_posts(user_entries.values())
-                build_atom(posts, destination, site_name, root_url, user=user)
-                build_rss(posts, destination, site_name, root_url, user=user)
+                posts = store.posts([user])
+                build_atom(
+                    posts,
+                    self.destination,
+                    self.site_name,
+                    root_url,
+                    user=user,
+                    compress=self.compress,
+                    limit=self.entries,
+                )
+                build_rss(
+                    posts,
+                    self.destination,
+                    self.site_name,
+                    root_url,
+                    user=user,
+                    compress=self.compress,
+                    limit=self.entries,
+                )
 
-        if global_feed != Feed.NONE:
-            root_url = f"{protocol}://{prefix}{domain}/"
+        if self.feed("index") != Feed.NONE and self.stale:
+            root_url = f"{self.root_url}/"
 
             LOGGER.info("rendering global feed")
-            posts = sort_posts(
-                post
-                for user, user_posts in updates.items()
-                for post in user_posts.values()
-                if Feed(config["users"].get(user, {}).get("feed", "personal"))
-                == Feed.PUBLIC
+            posts = self._global_posts(store)
+            build_atom(
+                posts,
+                self.destination,
+                self.site_name,
+                root_url,
+                compress=self.compress,
+                limit=self.entries,
             )
-            build_atom(posts, destination, site_name, root_url)
-            build_rss(posts, destination, site_name, root_url)
+            build_rss(
+                posts,
+                self.destination,
+                self.site_name,
+                root_url,
+                compress=self.compress,
+                limit=self.entries,
+            )
+
+            self.stale = False
+
+    def _global_posts(self, store: UpdateStore) -> list[dict[str, str]]:
+        """
+        The newest posts from every public user, in one query limited to
+        the feed's size (rather than fetching every post on the site).
+        """
+        public = [user for user in store.users() if self.feed(user) == Feed.PUBLIC]
+
+        return store.posts(public, self.entries)
+
+    def _extract(
+        self,
+        user: str,
+        store: UpdateStore,
+        page: Path,
+        url_root: str,
+        listed_user: Optional[str],
+        digest: Optional[str],
+        text: Optional[str] = None,
+    ) -> tuple[dict[str, dict[str, str]], str]:
+        """
+        Get the h-entries in a page (and the page's digest), only
+        parsing the page if it has changed since it was last parsed (and
+        only reading it if it wasn't just rendered).
+        """
+        if digest is None:
+            if text is None:
+                text = page.read_text(encoding="utf-8")
+            digest = sha256(text.encode("utf-8")).hexdigest()
+
+        if store.page(user) == (digest, url_root):
+            LOGGER.debug("entries for %s unchanged", user)
+            entries = store.entries(user)
+
+            # the update entry comes from the static directory
+            entries.pop("", None)
+
+            return entries, digest
+
+        if text is None:
+            text = page.read_text(encoding="utf-8")
+
+        count("pages-parsed")
+        return extract_entries(text, url_root, listed_user), digest
+
+
+class FeedRefresher:
+    """
+    Refresh feeds in a background thread as pages change (so they don't
+    hold up rendering). Feeds are refreshed at most once per interval,
+    with any pages that change in the meantime batched together.
+    """
+
+    def __init__(self, feeds: Feeds, interval: float = FEED_INTERVAL):
+        self.feeds = feeds
+        self.interval = interval
+
+        self._pending: dict[str, Optional[str]] = {}
+        self._texts: dict[str, str] = {}
+        self._closed = False
+        self._condition = Condition()
+        self._thread = Thread(target=self._run, name="beocijies-feeds", daemon=True)
+        self._thread.start()
+
+    def refresh(
+        self,
+        digests: dict[str, Optional[str]],
+        texts: Optional[dict[str, str]] = None,
+    ):
+        """
+        Schedule feeds to be refreshed for users whose pages changed
+
+        digests: The users and the SHA-256 digests of their pages (if
+            known)
+        texts: The contents of users' pages (if they're in memory)
+        """
+        with self._condition:
+            self._pending.update(digests)
+
+            # older contents would no longer match the digest
+            for user in digests:
+                if texts and user in texts:
+                    self._texts[user] = texts[user]
+                else:
+                    self._texts.pop(user, None)
+            self._condition.notify()
+
+    def close(self):
+        """
+        Stop refreshing feeds (once any pending refresh is done)
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+        self._thread.join()
+
+    def _run(self):
+        last: Optional[float] = None
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+
+                if last is not None and not self._closed:
+                    self._condition.wait_for(
+                        lambda: self._closed,
+                        last + self.interval - monotonic(),
+                    )
+
+                if not self._pending:
+                    return
+
+                pending = self._pending
+                texts = self._texts
+                self._pending = {}
+                self._texts = {}
+
+            try:
+                self.feeds.refresh(
+                    pending,
+                    pending,
+                    {
+                        user: digest
+                        for user, digest in pending.items()
+                        if digest is not None
+                    },
+                    texts,
+                )
+            except Exception:
+                LOGGER.exception("refreshing feeds failed")
+
+            last = monotonic()
 
 
 def parse_entries(
-    page: Path, url_root: str, static: Path, site_name: str, user: Optional[str] = None
+    page: Path,
+    url_root: str,
+    static: Path,
+    site_name: str,
+    user: Optional[str] = None,
+    text: Optional[str] = None,
 ) -> dict[str, dict[str, str]]:
     """
-    Parse h-entries within a page
+    Parse h-entries within a page, plus an entry for the page itself
+    being created/updated
 
     page: The webpage to fetch entries from
     url_root: The URL of this page
     user: Who created the page
+    text: The contents of the page, if they've already been read
     """
-    entries = {}
+    if text is None:
+        text = page.read_text(encoding="utf-8")
 
-    with (page).open("r") as stream:
-        root = BeautifulSoup(stream.read(), "html.parser")
+    entries = extract_entries(text, url_root, user)
 
-    for node in root.select(".h-entry"):
-        if not node["id"]:
+    update = _update_entry(url_root, static, site_name, user)
+    if update:
+        entries[""] = update
+
+    return entries
+
+
+def extract_entries(
+    text: str, url_root: str, user: Optional[str] = None
+) -> dict[str, dict[str, str]]:
+    """
+    Parse the h-entries within a page
+
+    text: The contents of the page
+    url_root: The URL of this page
+    user: Who created the page
+    """
+    entries = {}
+
+    for node in find_entries(text):
+        if not node.attributes.get("id"):
             LOGGER.warning("Entry for user %s missing id", user)
             continue
 
-        entry_id = str(node["id"])
+        entry_id = node.attributes["id"]
 
         if entry_id in entries:
             LOGGER.warning("Duplicate entry id for user %s: %s", user, entry_id)
@@ -353,38 +2192,40 @@ def parse_entries(
         if user:
             entry["author"] = user
 
-        title_node = node.select_one(".p-name")
+        title_node = node.find("p-name")
         if title_node:
             entry["title"] = title_node.text.strip() or ""
 
-        summary_node = node.select_one(".p-summary")
+        summary_node = node.find("p-summary")
         if summary_node:
             entry["summary"] = summary_node.text.strip() or ""
 
-        author_node = node.select_one(".p-author")
+        author_node = node.find("p-author")
         if author_node:
             entry["author"] = author_node.text.strip()
 
-        for key, selector in (
-            ("published", "time.dt-published"),
-            ("updated", "time.dt-updated"),
+        for key, class_name in (
+            ("published", "dt-published"),
+            ("updated", "dt-updated"),
         ):
-            time_node = node.select_one(selector)
+            time_node = node.find(class_name, "time")
 
             if time_node is None:
                 continue
 
+            timestamp = time_node.attributes.get("datetime")
+
             try:
-                datetime.strptime(str(time_node["datetime"]), POST_DATE_FORMAT)
+                datetime.strptime(str(timestamp), POST_DATE_FORMAT)
             except Exception:
                 LOGGER.warning(
                     "Could not parse date for user %s's post %s: %s",
                     user,
                     entry_id,
-                    time_node["datetime"],
+                    timestamp,
                 )
             else:
-                entry[key] = str(time_node["datetime"])
+                entry[key] = str(timestamp)
 
         if "published" not in entry:
             LOGGER.warning("Could not find date for user %s's post: %s", user, entry_id)
@@ -392,11 +2233,11 @@ def parse_entries(
 
         entry.setdefault("updated", entry["published"])
 
-        summary_node = node.select_one(".p-summary")
+        summary_node = node.find("p-summary")
         if summary_node:
             entry["summary"] = summary_node.text.strip()
 
-        content_node = node.select_one(".e-content")
+        content_node = node.find("e-content")
 
         if content_node:
             entry["contents"] = str(content_node)
@@ -406,9 +2247,19 @@ def parse_entries(
                 "Could not find contents for user %s's post: %s", user, entry_id
             )
 
+    return entries
+
+
+def _update_entry(
+    url_root: str, static: Path, site_name: str, user: Optional[str] = None
+) -> Optional[dict[str, str]]:
+    """
+    Create an entry for a page being created/updated (if the page has
+    update images)
+    """
     earliest = latest = None
     for path in static.iterdir():
-        if path.is_file() and re.search(r"^update-\d+$", path.stem):
+        if path.is_file() and update_number(path) is not None:
             mtime = path.stat().st_mtime
             if earliest is None or mtime < earliest:
                 earliest = mtime
@@ -443,9 +2294,9 @@ def parse_entries(
         if user:
             entry["author"] = user
 
-        entries[""] = entry
+        return entry
 
-    return entries
+    return None
 
 
 def build_atom(
@@ -454,21 +2305,98 @@ def build_atom(
     site_name: str,
     root_url,
     user: Optional[str] = None,
+    compress: Iterable[Compression] = (),
+    limit: Optional[int] = None,
 ):
-    now = datetime.now(UTC)
+    """
+    Write an Atom feed. If there are more posts than the limit, the
+    newest posts go in atom.xml and the rest are paged into archive
+    feeds (RFC 5005), oldest first, so that older archives don't change
+    as new posts are added.
+
+    posts: The posts to include, newest first
+    limit: The most posts to put in each feed document
+    """
+    if user and user != "index":
+        directory = directory / user
+
+    current = posts
+    archives: list[list[dict[str, str]]] = []
+    if limit and len(posts) > limit:
+        current = posts[:limit]
+
+        oldest = posts[limit:][::-1]
+        archives = []
+        for start in range(0, len(oldest), limit):
+            end = start + limit
+            archives.append(oldest[start:end][::-1])
+
+    root = _atom_feed(current, site_name, root_url, "atom.xml", user)
+    if archives:
+        _atom_link(root, "prev-archive", f"{root_url}{archive_name(len(archives))}")
+
+    write_file(
+        directory / "atom.xml",
+        ElementTree.tostring(root, encoding="UTF-8", xml_declaration=True),
+        compress,
+    )
+
+    for number, archive in enumerate(archives, start=1):
+        name = archive_name(number)
+
+        root = _atom_feed(archive, site_name, root_url, name, user)
+        root.set("xmlns:fh", HISTORY_NAMESPACE)
+        root.insert(0, ElementTree.Element("fh:archive"))
+
+        _atom_link(root, "current", f"{root_url}atom.xml")
+        if number > 1:
+            _atom_link(root, "prev-archive", f"{root_url}{archive_name(number - 1)}")
+        if number < len(archives):
+            _atom_link(root, "next-archive", f"{root_url}{archive_name(number + 1)}")
+
+        write_file(
+            directory / name,
+            ElementTree.tostring(root, encoding="UTF-8", xml_declaration=True),
+            compress,
+        )
+
+    # archives that are no longer needed (e.g., the limit went up)
+    number = len(archives) + 1
+    while (directory / archive_name(number)).exists():
+        path = directory / archive_name(number)
+        LOGGER.info("removing %s", path)
+
+        path.unlink()
+        for compression in Compression:
+            path.with_name(f"{path.name}{compression.suffix}").unlink(missing_ok=True)
+
+        number += 1
 
+
+def archive_name(number: int) -> str:
+    """
+    The filename of an Atom archive feed (numbered from the oldest)
+    """
+    return f"atom-archive-{number}.xml"
+
+
+def _atom_feed(
+    posts: list[dict[str, str]],
+    site_name: str,
+    root_url: str,
+    name: str,
+    user: Optional[str] = None,
+) -> ElementTree.Element:
     root = ElementTree.Element("feed", attrib={"xmlns": "http://www.w3.org/2005/Atom"})
 
     ElementTree.SubElement(root, "id").text = root_url
     ElementTree.SubElement(root, "title").text = site_name
-    ElementTree.SubElement(root, "updated").text = now.strftime(ATOM_DATE_FORMAT)
-
-    ElementTree.SubElement(
-        root,
-        "link",
-        attrib={"rel": "self", "href": f"{root_url}atom.xml"},
+    ElementTree.SubElement(root, "updated").text = (
+        _last_updated(posts).astimezone(UTC).strftime(ATOM_DATE_FORMAT)
     )
 
+    _atom_link(root, "self", f"{root_url}{name}")
+
     ElementTree.SubElement(root, "subtitle").text = "A beocijies site"
 
     for post in posts:
@@ -504,12 +2432,19 @@ def build_atom(
         summary = f"{author} updated a post on {site_name}"
         ElementTree.SubElement(entry, "summary").text = post.get("summary", summary)
 
-    if user and user != "index":
-        path = directory / user / "atom.xml"
-    else:
-        path = directory / "atom.xml"
+    return root
+
+
+def _atom_link(root: ElementTree.Element, rel: str, href: str):
+    """
+    Add a link to a feed (after any existing links)
+    """
+    index = len(root)
+    for position, child in enumerate(root):
+        if child.tag == "link":
+            index = position + 1
 
-    ElementTree.ElementTree(root).write(path, encoding="UTF-8", xml_declaration=True)
+    root.insert(index, ElementTree.Element("link", attrib={"rel": rel, "href": href}))
 
 
 def build_rss(
@@ -518,8 +2453,18 @@ def build_rss(
     site_name: str,
     root_url,
     user: Optional[str] = None,
+    compress: Iterable[Compression] = (),
+    limit: Optional[int] = None,
 ):
-    now = datetime.now(UTC)
+    """
+    Write an RSS feed. RSS has no way to page through older posts, so
+    only the newest posts (up to the limit) are included.
+
+    posts: The posts to include, newest first
+    limit: The most posts to include
+    """
+    if limit:
+        posts = posts[:limit]
 
     root = ElementTree.Element(
         "rss", attrib={"version": "2.0", "xmlns:atom": "http://www.w3.org/2005/Atom"}
@@ -527,9 +2472,9 @@ def build_rss(
 
     channel = ElementTree.SubElement(root, "channel")
     ElementTree.SubElement(channel, "title").text = site_name
-    ElementTree.SubElement(channel, "lastBuildDate").text = now.strftime(
-        RSS_DATE_FORMAT
-    )
+    ElementTree.SubElement(channel, "lastBuildDate").text = _last_updated(
+        posts
+    ).strftime(RSS_DATE_FORMAT)
 
     ElementTree.SubElement(channel, "link").text = f"{root_url}rss.xml"
     ElementTree.SubElement(
@@ -560,7 +2505,18 @@ def build_rss(
     else:
         path = directory / "rss.xml"
 
-    ElementTree.ElementTree(root).write(path, encoding="UTF-8")
+    write_file(path, ElementTree.tostring(root, encoding="UTF-8"), compress)
+
+
+def _last_updated(posts: Iterable[dict[str, str]]) -> datetime:
+    """
+    When the newest post was updated. This is used instead of the
+    current time so feeds only change when their posts do.
+    """
+    return max(
+        (datetime.strptime(post["updated"], POST_DATE_FORMAT) for post in posts),
+        default=EPOCH,
+    )
 
 
 def sort_posts(posts: Iterable[dict[str, str]]) -> list[dict[str, str]]:
@@ -568,19 +2524,17 @@ def sort_posts(posts: Iterable[dict[str, str]]) -> list[dict[str, str]]:
     # order but we're going to sort to put the newest first since that's
     # how they'll be read and we'll further sort by author/id (although
     # reverse-alphabetically) just to ensure a consistent post order
-    return sorted(
-        posts,
-        key=lambda post: (
-            post["updated"],
-            post["published"],
-            post.get("author", ""),
-            post["id"],
-        ),
-        reverse=True,
-    )
+    return sorted(posts, key=_post_order, reverse=True)
+
+
+def _post_order(post: dict[str, str]) -> tuple[str, str, str, str]:
+    return (post["updated"], post["published"], post.get("author", ""), post["id"])
 
 
 def send_notification(message):
+    # notifypy is slow to import and most renders never notify
+    from notifypy import Notify  # type: ignore
+
     notification = Notify()
     notification.title = "beocijies"
     notification.message = message
@@ -0,0 +1,431 @@
+"""
+Serve a rendered site locally, the way a real web server would
+"""
+
+import json
+import logging
+import mimetypes
+import posixpath
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional, Union
+from urllib.parse import unquote, urlsplit
+
+from beocijies.configure import FILENAME, find_destination, url_safe_name
+from beocijies.publish import FINGERPRINT_PATTERN, TEXT_SUFFIXES, Compression
+
+if TYPE_CHECKING:
+    from beocijies.render import LazyRenderer
+
+LOGGER = logging.getLogger("beocijies")
+
+DEFAULT_SERVE_PORT = 8000
+
+# the address sites are served on (use a real web server for anything
+# public)
+SERVE_ADDRESS = "127.0.0.1"
+
+# content types mimetypes doesn't always know about
+CONTENT_TYPES = {
+    ".avif": "image/avif",
+    ".mjs": "text/javascript",
+    ".webp": "image/webp",
+}
+
+# the order precompressed copies are preferred in
+ENCODINGS = (Compression.BROTLI, Compression.GZIP)
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class UnsatisfiableRange(ValueError):
+    """
+    A range that doesn't overlap the file
+    """
+
+
+class SiteServer(ThreadingHTTPServer):
+    """
+    A server for a rendered site
+
+    root: Where the site was rendered to
+    users: The users with their own subdomains (by the name they're
+        served under)
+    domain: The site's domain. Users are served at USER.localhost as
+        well as USER.domain (if the domain points here).
+    fingerprint: Whether static files have fingerprinted copies (which
+        can be cached forever)
+    renderer: Render pages as they're requested (instead of serving
+        whatever was last rendered)
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        root: Path,
+        users: Optional[dict[str, str]] = None,
+        domain: Optional[str] = None,
+        fingerprint: bool = False,
+        renderer: Optional["LazyRenderer"] = None,
+    ):
+        super().__init__(address, SiteHandler)
+        self.root = root
+        self.users = users or {}
+        self.domain = domain
+        self.fingerprint = fingerprint
+        self.renderer = renderer
+
+    def subdomain_user(self, host: Optional[str]) -> Optional[str]:
+        """
+        Which user's subdomain a host refers to (if any)
+        """
+        if host:
+            name = host.rsplit(":", 1)[0].lower().rstrip(".")
+
+            for domain in ("localhost", self.domain):
+                if domain and name.endswith(f".{domain}"):
+                    subdomain = name[: -len(domain) - 1].removeprefix("www.")
+
+                    if subdomain in self.users:
+                        return self.users[subdomain]
+
+        return None
+
+    def site_root(self, host: Optional[str]) -> Path:
+        """
+        Which part of the site a host refers to
+        """
+        user = self.subdomain_user(host)
+        if user is None:
+            return self.root
+
+        return self.root / user
+
+    def prepare(self, host: Optional[str], url_path: str):
+        """
+        Render the page a request is for (if pages are rendered as
+        they're requested)
+        """
+        if self.renderer is None:
+            return
+
+        user = self.subdomain_user(host)
+        if user is None:
+            user = url_path.lstrip("/").split("/", 1)[0]
+
+        # anything that isn't in a user's directory belongs to the index
+        if not self.renderer.ensure(user):
+            self.renderer.ensure("index")
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """
+    Serve files (or their precompressed copies) with the headers needed
+    for caching and range requests
+    """
+
+    server: SiteServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._send(head=False)
+
+    def do_HEAD(self):
+        self._send(head=True)
+
+    def log_message(self, format: str, *args: Any):
+        LOGGER.info("%s - %s", self.address_string(), format % args)
+
+    def _send(self, head: bool):
+        url_path = unquote(urlsplit(self.path).path)
+        self.server.prepare(self.headers["Host"], url_path)
+        path = _find_file(self.server.site_root(self.headers["Host"]), url_path)
+
+        if path is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        # relative links need directories to end in a slash
+        if path.is_dir():
+            self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+            self.send_header("Location", f"{urlsplit(self.path).path}/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        content_type = _content_type(path)
+        sent, encoding = _choose_encoding(path, self.headers["Accept-Encoding"])
+
+        try:
+            stream = sent.open("rb")
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        with stream:
+            stat = sent.stat()
+            size = stat.st_size
+            tag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}'
+            tag = f'{tag}-{encoding.value}"' if encoding else f'{tag}"'
+            modified = formatdate(stat.st_mtime, usegmt=True)
+
+            if _not_modified(self.headers, tag, stat.st_mtime):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self._send_headers(path, tag, modified, encoding)
+                self.end_headers()
+                return
+
+            start, end = 0, size - 1
+            status = HTTPStatus.OK
+
+            if _if_range(self.headers, tag, modified):
+                try:
+                    requested = _parse_range(self.headers["Range"], size)
+                except UnsatisfiableRange:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                if requested is not None:
+                    start, end = requested
+                    status = HTTPStatus.PARTIAL_CONTENT
+
+            length = end - start + 1
+
+            self.send_response(status)
+            self._send_headers(path, tag, modified, encoding)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(length))
+            if status == HTTPStatus.PARTIAL_CONTENT:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+
+            if not head and length:
+                self.wfile.flush()
+                self.connection.sendfile(stream, start, length)
+
+    def _send_headers(
+        self, path: Path, tag: str, modified: str, encoding: Optional[Compression]
+    ):
+        self.send_header("ETag", tag)
+        self.send_header("Last-Modified", modified)
+        self.send_header("Accept-Ranges", "bytes")
+
+        if encoding:
+            self.send_header("Content-Encoding", encoding.value)
+
+        if encoding or path.suffix.lower() in TEXT_SUFFIXES:
+            self.send_header("Vary", "Accept-Encoding")
+
+        # the same rules the generated web server configurations use
+        if self.server.fingerprint and re.search(FINGERPRINT_PATTERN, path.name):
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        elif path.suffix.lower() in (".html", ".xml", ".json"):
+            self.send_header("Cache-Control", "no-cache")
+
+
+def serve(
+    directory: Path,
+    destination: Optional[Union[bool, Path]] = None,
+    port: int = DEFAULT_SERVE_PORT,
+    address: str = SERVE_ADDRESS,
+    lazy: bool = False,
+):
+    """
+    Serve a rendered site until interrupted
+
+    directory: the directory containing the config file
+    destination: Either, the location the site was rendered to, True,
+        to use the main destination in the config, or False/None to
+        default to a test destination if it is defined.
+    port: The port to serve the site on
+    address: The address to serve the site on
+    lazy: Render pages the first time they're requested (and again
+        after they change) instead of serving what was last rendered
+    """
+    from beocijies.render import LazyRenderer
+
+    with (directory / FILENAME).open("r") as stream:
+        config = json.load(stream)
+
+    root = find_destination(config, destination)
+
+    users = {url_safe_name(user): user for user in config["users"] if user != "index"}
+
+    renderer = LazyRenderer(directory, root) if lazy else None
+
+    try:
+        with SiteServer(
+            (address, port),
+            root,
+            users,
+            config["domain"],
+            config.get("fingerprint", False),
+            renderer,
+        ) as server:
+            host, port = server.server_address[:2]
+            LOGGER.info("serving %s at http://%s:%d/", root, host, port)
+            if users:
+                LOGGER.info("users are served at http://USER.localhost:%d/", port)
+
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                LOGGER.info("stopping")
+    finally:
+        if renderer:
+            renderer.close()
+
+
+def _find_file(root: Path, url_path: str) -> Optional[Path]:
+    """
+    Find the file a URL path refers to (without letting it escape the
+    root)
+    """
+    parts = [
+        part
+        for part in posixpath.normpath(url_path).split("/")
+        if part not in ("", ".", "..")
+    ]
+
+    # hidden files (e.g., generations, temporary files) are never served
+    if any(part.startswith(".") for part in parts):
+        return None
+
+    path = root.joinpath(*parts)
+
+    if path.is_dir():
+        if not url_path.endswith("/"):
+            return path
+
+        path = path / "index.html"
+
+    if not path.is_file():
+        return None
+
+    return path
+
+
+def _content_type(path: Path) -> str:
+    content_type = CONTENT_TYPES.get(path.suffix.lower())
+    if content_type is None:
+        content_type, encoding = mimetypes.guess_type(path.name)
+
+        # e.g., a precompressed copy being downloaded directly
+        if encoding:
+            return (
+                "application/gzip" if encoding == "gzip" else "application/octet-stream"
+            )
+
+    if content_type is None:
+        return "application/octet-stream"
+
+    if content_type.startswith("text/") or content_type in (
+        "application/json",
+        "application/xml",
+        "image/svg+xml",
+    ):
+        return f"{content_type}; charset=utf-8"
+
+    return content_type
+
+
+def _choose_encoding(
+    path: Path, accept_encoding: Optional[str]
+) -> tuple[Path, Optional[Compression]]:
+    """
+    Pick the best precompressed copy of a file the client accepts (if
+    there is one)
+    """
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        name, *parameters = (part.strip() for part in item.split(";"))
+        refused = any(
+            parameter.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+            for parameter in parameters
+        )
+        if not refused:
+            accepted.add(name.lower())
+
+    for encoding in ENCODINGS:
+        if encoding.value in accepted or "*" in accepted:
+            compressed = path.with_name(f"{path.name}{encoding.suffix}")
+            if compressed.is_file():
+                return compressed, encoding
+
+    return path, None
+
+
+def _not_modified(headers: Any, tag: str, modified: float) -> bool:
+    """
+    Whether the client's cached copy is still good
+    """
+    if headers["If-None-Match"]:
+        tags = [
+            value.strip().removeprefix("W/")
+            for value in headers["If-None-Match"].split(",")
+        ]
+        return "*" in tags or tag in tags
+
+    if headers["If-Modified-Since"]:
+        try:
+            since = parsedate_to_datetime(headers["If-Modified-Since"])
+        except (TypeError, ValueError):
+            return False
+
+        return int(modified) <= since.timestamp()
+
+    return False
+
+
+def _if_range(headers: Any, tag: str, modified: str) -> bool:
+    """
+    Whether a range request still applies to the file (if the client
+    asked for a range of a particular version)
+    """
+    condition = headers["If-Range"]
+    return condition is None or condition in (tag, modified)
+
+
+def _parse_range(value: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a Range header into the first and last byte. Returns None if
+    there's no (usable) range and raises UnsatisfiableRange if the range
+    doesn't overlap the file. Multiple ranges aren't supported so
+    they're treated as no range (which is allowed).
+    """
+    if not value:
+        return None
+
+    match = RANGE_PATTERN.fullmatch(value.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+
+        # the last N bytes
+        if int(last) == 0 or size == 0:
+            raise UnsatisfiableRange(value)
+
+        return max(size - int(last), 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+
+    if last and int(last) < start:
+        return None
+
+    if start >= size:
+        raise UnsatisfiableRange(value)
+
+    return start, end
@@ -0,0 +1,92 @@
+"""
+Keep track of where the time goes while rendering
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import Enum
+from time import perf_counter
+from typing import Any, Iterator, Optional
+
+# how many entries to include in summaries
+SUMMARY_SIZE = 5
+
+# how many functions/allocations to include from profilers
+PROFILER_SIZE = 25
+
+
+class Profiler(Enum):
+    """
+    Ways to look more closely at a render (both slow it down)
+    """
+
+    CPROFILE = "cprofile"
+    TRACEMALLOC = "tracemalloc"
+
+
+@dataclass
+class Timings:
+    """
+    How long things took (in seconds) and how much work was done
+    """
+
+    times: dict[str, float] = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)
+
+    def add(self, other: "Timings"):
+        for name, seconds in other.times.items():
+            self.times[name] = self.times.get(name, 0.0) + seconds
+
+        for name, amount in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def to_json(self) -> dict[str, Any]:
+        return {"times": dict(self.times), "counts": dict(self.counts)}
+
+
+_current: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+@contextmanager
+def recording(timings: Timings) -> Iterator[Timings]:
+    """
+    Record anything timed or counted (in this thread) into timings
+    """
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """
+    Time something (if timings are being recorded)
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.times[name] = timings.times.get(name, 0.0) + (
+                perf_counter() - start
+            )
+
+
+def count(name: str, amount: int = 1):
+    """
+    Count something (if timings are being recorded)
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.counts[name] = timings.counts.get(name, 0) + amount
+
+
+def slowest(times: dict[str, float], size: int = SUMMARY_SIZE) -> list[str]:
+    """
+    The names of the slowest things
+    """
+    return sorted(times, key=lambda name: times[name], reverse=True)[:size]
@@ -0,0 +1,218 @@
+"""
+Store feed entries so that feeds can be rebuilt without rereading every
+page
+"""
+
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Optional
+
+LOGGER = logging.getLogger("beocijies")
+
+# bump this whenever the schema changes
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    user TEXT NOT NULL,
+    key TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    published TEXT NOT NULL,
+    author TEXT NOT NULL,
+    id TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (user, key)
+);
+
+CREATE INDEX IF NOT EXISTS entries_by_user
+    ON entries (user, updated, published, author, id);
+
+CREATE INDEX IF NOT EXISTS entries_by_time
+    ON entries (updated, published, author, id);
+
+CREATE TABLE IF NOT EXISTS pages (
+    user TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    url TEXT NOT NULL
+);
+"""
+
+# newest first, matching sort_posts
+ORDER = "ORDER BY updated DESC, published DESC, author DESC, id DESC"
+
+
+class UpdateStore:
+    """
+    Feed entries for every user, kept in an SQLite database.
+
+    path: Where the database is
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+        # feeds are refreshed from a background thread during live
+        # renders, but never from more than one thread at a time
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+        # other renders can keep reading while this one writes
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            with self.connection:
+                self.connection.executescript(SCHEMA)
+                self.connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self):
+        self.connection.close()
+
+    def migrate(self, path: Path, retention: Optional[int] = None):
+        """
+        Import entries from an updates.json file (if it exists). The
+        file is renamed afterward so it's only imported once.
+
+        retention: The most entries to import for each user
+        """
+        if not path.exists():
+            return
+
+        LOGGER.info("moving entries from %s to %s", path, self.path)
+
+        with path.open("r") as stream:
+            updates = json.load(stream)
+
+        with self.connection:
+            for user, entries in updates.items():
+                self._replace(user, entries)
+
+                if retention is not None:
+                    self._retain(user, retention)
+
+        path.rename(path.with_name(f"{path.name}.migrated"))
+
+    def users(self) -> list[str]:
+        """
+        Every user with stored entries
+        """
+        return [
+            user
+            for (user,) in self.connection.execute(
+                "SELECT DISTINCT user FROM entries ORDER BY user"
+            )
+        ]
+
+    def entries(self, user: str) -> dict[str, dict[str, str]]:
+        """
+        A user's entries, by key
+        """
+        return {
+            key: json.loads(entry)
+            for key, entry in self.connection.execute(
+                "SELECT key, entry FROM entries WHERE user = ?", (user,)
+            )
+        }
+
+    def page(self, user: str) -> Optional[tuple[str, str]]:
+        """
+        The SHA-256 digest and URL of the page a user's entries were
+        last parsed from (if they were)
+        """
+        return self.connection.execute(
+            "SELECT digest, url FROM pages WHERE user = ?", (user,)
+        ).fetchone()
+
+    def forget_pages(self):
+        """
+        Forget which pages entries were parsed from (so every page is
+        parsed again)
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM pages")
+
+    def posts(
+        self, users: Iterable[str], limit: Optional[int] = None
+    ) -> list[dict[str, str]]:
+        """
+        Entries from a set of users, newest first
+
+        limit: The most entries to get
+        """
+        users = list(users)
+        if not users:
+            return []
+
+        placeholders = ", ".join("?" for _ in users)
+        query = f"SELECT entry FROM entries WHERE user IN ({placeholders}) {ORDER}"
+        parameters: list = users
+
+        if limit:
+            query = f"{query} LIMIT ?"
+            parameters = [*users, limit]
+
+        return [
+            json.loads(entry) for (entry,) in self.connection.execute(query, parameters)
+        ]
+
+    def replace(
+        self,
+        user: str,
+        entries: dict[str, dict[str, str]],
+        retention: Optional[int] = None,
+        page: Optional[tuple[str, str]] = None,
+    ):
+        """
+        Replace all of a user's entries
+
+        retention: The most entries to keep for the user
+        page: The SHA-256 digest and URL of the page the entries were
+            parsed from
+        """
+        with self.connection:
+            self._replace(user, entries)
+
+            if retention is not None:
+                self._retain(user, retention)
+
+            if page is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO pages (user, digest, url) VALUES (?, ?, ?)",
+                    (user, *page),
+                )
+
+    def _replace(self, user: str, entries: dict[str, dict[str, str]]):
+        keys = list(entries)
+        placeholders = ", ".join("?" for _ in keys)
+
+        self.connection.execute(
+            f"DELETE FROM entries WHERE user = ? AND key NOT IN ({placeholders})",
+            (user, *keys),
+        )
+
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO entries "
+            "(user, key, updated, published, author, id, entry) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    user,
+                    key,
+                    entry["updated"],
+                    entry["published"],
+                    entry.get("author", ""),
+                    entry["id"],
+                    json.dumps(entry, sort_keys=True),
+                )
+                for key, entry in entries.items()
+            ),
+        )
+
+    def _retain(self, user: str, count: int):
+        self.connection.execute(
+            "DELETE FROM entries WHERE user = ? AND key NOT IN "
+            f"(SELECT key FROM entries WHERE user = ? {ORDER} LIMIT ?)",
+            (user, user, count),
+        )
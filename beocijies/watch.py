@@ -0,0 +1,349 @@
+"""
+Watch a beocijies site for changes
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from select import select
+from time import monotonic, sleep
+from typing import Callable, Iterable, Optional
+
+LOGGER = logging.getLogger("beocijies")
+
+POLL_INTERVAL = 2
+
+# how long (in seconds) changes need to settle before they're acted on
+DEFAULT_DEBOUNCE = 0.5
+
+# from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+EVENT = struct.Struct("iIII")
+
+
+class Watcher(ABC):
+    """
+    Wait for files within a set of directories to change.
+    """
+
+    @abstractmethod
+    def wait(self, timeout: Optional[float] = None) -> Optional[set[Path]]:
+        """
+        Block until something changes.
+
+        timeout: Give up after this many seconds (returning an empty
+            set). If not supplied, wait forever.
+
+        Returns the paths that changed, or None if the watcher can't
+        tell what changed and everything should be checked.
+        """
+
+    def close(self):
+        """
+        Stop watching
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PollingWatcher(Watcher):
+    """
+    A watcher that doesn't actually know anything, it just waits a bit
+    and then tells you to check everything.
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[set[Path]]:
+        if timeout is not None and timeout < self.interval:
+            sleep(timeout)
+            return set()
+
+        sleep(self.interval)
+        return None
+
+
+class InotifyWatcher(Watcher):
+    """
+    A watcher backed by Linux's inotify. Directories are watched
+    recursively, including any directories created after watching
+    starts.
+    """
+
+    def __init__(self, directories: Iterable[Path]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        # this will raise AttributeError on systems without inotify
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._add_watch.restype = ctypes.c_int
+
+        self.descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        self.directories: dict[int, Path] = {}
+
+        for directory in directories:
+            self.watch(directory)
+
+    def watch(self, directory: Path):
+        """
+        Watch a directory (and all its subdirectories)
+        """
+        directories = [directory]
+        while directories:
+            current = directories.pop(0)
+
+            watch = self._add_watch(self.descriptor, os.fsencode(current), WATCH_MASK)
+            if watch < 0:
+                error = ctypes.get_errno()
+                # the directory may have been deleted before we got to it
+                if error == 2:  # ENOENT
+                    continue
+                raise OSError(error, os.strerror(error), str(current))
+
+            self.directories[watch] = current
+
+            for path in current.iterdir():
+                if path.is_dir() and not path.is_symlink():
+                    directories.append(path)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[set[Path]]:
+        ready, _, _ = select([self.descriptor], [], [], timeout)
+        if not ready:
+            return set()
+
+        changed: set[Path] = set()
+        rescan = False
+
+        while True:
+            try:
+                data = os.read(self.descriptor, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                watch, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                end = offset + length
+                name = data[offset:end].rstrip(b"\0")
+                offset = end
+
+                if mask & IN_Q_OVERFLOW:
+                    LOGGER.warning("too many changes to track, rescanning")
+                    rescan = True
+                    continue
+
+                directory = self.directories.get(watch)
+                if directory is None:
+                    continue
+
+                if mask & IN_IGNORED:
+                    del self.directories[watch]
+                    continue
+
+                path = directory / os.fsdecode(name) if name else directory
+                changed.add(path)
+
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch(path)
+                    # files may have been added before the watch existed
+                    changed.update(path.rglob("*"))
+
+        if rescan:
+            return None
+
+        return changed
+
+    def close(self):
+        if self.descriptor >= 0:
+            os.close(self.descriptor)
+            self.descriptor = -1
+
+
+def get_watcher(directories: Iterable[Path]) -> Watcher:
+    """
+    Get the best watcher available for this system, falling back to
+    polling if inotify isn't available.
+    """
+    directories = list(directories)
+
+    try:
+        watcher: Watcher = InotifyWatcher(directories)
+    except (AttributeError, OSError) as exception:
+        LOGGER.info("inotify unavailable (%s), polling for changes", exception)
+        watcher = PollingWatcher()
+    else:
+        LOGGER.debug("watching for changes with inotify")
+
+    return watcher
+
+
+@dataclass
+class Burst:
+    """
+    A run of changes to a group of files
+
+    last: When (according to monotonic) something in the group last
+        changed
+    files: The size and modification time of each changed file when it
+        was last checked (or None if it doesn't exist)
+    """
+
+    last: float
+    files: dict[Path, Optional[tuple[int, int]]] = field(default_factory=dict)
+
+
+class Scheduler:
+    """
+    Coalesce bursts of changes (e.g., an editor saving repeatedly or a
+    photo import dropping dozens of files) so each group of files is
+    only acted on once per burst. A group is ready once nothing in it
+    has changed for the debounce period and every changed file has
+    stopped changing size or modification time.
+
+    watcher: Where changes come from
+    group: Which groups (e.g., users) a changed file belongs to
+    debounce: How long (in seconds) a group needs to be quiet for
+    """
+
+    def __init__(
+        self,
+        watcher: Watcher,
+        group: Callable[[Path], Iterable[str]],
+        debounce: float = DEFAULT_DEBOUNCE,
+    ):
+        self.watcher = watcher
+        self.group = group
+        self.debounce = debounce
+        self.pending: dict[str, Burst] = {}
+
+        # how long (in seconds) was spent grouping and checking files
+        # for the last batch
+        self.scan_duration = 0.0
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[set[str]]:
+        """
+        Block until a group is ready.
+
+        timeout: Give up after this many seconds (returning an empty
+            set). If not supplied, wait forever.
+
+        Returns the groups that are ready, or None if the watcher can't
+        tell what changed and everything should be checked.
+        """
+        now = monotonic()
+        deadline = None if timeout is None else now + timeout
+        self.scan_duration = 0.0
+
+        while True:
+            start = monotonic()
+            ready = self._ready(start)
+            now = monotonic()
+            self.scan_duration += now - start
+
+            if ready:
+                return ready
+
+            if deadline is not None and now >= deadline:
+                return set()
+
+            # wake up when the next group might be ready
+            waits = [
+                burst.last + self.debounce - now for burst in self.pending.values()
+            ]
+            if deadline is not None:
+                waits.append(deadline - now)
+
+            changed = self.watcher.wait(max(min(waits), 0) if waits else None)
+
+            if changed is None:
+                self.pending.clear()
+                return None
+
+            start = monotonic()
+            for path in changed:
+                for name in self.group(path):
+                    burst = self.pending.setdefault(name, Burst(start))
+                    burst.last = start
+                    burst.files[path] = _signature(path)
+            self.scan_duration += monotonic() - start
+
+    def _ready(self, now: float) -> set[str]:
+        """
+        Collect the groups that have settled
+        """
+        ready = set()
+        for name, burst in list(self.pending.items()):
+            if now - burst.last < self.debounce:
+                continue
+
+            # files still being written restart the wait
+            settled = True
+            for path, signature in burst.files.items():
+                current = _signature(path)
+                if current != signature:
+                    burst.files[path] = current
+                    settled = False
+
+            if settled:
+                ready.add(name)
+                del self.pending[name]
+            else:
+                LOGGER.debug("waiting for files for %s to settle", name)
+                burst.last = now
+
+        return ready
+
+    def close(self):
+        self.watcher.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _signature(path: Path) -> Optional[tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
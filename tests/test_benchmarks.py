@@ -0,0 +1,27 @@
+from pathlib import Path
+
+
+def test_generate_site(tmp_path: Path):
+    from benchmarks.generate import SiteParameters, generate_site
+
+    config, destination = generate_site(
+        tmp_path, SiteParameters(users=3, static_files=2, entries=4)
+    )
+
+    templates = sorted(path.name for path in (config / "templates").iterdir())
+    assert "user-2.html.jinja2" in templates
+    assert len(list((config / "static" / "user-0").iterdir())) == 2
+    assert (config / "templates" / "user-0.html.jinja2").read_text().count(
+        "h-entry"
+    ) == 4
+
+
+def test_run_benchmarks():
+    from benchmarks.__main__ import run
+    from benchmarks.generate import SiteParameters
+
+    results = run(SiteParameters(users=2, static_files=1, entries=2), 1, live=False)
+
+    assert results["parameters"]["users"] == 2
+    for name in ("render-cold", "render-warm", "feeds", "add", "version"):
+        assert len(results["results"][name]["runs"]) == 1
@@ -0,0 +1,93 @@
+import subprocess
+import sys
+
+# modules that quick commands shouldn't need
+HEAVY_MODULES = {
+    "asyncio",
+    "bs4",
+    "jinja2",
+    "multiprocessing",
+    "notifypy",
+    "PIL",
+    "requests",
+}
+
+# microseconds. generous, because CI machines are slow
+IMPORT_BUDGET = 150_000
+
+
+def test_version(capsys):
+    from beocijies.cli import main
+    from beocijies.version import __version__
+
+    main(["version"])
+    assert capsys.readouterr().out == f"{__version__}\n"
+
+
+def test_version_import_time():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "from beocijies.cli import main; main(['version'])",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    imported = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        imported[name.strip()] = (int(cumulative), not name.startswith("  "))
+
+    heavy = {name for name in imported if name.split(".")[0] in HEAVY_MODULES}
+    assert not heavy
+
+    total = sum(
+        cumulative
+        for name, (cumulative, top_level) in imported.items()
+        if top_level and name.startswith("beocijies")
+    )
+    assert total < IMPORT_BUDGET
+
+
+def test_rollback_without_older_generation(tmp_path):
+    from beocijies.configure import create
+    from beocijies.publish import publish_generation, start_generation
+
+    config_dir = tmp_path / "config"
+    destination = tmp_path / "render"
+    create(config_dir, destination, name="fake-site")
+
+    # only one generation has ever been published
+    destination.rmdir()
+    generation = start_generation(destination)
+    publish_generation(destination, generation)
+
+    # rolling back shouldn't need to load the renderer either
+    arguments = ["rollback", "--directory", str(config_dir), "--production"]
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from beocijies.cli import main\n"
+            "try:\n"
+            f"    main({arguments!r})\n"
+            "finally:\n"
+            "    print(' '.join(sys.modules))\n",
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 1
+    imported = set(result.stdout.split())
+    assert not {name for name in imported if name.split(".")[0] in HEAVY_MODULES}
+    assert "beocijies.render" not in imported
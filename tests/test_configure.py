@@ -148,6 +148,9 @@ def test_add_user(tmp_path: Path):
     sections = (tmp_path / "example.com").read_text().split("server {")
     assert len(sections) == 5  # "", index, user 1–3
     assert not sections[0].strip()
+    for section in sections[1:]:
+        assert "gzip_static on;" in section
+        assert "brotli_static" not in section
     name_found = root_found = False
     for line in sections[1].splitlines():
         line = line.strip()
@@ -318,6 +321,19 @@ def test_add_user(tmp_path: Path):
 
     assert root_found
 
+    # fingerprinted files can be cached forever
+    data["fingerprint"] = True
+    with config.open("w") as stream:
+        json.dump(data, stream)
+    add_user(tmp_path, "user3", nginx=tmp_path, httpd=tmp_path / "httpd.conf")
+
+    for text in (
+        (tmp_path / "m.example.com").read_text(),
+        (tmp_path / "httpd.conf").read_text(),
+    ):
+        assert text.count('"public, max-age=31536000, immutable"') == 1
+        assert text.count('"no-cache"') == 1
+
 
 def test_rename_user(tmp_path: Path):
     from beocijies.configure import FILENAME, add_user, rename_user
@@ -428,6 +444,106 @@ def test_delete_user(tmp_path: Path):
     assert not (templates / "dog.html.jinja2").is_file()
 
 
+def test_batch_users(tmp_path: Path, monkeypatch):
+    import beocijies.configure
+    from beocijies.configure import FILENAME, Feed, User, add_users, delete_users
+
+    static = tmp_path / "static"
+    static.mkdir()
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "#default.html.jinja2").write_text("default")
+
+    config = tmp_path / FILENAME
+    with config.open("w") as stream:
+        json.dump(
+            {
+                "domain": "example.com",
+                "destination": str(tmp_path),
+                "subdomains": True,
+                "users": {"dog": {"feed": "public", "public": True}},
+            },
+            stream,
+        )
+
+    writes = []
+    save_config = beocijies.configure.save_config
+    monkeypatch.setattr(
+        beocijies.configure,
+        "save_config",
+        lambda *args: writes.append("config") or save_config(*args),
+    )
+    monkeypatch.setattr(
+        beocijies.configure,
+        "_write_nginx",
+        lambda directory, config, certbot=True: writes.append(("nginx", certbot)),
+    )
+
+    # nothing changes if any name is bad
+    with raises(ValueError):
+        add_users(tmp_path, [User("cat"), User("#base")], nginx=tmp_path)
+    assert writes == []
+    assert not (static / "cat").exists()
+
+    add_users(
+        tmp_path,
+        [User("index"), User("cat", False), User("dog", feed=Feed.NONE)],
+        nginx=tmp_path,
+    )
+    assert writes == ["config", ("nginx", True)]
+    with config.open() as stream:
+        assert json.load(stream)["users"] == {
+            "index": {"feed": "public"},
+            "cat": {"feed": "personal", "public": False},
+            "dog": {"feed": "none", "public": True},
+        }
+    for name in ("index", "cat", "dog"):
+        assert (static / name).is_dir()
+        assert (templates / f"{name}.html.jinja2").read_text() == "default"
+
+    # updates alone don't need new certificates
+    writes.clear()
+    add_users(tmp_path, [User("cat"), User("dog")], nginx=tmp_path)
+    assert writes == ["config", ("nginx", False)]
+
+    writes.clear()
+    with raises(ValueError):
+        delete_users(tmp_path, ["cat", "bird"], nginx=tmp_path)
+    assert writes == []
+
+    delete_users(tmp_path, ["cat", "dog", "cat"], delete_files=True, nginx=tmp_path)
+    assert writes == ["config", ("nginx", False)]
+    with config.open() as stream:
+        assert json.load(stream)["users"] == {"index": {"feed": "public"}}
+    assert not (static / "cat").exists()
+    assert not (templates / "dog.html.jinja2").exists()
+    assert (static / "index").is_dir()
+
+
+def test_load_users(tmp_path: Path):
+    from beocijies.configure import Feed, User, load_users
+
+    users = tmp_path / "users.csv"
+    users.write_text("name,public,feed\ndog,yes,\ncat,,none\nbird,no,public\n")
+    assert load_users(users, public=False) == [
+        User("dog", True),
+        User("cat", False, Feed.NONE),
+        User("bird", False, Feed.PUBLIC),
+    ]
+
+    users.write_text("username\ndog\n")
+    with raises(ValueError):
+        load_users(users)
+
+    users = tmp_path / "users.json"
+    users.write_text(json.dumps(["dog", {"name": "cat", "public": False}]))
+    assert load_users(users) == [User("dog"), User("cat", False)]
+
+    # the same format as the config file
+    users.write_text(json.dumps({"dog": {"feed": "personal", "public": True}}))
+    assert load_users(users, public=False) == [User("dog", True, Feed.PERSONAL)]
+
+
 def test_create(tmp_path):
     from beocijies.configure import FILENAME, Feed, add_user, create
 
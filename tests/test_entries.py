@@ -0,0 +1,95 @@
+from pytest import importorskip
+
+TRICKY = """<!DOCTYPE html>
+<html><body>
+<p class="h-entry">not <b>this</b> one</p>
+<div class="h-entry x" id="a">
+    <h1 class="p-name">T &amp; <b>x</b><!--c--></h1>
+    <div class="e-content  x" data-a='"hi"' data-b="it's" data-q="a&quot;b'c" hidden>
+        a &amp; b &lt; c &copy; &foo; &#150; &#x1F600; &amp <br> <br/> <div/>
+        <script>if (a < b && c) {}</script><style>p>a{}</style><!-- c -->
+        <p>unclosed <b>bold</i> x</b></p> <img src=x>text</br>
+    </div>
+    <div class="e-content">A<template><p>T</p>t</template>B
+        <ruby>漢<rp>(</rp><rt>kan</rt><rp>)</rp></ruby>
+        <textarea>x&lt;  </textarea><pre>  <b> </b>
+ </pre><![CDATA[cd]]><?php x ?>
+    </div>
+    <article class="h-entry" id="inner">
+        <p class="p-summary"> s </p> &#32;
+        <time class="dt-published" datetime="x"></time>
+    </article>
+</div>
+</span>
+<div class="h-entry"><div class="e-content">after stray</div>
+</body></html>
+"""
+
+
+def test_find_entries():
+    from beocijies.entries import find_entries
+
+    assert find_entries("<p>nothing <b>here</b></p>") == []
+
+    (entry,) = find_entries(
+        '<body><div id="1" class="x h-entry">'
+        '<h1 class="p-name">Hi &amp; <i>bye</i></h1>'
+        '<time class="dt-published" datetime="2025-01-01T00:00:00+0000">'
+        "Jan 1</time>"
+        '<div class="e-content"><p>One<br>two</p><script>x < y</script></div>'
+        "</div></body>"
+    )
+
+    assert entry.name == "div"
+    assert entry.attributes == {"id": "1", "class": "x h-entry"}
+    assert entry.find("p-name").text == "Hi & bye"
+    assert entry.find("dt-published", "time").attributes["datetime"] == (
+        "2025-01-01T00:00:00+0000"
+    )
+    assert entry.find("dt-published", "div") is None
+    assert entry.find("p-summary") is None
+
+    content = entry.find("e-content")
+    assert content.text == "Onetwo"
+    assert str(content) == (
+        '<div class="e-content"><p>One<br/>two</p><script>x < y</script></div>'
+    )
+
+
+def test_find_entries_nested():
+    from beocijies.entries import find_entries
+
+    outer, inner = find_entries(
+        '<div class="h-entry" id="outer"><p>'
+        '<span class="h-entry" id="inner">inside</span></p></div>'
+    )
+
+    assert outer.attributes["id"] == "outer"
+    assert inner.attributes["id"] == "inner"
+    assert [element.name for element in outer.descendants()] == ["p", "span"]
+
+
+def test_find_entries_matches_beautifulsoup():
+    bs4 = importorskip("bs4")
+
+    from beocijies.entries import find_entries
+
+    soup = bs4.BeautifulSoup(TRICKY, "html.parser")
+    expected = soup.select(".h-entry")
+    actual = find_entries(TRICKY)
+
+    assert len(actual) == len(expected)
+
+    for old, new in zip(expected, actual):
+        assert str(new) == str(old)
+        assert new.text == old.text
+
+        for class_name in ("p-name", "p-summary", "e-content"):
+            old_node = old.select_one(f".{class_name}")
+            new_node = new.find(class_name)
+
+            if old_node is None:
+                assert new_node is None
+            else:
+                assert str(new_node) == str(old_node)
+                assert new_node.text == old_node.text
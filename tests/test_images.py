@@ -0,0 +1,130 @@
+"""
+Tests for resizing update images
+"""
+
+from pathlib import Path
+
+from pytest import importorskip
+
+Image = importorskip("PIL.Image")
+
+
+def _photo(path: Path, width: int, height: int):
+    image = Image.new("RGB", (width, height), (200, 100, 50))
+    exif = Image.Exif()
+    exif[0x010F] = "Phone Maker"  # make
+    exif[0x0112] = 6  # orientation: rotated 90°
+    image.save(path, "JPEG", exif=exif)
+
+
+def test_image_processor(tmp_path: Path):
+    from beocijies.images import ImageFormat, ImageProcessor
+    from beocijies.render import Stamp
+
+    processor = ImageProcessor(tmp_path / "cache", (100, 200, 800), (ImageFormat.WEBP,))
+
+    photo = tmp_path / "update-1.jpg"
+    _photo(photo, 600, 300)
+    digest = Stamp.of(photo).digest
+
+    processed = processor.process(photo, digest)
+    assert processed is not None
+
+    # rotated upright, never enlarged
+    assert (processed.width, processed.height) == (300, 600)
+    assert {
+        (variant.format, variant.width, variant.height)
+        for variant in processed.variants
+    } == {
+        (ImageFormat.JPEG, 100, 200),
+        (ImageFormat.JPEG, 200, 400),
+        (ImageFormat.JPEG, 300, 600),
+        (ImageFormat.WEBP, 100, 200),
+        (ImageFormat.WEBP, 200, 400),
+        (ImageFormat.WEBP, 300, 600),
+    }
+
+    for variant in processed.variants:
+        path = processor.path(processed.key, variant)
+        with Image.open(path) as image:
+            assert image.size == (variant.width, variant.height)
+            assert not image.getexif()
+
+    assert processed.context("update-1") == {
+        "latest_image": "update-1-300w.jpg",
+        "latest_image_srcset": (
+            "update-1-100w.jpg 100w, update-1-200w.jpg 200w, update-1-300w.jpg 300w"
+        ),
+        "latest_image_sources": [
+            {
+                "type": "image/webp",
+                "srcset": (
+                    "update-1-100w.webp 100w, "
+                    "update-1-200w.webp 200w, "
+                    "update-1-300w.webp 300w"
+                ),
+            }
+        ],
+    }
+
+    assert processed.context("update-1", fingerprinted=True)["latest_image"] == (
+        f"update-1-300w.{processed.key[:12]}.jpg"
+    )
+
+    # cached images aren't reprocessed
+    cached = processor.path(processed.key, processed.variants[0])
+    modified = cached.stat().st_mtime_ns
+    processor.process_all([(photo, digest)], jobs=2)
+    assert processor.process(photo, digest) == processed
+    assert cached.stat().st_mtime_ns == modified
+
+    # only images that are still used are kept
+    assert processor.prune([digest]) == 0
+    assert cached.exists()
+    assert processor.prune([]) == 1
+    assert not list((tmp_path / "cache").iterdir())
+
+    # but changing the settings does
+    other = ImageProcessor(tmp_path / "cache", (150,), ())
+    assert other.key(digest) != processed.key
+
+    # broken images are remembered
+    broken = tmp_path / "update-2.jpg"
+    broken.write_bytes(b"not an image")
+    broken_digest = Stamp.of(broken).digest
+    assert processor.process(broken, broken_digest) is None
+    assert processor.cached(processor.key(broken_digest))["error"]
+    assert processor.process(broken, broken_digest) is None
+
+
+def test_process_all(tmp_path: Path):
+    from beocijies.images import ImageProcessor
+    from beocijies.render import Stamp
+
+    processor = ImageProcessor(tmp_path / "cache", (50,), ())
+
+    images = []
+    for number in range(1, 4):
+        photo = tmp_path / f"update-{number}.jpg"
+        _photo(photo, 100 * number, 100)
+        images.append((photo, Stamp.of(photo).digest))
+
+    processor.process_all(images, jobs=2)
+
+    for _, digest in images:
+        assert processor.cached(processor.key(digest))["variants"]
+
+
+def test_latest_update(tmp_path: Path):
+    from beocijies.images import latest_update, update_number
+
+    assert latest_update(tmp_path / "missing") is None
+    assert latest_update(tmp_path) is None
+
+    for name in ("update-2.jpg", "update-10.png", "update-9.jpg", "updates.txt"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "update-11").mkdir()
+
+    assert latest_update(tmp_path) == tmp_path / "update-10.png"
+    assert update_number(tmp_path / "update-3.heic") == 3
+    assert update_number(tmp_path / "update-three.jpg") is None
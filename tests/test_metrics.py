@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import pytest
+
+
+def test_metrics(tmp_path: Path):
+    from beocijies.metrics import (
+        BROKEN_PAGES,
+        PAGES_RENDERED,
+        RENDER_DURATION,
+        RENDERS,
+        Metrics,
+    )
+
+    metrics = Metrics(tmp_path / "metrics" / "beocijies.prom")
+
+    lines = metrics.text().splitlines()
+    assert "# TYPE beocijies_renders_total counter" in lines
+    assert "beocijies_renders_total 0" in lines
+    assert not any(line.startswith("beocijies_pages_rendered") for line in lines)
+    assert not any(line.startswith("beocijies_render_duration") for line in lines)
+
+    metrics.increment(RENDERS)
+    metrics.increment(PAGES_RENDERED, user="dog")
+    metrics.increment(PAGES_RENDERED, 2, user="dog")
+    metrics.increment(PAGES_RENDERED, user='"cat"\n')
+    metrics.set(BROKEN_PAGES, 3)
+    metrics.observe(RENDER_DURATION, 0.02)
+    metrics.observe(RENDER_DURATION, 0.3)
+    metrics.observe(RENDER_DURATION, 100)
+
+    lines = metrics.text().splitlines()
+    assert "beocijies_renders_total 1" in lines
+    assert 'beocijies_pages_rendered_total{user="dog"} 3' in lines
+    assert 'beocijies_pages_rendered_total{user="\\"cat\\"\\n"} 1' in lines
+    assert "beocijies_broken_pages 3" in lines
+    assert 'beocijies_render_duration_seconds_bucket{le="0.01"} 0' in lines
+    assert 'beocijies_render_duration_seconds_bucket{le="0.025"} 1' in lines
+    assert 'beocijies_render_duration_seconds_bucket{le="0.5"} 2' in lines
+    assert 'beocijies_render_duration_seconds_bucket{le="60"} 2' in lines
+    assert 'beocijies_render_duration_seconds_bucket{le="+Inf"} 3' in lines
+    assert "beocijies_render_duration_seconds_sum 100.32" in lines
+    assert "beocijies_render_duration_seconds_count 3" in lines
+
+    metrics.heartbeat()
+    assert (tmp_path / "metrics" / "beocijies.prom").read_text() == metrics.text()
+
+
+def test_metrics_serve():
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+
+    from beocijies.metrics import RENDERS, Metrics
+
+    metrics = Metrics(port=0)
+    metrics.serve()
+    try:
+        metrics.increment(RENDERS)
+        port = metrics._server.server_address[1]
+
+        with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert response.read().decode("utf-8") == metrics.text()
+
+        with pytest.raises(HTTPError):
+            urlopen(f"http://127.0.0.1:{port}/other")
+    finally:
+        metrics.close()
+
+    assert metrics._server is None
+
+
+def test_render_metrics(tmp_path: Path):
+    from beocijies.configure import add_user, create
+    from beocijies.render import render
+
+    config_dir = tmp_path / "config"
+    render_dir = tmp_path / "render"
+    metrics_file = tmp_path / "beocijies.prom"
+
+    create(config_dir, render_dir, name="fake-site")
+    add_user(config_dir, "dog")
+    (config_dir / "static" / "dog" / "bone.txt").write_text("bone")
+
+    render(config_dir, metrics_file=metrics_file)
+
+    lines = metrics_file.read_text().splitlines()
+    assert "beocijies_renders_total 1" in lines
+    assert 'beocijies_pages_rendered_total{user="dog"} 1' in lines
+    assert 'beocijies_pages_rendered_total{user="index"} 1' in lines
+    assert "beocijies_broken_pages 0" in lines
+    assert "beocijies_render_duration_seconds_count 1" in lines
+    assert any(line.startswith("beocijies_files_copied_total ") for line in lines)
+    assert any(line.startswith("beocijies_last_render_timestamp") for line in lines)
+
+    (config_dir / "templates" / "dog.html.jinja2").write_text("{% broken %}")
+
+    with pytest.raises(Exception):
+        render(config_dir, metrics_file=metrics_file)
+
+    lines = metrics_file.read_text().splitlines()
+    assert 'beocijies_page_failures_total{user="dog"} 1' in lines
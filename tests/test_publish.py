@@ -0,0 +1,191 @@
+"""
+Tests for publishing rendered files
+"""
+
+import gzip
+import os
+import re
+from pathlib import Path
+
+from pytest import raises
+
+
+def test_write_file(tmp_path: Path):
+    from beocijies.publish import write_file
+
+    path = tmp_path / "index.html"
+
+    write_file(path, "hello")
+    assert path.read_text() == "hello"
+
+    old_inode = path.stat().st_ino
+    write_file(path, b"goodbye")
+    assert path.read_bytes() == b"goodbye"
+
+    # replaced, not rewritten in place
+    assert path.stat().st_ino != old_inode
+
+    # no leftover temporary files
+    assert list(tmp_path.iterdir()) == [path]
+
+    # unchanged files are left alone
+    os.utime(path, ns=(0, 0))
+    assert not write_file(path, "goodbye")
+    assert path.stat().st_mtime_ns == 0
+
+    assert write_file(path, "hello")
+    assert path.stat().st_mtime_ns != 0
+
+    # permissions respect the umask (not tempfile's 0600)
+    umask = os.umask(0o022)
+    os.umask(umask)
+    assert path.stat().st_mode & 0o777 == 0o666 & ~umask
+
+
+def test_write_file_compressed(tmp_path: Path):
+    from beocijies.publish import Compression, write_file
+
+    path = tmp_path / "index.html"
+    sidecar = tmp_path / "index.html.gz"
+
+    write_file(path, "hello " * 100, [Compression.GZIP])
+    assert path.read_text() == "hello " * 100
+    assert gzip.decompress(sidecar.read_bytes()) == b"hello " * 100
+
+    # unchanged files don't get recompressed
+    inode = sidecar.stat().st_ino
+    write_file(path, "hello " * 100, [Compression.GZIP])
+    assert sidecar.stat().st_ino == inode
+
+    # but changed ones do
+    write_file(path, "goodbye " * 100, [Compression.GZIP])
+    assert sidecar.stat().st_ino != inode
+    assert gzip.decompress(sidecar.read_bytes()) == b"goodbye " * 100
+
+    # and missing ones are replaced
+    sidecar.unlink()
+    write_file(path, "goodbye " * 100, [Compression.GZIP])
+    assert gzip.decompress(sidecar.read_bytes()) == b"goodbye " * 100
+
+    # compression is deterministic
+    compressed = sidecar.read_bytes()
+    sidecar.unlink()
+    write_file(path, "goodbye " * 100, [Compression.GZIP])
+    assert sidecar.read_bytes() == compressed
+
+    # tiny files aren't worth compressing
+    write_file(path, "hi", [Compression.GZIP])
+    assert not sidecar.exists()
+
+
+def test_fingerprint():
+    from beocijies.publish import FINGERPRINT_PATTERN, fingerprint
+
+    digest = "0123456789abcdef" * 4
+
+    assert fingerprint("style.css", digest) == "style.0123456789ab.css"
+    assert fingerprint("fonts/comic.ttf", digest) == "fonts/comic.0123456789ab.ttf"
+    assert fingerprint("README", digest) == "README.0123456789ab"
+
+    assert re.search(FINGERPRINT_PATTERN, fingerprint("style.css", digest))
+    assert re.search(FINGERPRINT_PATTERN, fingerprint("README", digest))
+    assert not re.search(FINGERPRINT_PATTERN, "style.css")
+    assert not re.search(FINGERPRINT_PATTERN, "update-3.jpg")
+
+
+def test_publish_file(tmp_path: Path):
+    from beocijies.publish import PublishMode, publish_file
+
+    source = tmp_path / "source.jpg"
+    source.write_bytes(b"photo")
+    os.utime(source, (0, 1000))
+
+    # everything should be able to fall back to a copy
+    for mode in PublishMode:
+        target = tmp_path / f"{mode.value}.jpg"
+
+        strategy = publish_file(source, target, mode)
+        assert target.read_bytes() == b"photo"
+        assert target.stat().st_mtime == 1000
+
+        if mode == PublishMode.AUTO:
+            # hardlinks have to be asked for
+            assert strategy != PublishMode.HARDLINK
+        elif mode == PublishMode.HARDLINK:
+            # same filesystem
+            assert strategy == PublishMode.HARDLINK
+        else:
+            assert list(PublishMode).index(strategy) >= list(PublishMode).index(mode)
+
+        if strategy == PublishMode.HARDLINK:
+            assert target.stat().st_ino == source.stat().st_ino
+        else:
+            assert target.stat().st_ino != source.stat().st_ino
+
+        # replacing works too
+        assert publish_file(source, target, mode) == strategy
+        assert target.read_bytes() == b"photo"
+
+    assert len(list(tmp_path.iterdir())) == len(PublishMode) + 1
+
+    target = tmp_path / "copy.jpg"
+    with raises(FileNotFoundError):
+        publish_file(tmp_path / "missing.jpg", target)
+    assert target.read_bytes() == b"photo"
+    assert len(list(tmp_path.iterdir())) == len(PublishMode) + 1
+
+
+def test_generations(tmp_path: Path):
+    from beocijies.publish import (
+        generations_directory,
+        prune_generations,
+        publish_generation,
+        rollback,
+        start_generation,
+    )
+
+    destination = tmp_path / "site"
+    destination.mkdir()
+    (destination / "index.html").write_text("original")
+
+    with raises(ValueError):
+        rollback(destination)
+
+    # an existing site is kept as the first generation
+    first = start_generation(destination)
+    assert first.parent == generations_directory(destination)
+    (first / "index.html").write_text("first")
+    assert (destination / "index.html").read_text() == "original"
+    publish_generation(destination, first, keep=3)
+    assert destination.is_symlink()
+    assert (destination / "index.html").read_text() == "first"
+
+    second = start_generation(destination)
+    (second / "index.html").write_text("second")
+    publish_generation(destination, second, keep=3)
+    assert (destination / "index.html").read_text() == "second"
+
+    third = start_generation(destination)
+    (third / "index.html").write_text("third")
+    publish_generation(destination, third, keep=3)
+    assert (destination / "index.html").read_text() == "third"
+
+    # only 3 generations are kept
+    prune_generations(destination, keep=3).join()
+    assert sorted(generations_directory(destination).iterdir()) == [
+        first,
+        second,
+        third,
+    ]
+
+    # roll back
+    assert rollback(destination) == second
+    assert (destination / "index.html").read_text() == "second"
+    assert rollback(destination) == first
+    assert (destination / "index.html").read_text() == "first"
+    assert rollback(destination) is None
+    assert (destination / "index.html").read_text() == "first"
+
+    # unpublished generations get cleaned up too
+    prune_generations(destination, keep=1).join()
+    assert sorted(generations_directory(destination).iterdir()) == [first]
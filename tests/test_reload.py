@@ -0,0 +1,75 @@
+import socket
+from pathlib import Path
+
+
+def test_add_reload_snippet():
+    from beocijies.reload import add_reload_snippet
+
+    page = add_reload_snippet(
+        "<html><body><p>woof</p></BODY></html>", "http://127.0.0.1:1234", "dog"
+    )
+    assert page.startswith("<html><body><p>woof</p><script>")
+    assert 'new EventSource("http://127.0.0.1:1234/events/dog")' in page
+    assert page.endswith("</script>\n</BODY></html>")
+
+    # fragments just get it added to the end
+    assert add_reload_snippet("woof", "http://127.0.0.1:1234", "dog").startswith(
+        "woof<script>"
+    )
+
+
+def _request(port: int, path: str) -> socket.socket:
+    connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+    connection.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    return connection
+
+
+def _read_until(connection: socket.socket, marker: bytes) -> bytes:
+    data = b""
+    while marker not in data:
+        chunk = connection.recv(1024)
+        assert chunk, data
+        data += chunk
+    return data
+
+
+def test_reload_server():
+    from beocijies.reload import ReloadServer
+
+    with ReloadServer(port=0) as server:
+        assert server.port != 0
+
+        with _request(server.port, "/other") as connection:
+            assert _read_until(connection, b"\r\n\r\n").startswith(
+                b"HTTP/1.1 404 Not Found\r\n"
+            )
+
+        with _request(server.port, "/events/dog") as connection:
+            headers = _read_until(connection, b"retry: 1000\n\n")
+            assert headers.startswith(b"HTTP/1.1 200 OK\r\n")
+            assert b"Content-Type: text/event-stream\r\n" in headers
+            assert b"Access-Control-Allow-Origin: *\r\n" in headers
+
+            server.reload(["cat"])
+            server.reload(["dog"])
+            assert _read_until(connection, b"\n\n") == b"data: reload\n\n"
+
+
+def test_render_reload_needs_live(tmp_path: Path, caplog):
+    from beocijies.configure import add_user, create
+    from beocijies.render import render
+
+    config_dir = tmp_path / "config"
+
+    create(
+        config_dir,
+        tmp_path / "render",
+        name="fake-site",
+        test_destination=tmp_path / "test",
+    )
+    add_user(config_dir, "dog")
+
+    render(config_dir, reload_port=0)
+
+    assert "only reload for live renders" in caplog.text
+    assert "EventSource" not in (tmp_path / "test" / "dog" / "index.html").read_text()
@@ -1,7 +1,9 @@
+import gzip
 import json
+import os
 from pathlib import Path
 
-from pytest import raises
+from pytest import importorskip, raises
 
 FIXTURES = Path(__file__).parent / "fixtures"
 
@@ -42,6 +44,18 @@ def test_render(tmp_path: Path):
     assert (test_dir / "secret" / "index.html").is_file()
     assert (test_dir / "secret" / "index.html").read_text() == "secret"
 
+    # precompressed for the web server (unless it wouldn't help)
+    assert gzip.decompress((test_dir / "index.html.gz").read_bytes()) == (
+        (test_dir / "index.html").read_bytes()
+    )
+    assert gzip.decompress((test_dir / "rss.xml.gz").read_bytes()) == (
+        (test_dir / "rss.xml").read_bytes()
+    )
+    assert gzip.decompress((test_dir / "dog" / "atom.xml.gz").read_bytes()) == (
+        (test_dir / "dog" / "atom.xml").read_bytes()
+    )
+    assert not (test_dir / "users.json.gz").exists()
+
     # force absolute, subset
     (test_dir / "secret" / "index.html").unlink()
     render(config_dir, link_type=LinkType.ABSOLUTE, users=["dog"])
@@ -394,3 +408,793 @@ def test_parse_entries(tmp_path: Path):
         "beocijies",
         user="bcj",
     )
+
+
+def test_template_graph(tmp_path: Path):
+    from jinja2 import Environment, FileSystemLoader
+
+    from beocijies.render import TemplateGraph
+
+    (tmp_path / "#base.html.jinja2").write_text(
+        '<html>{% include "header.html" %}{% block body %}{% endblock %}</html>'
+    )
+    (tmp_path / "header.html").write_text("<h1>hi</h1>")
+    (tmp_path / "dog.html.jinja2").write_text(
+        '{% extends "#base.html.jinja2" %}{% block body %}woof{% endblock %}'
+    )
+    (tmp_path / "cat.html.jinja2").write_text(
+        '{% import "macros.html" as macros %}{% include name %}'
+    )
+
+    graph = TemplateGraph(Environment(loader=FileSystemLoader(tmp_path)), tmp_path)
+
+    assert graph.references("dog.html.jinja2") == {"#base.html.jinja2"}
+    assert graph.references("#base.html.jinja2") == {"header.html"}
+    assert graph.references("header.html") == set()
+    # dynamic references can't be tracked, missing templates are fine
+    assert graph.references("cat.html.jinja2") == {"macros.html"}
+    assert graph.references("macros.html") == set()
+
+    assert graph.dependencies("dog.html.jinja2") == {
+        tmp_path / "#base.html.jinja2",
+        tmp_path / "header.html",
+    }
+    assert graph.dependencies("cat.html.jinja2") == {tmp_path / "macros.html"}
+
+    # edits are picked up
+    (tmp_path / "header.html").write_text('{% include "#base.html.jinja2" %}')
+    os.utime(tmp_path / "header.html", (0, 0))
+    assert graph.dependencies("dog.html.jinja2") == {
+        tmp_path / "#base.html.jinja2",
+        tmp_path / "header.html",
+    }
+    assert graph.dependencies("header.html") == {tmp_path / "#base.html.jinja2"}
+
+
+def test_render_jobs(tmp_path: Path):
+    from jinja2 import TemplateSyntaxError
+
+    from beocijies.configure import add_user, create
+    from beocijies.render import render
+
+    config_dir = tmp_path / "config"
+    serial = tmp_path / "serial"
+    parallel = tmp_path / "parallel"
+
+    create(config_dir, tmp_path / "render", name="fake-site", domain="example.com")
+    (config_dir / "templates" / "#default.html.jinja2").write_text(
+        '{% extends "#base.html.jinja2" %}{% block body %}{{user(me)}}{% endblock %}'
+    )
+    for name in ("cat", "dog", "fish", "snake"):
+        add_user(config_dir, name, public=True)
+        (config_dir / "static" / name / "update-1.jpg").write_bytes(b"")
+
+    render(config_dir, destination=serial)
+    render(config_dir, destination=parallel, jobs=3)
+
+    for name in ("index", "cat", "dog", "fish", "snake"):
+        path = Path() if name == "index" else Path(name)
+        assert (parallel / path / "index.html").read_text() == (
+            serial / path / "index.html"
+        ).read_text()
+
+        if name != "index":
+            assert (parallel / path / "update-1.jpg").is_file()
+
+    assert (parallel / "atom.xml").is_file()
+    assert (parallel / "dog" / "atom.xml").is_file()
+
+    # errors are still raised
+    (config_dir / "templates" / "dog.html.jinja2").write_text("{% block %}")
+    with raises(TemplateSyntaxError):
+        render(config_dir, destination=parallel, jobs=2)
+
+
+def test_render_manifest(tmp_path: Path, caplog):
+    from beocijies.configure import MANIFEST_FILENAME, add_user, create
+    from beocijies.render import LinkType, render
+
+    config_dir = tmp_path / "config"
+    render_dir = tmp_path / "render"
+
+    create(config_dir, render_dir, name="fake-site", domain="example.com")
+    add_user(config_dir, "dog", public=True)
+    template = config_dir / "templates" / "dog.html.jinja2"
+    template.write_text("woof")
+    image = config_dir / "static" / "dog" / "update-1.jpg"
+    image.write_bytes(b"photo")
+
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=True)
+    assert "rendering page for dog" in caplog.messages
+    assert any(message.startswith(f"copying {image} (") for message in caplog.messages)
+    assert (config_dir / MANIFEST_FILENAME).is_file()
+    assert (render_dir / "dog" / "index.html").read_text() == "woof"
+
+    # nothing changed, nothing to do
+    caplog.clear()
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=True)
+    assert "rendering page for dog" not in caplog.messages
+    assert not any(message.startswith("copying") for message in caplog.messages)
+
+    # touching without changing doesn't count
+    os.utime(template, ns=(0, template.stat().st_mtime_ns + 1))
+    caplog.clear()
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=True)
+    assert "rendering page for dog" not in caplog.messages
+
+    # but two saves in the same second do
+    modified = template.stat().st_mtime_ns
+    template.write_text("bark")
+    os.utime(template, ns=(0, modified + 1))
+    caplog.clear()
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=True)
+    assert "rendering page for dog" in caplog.messages
+    assert not any(message.startswith("copying") for message in caplog.messages)
+    assert (render_dir / "dog" / "index.html").read_text() == "bark"
+
+    # missing outputs are replaced
+    (render_dir / "dog" / "index.html").unlink()
+    (render_dir / "dog" / "update-1.jpg").unlink()
+    caplog.clear()
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=True)
+    assert "rendering page for dog" in caplog.messages
+    assert any(message.startswith(f"copying {image} (") for message in caplog.messages)
+    assert (render_dir / "dog" / "index.html").read_text() == "bark"
+    assert (render_dir / "dog" / "update-1.jpg").read_bytes() == b"photo"
+
+    # changing settings rerenders
+    caplog.clear()
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=True, link_type=LinkType.ABSOLUTE)
+    assert "rendering page for dog" in caplog.messages
+    assert not any(message.startswith("copying") for message in caplog.messages)
+
+    # other destinations are tracked separately
+    caplog.clear()
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=tmp_path / "other")
+    assert "rendering page for dog" in caplog.messages
+    assert (tmp_path / "other" / "dog" / "index.html").read_text() == "bark"
+
+    # fresh renders start from scratch
+    caplog.clear()
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=True, fresh=True)
+    assert "rendering page for dog" in caplog.messages
+    assert any(message.startswith(f"copying {image} (") for message in caplog.messages)
+
+    # the fresh render was swapped in and is tracked where it's served
+    assert render_dir.is_symlink()
+    caplog.clear()
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir, destination=True)
+    assert "rendering page for dog" not in caplog.messages
+    assert not any(message.startswith("copying") for message in caplog.messages)
+
+
+def test_render_images(tmp_path: Path):
+    importorskip("PIL")
+    from PIL import Image
+
+    from beocijies.configure import add_user, create
+    from beocijies.render import render
+
+    config_dir = tmp_path / "config"
+    render_dir = tmp_path / "render"
+
+    create(config_dir, render_dir, name="fake-site", image_widths=(100, 400))
+    add_user(config_dir, "dog", public=True)
+    Image.new("RGB", (200, 100)).save(config_dir / "static" / "dog" / "update-1.jpg")
+
+    render(config_dir)
+
+    text = (render_dir / "dog" / "index.html").read_text()
+    assert 'src="update-1-200w.jpg"' in text
+    assert 'srcset="update-1-100w.jpg 100w, update-1-200w.jpg 200w"' in text
+    for name in ("update-1.jpg", "update-1-100w.jpg", "update-1-200w.jpg"):
+        assert (render_dir / "dog" / name).is_file()
+
+    cache = config_dir / "cache" / "images"
+    assert len(list(cache.glob("*/*.json"))) == 1
+
+    # new images replace the old ones (in the cache too)
+    Image.new("RGB", (50, 50)).save(config_dir / "static" / "dog" / "update-2.jpg")
+    render(config_dir)
+    text = (render_dir / "dog" / "index.html").read_text()
+    assert 'src="update-2-50w.jpg"' in text
+    cached = list(cache.glob("*/*"))
+    assert len([path for path in cached if path.suffix == ".json"]) == 1
+    assert not [path for path in cached if "-100w" in path.name]
+
+    # images that can't be processed are used as-is
+    (config_dir / "static" / "dog" / "update-3.jpg").write_bytes(b"")
+    render(config_dir)
+    text = (render_dir / "dog" / "index.html").read_text()
+    assert 'src="update-3.jpg"' in text
+    assert "srcset" not in text
+
+
+def test_render_fingerprint(tmp_path: Path):
+    from beocijies.configure import add_user, create
+    from beocijies.publish import fingerprint
+    from beocijies.render import Stamp, render
+
+    config_dir = tmp_path / "config"
+    render_dir = tmp_path / "render"
+
+    create(config_dir, render_dir, name="fake-site", image_widths=(), fingerprint=True)
+    add_user(config_dir, "dog", public=True)
+
+    static = config_dir / "static" / "dog"
+    (static / "update-1.jpg").write_bytes(b"woof")
+    (static / "css").mkdir()
+    (static / "css" / "style.css").write_text("body { color: red; }")
+    (config_dir / "templates" / "dog.html.jinja2").write_text(
+        "{{asset('css/style.css')}} {{asset('./missing.css')}} {{latest_image}}"
+    )
+
+    render(config_dir)
+
+    style = fingerprint("css/style.css", Stamp.of(static / "css" / "style.css").digest)
+    image = fingerprint("update-1.jpg", Stamp.of(static / "update-1.jpg").digest)
+    assert (render_dir / "dog" / "index.html").read_text() == (
+        f"{style} ./missing.css {image}"
+    )
+
+    # the originals are still available
+    for name in ("css/style.css", style, "update-1.jpg", image):
+        assert (render_dir / "dog" / name).is_file()
+
+    # changes get a new name
+    (static / "css" / "style.css").write_text("body { color: blue; }")
+    render(config_dir)
+
+    new_style = fingerprint(
+        "css/style.css", Stamp.of(static / "css" / "style.css").digest
+    )
+    assert new_style != style
+    assert (render_dir / "dog" / "index.html").read_text() == (
+        f"{new_style} ./missing.css {image}"
+    )
+    assert (render_dir / "dog" / new_style).read_text() == "body { color: blue; }"
+
+    # old versions are removed
+    assert not (render_dir / "dog" / style).exists()
+    assert not (render_dir / "dog" / f"{style}.gz").exists()
+    (static / "update-1.jpg").unlink()
+    render(config_dir)
+    assert not (render_dir / "dog" / image).exists()
+    assert (render_dir / "dog" / new_style).exists()
+
+
+def test_compile_templates(tmp_path: Path, caplog):
+    import logging
+
+    from beocijies.configure import add_user, create
+    from beocijies.render import compile_templates, render
+
+    caplog.set_level(logging.DEBUG, logger="beocijies")
+
+    config_dir = tmp_path / "config"
+    render_dir = tmp_path / "render"
+
+    create(config_dir, render_dir, name="fake-site")
+    add_user(config_dir, "dog", public=True)
+    template = config_dir / "templates" / "dog.html.jinja2"
+    template.write_text("woof")
+
+    # compiled templates are cached between renders
+    render(config_dir)
+    assert list((config_dir / "cache" / "jinja").iterdir())
+
+    archive = compile_templates(config_dir)
+    assert archive.is_file()
+
+    caplog.clear()
+    template.write_text("bark")
+    render(config_dir)
+    assert "using precompiled templates" not in caplog.text
+    assert (render_dir / "dog" / "index.html").read_text() == "bark"
+
+    compile_templates(config_dir)
+    caplog.clear()
+    (render_dir / "dog" / "index.html").unlink()
+    render(config_dir)
+    assert "using precompiled templates" in caplog.text
+    assert (render_dir / "dog" / "index.html").read_text() == "bark"
+
+    # broken templates can't be compiled
+    template.write_text("{% if %}")
+    with raises(Exception):
+        compile_templates(config_dir)
+    assert not list((config_dir / "cache").glob(".*.tmp"))
+
+
+def test_feed_refresher():
+    from threading import Event
+
+    from beocijies.render import FeedRefresher
+
+    class FakeFeeds:
+        def __init__(self):
+            self.calls = []
+            self.texts = []
+            self.called = Event()
+
+        def refresh(self, updated, users, digests, texts):
+            assert updated == users
+            assert digests == {user: "abc" for user in updated if user == "dog"}
+            self.calls.append(set(updated))
+            self.texts.append(texts)
+            self.called.set()
+
+            if "broken" in updated:
+                raise ValueError("oh no")
+
+    feeds = FakeFeeds()
+    refresher = FeedRefresher(feeds, interval=0.5)  # type: ignore
+
+    # the first refresh happens right away
+    refresher.refresh({"dog": "abc"}, {"dog": "woof"})
+    assert feeds.called.wait(timeout=0.4)
+    assert feeds.calls == [{"dog"}]
+    assert feeds.texts == [{"dog": "woof"}]
+
+    # later ones are batched (dropping contents that are out of date)
+    feeds.called.clear()
+    refresher.refresh({"cat": None, "dog": "abc"}, {"cat": "meow", "dog": "bark"})
+    refresher.refresh({"dog": "abc", "broken": None})
+    assert feeds.called.wait(timeout=2)
+    assert feeds.calls == [{"dog"}, {"cat", "dog", "broken"}]
+    assert feeds.texts[1] == {"cat": "meow"}
+
+    # errors don't stop refreshing, and closing finishes pending work
+    refresher.refresh({"cat": None})
+    refresher.close()
+    assert feeds.calls == [{"dog"}, {"cat", "dog", "broken"}, {"cat"}]
+
+
+def test_feeds(tmp_path: Path):
+    from hashlib import sha256
+
+    from beocijies.configure import add_user, create
+    from beocijies.render import Feeds, render
+    from beocijies.updates import UpdateStore
+
+    config_dir = tmp_path / "config"
+    render_dir = tmp_path / "render"
+
+    create(config_dir, render_dir, name="fake-site", compress=())
+    add_user(config_dir, "dog", public=True)
+    (config_dir / "static" / "dog" / "update-1.jpg").write_bytes(b"")
+    entry = (
+        '<div class="h-entry" id="1">'
+        '<time class="dt-published" datetime="2025-01-02T03:04:05-0600"></time>'
+        '<div class="e-content">{}</div></div>'
+    )
+    (config_dir / "templates" / "dog.html.jinja2").write_text(entry.format("woof"))
+    render(config_dir)
+
+    atom = (render_dir / "dog" / "atom.xml").read_text()
+    assert "woof" in atom
+
+    # refreshing just one user's feed only touches that user
+    (render_dir / "dog" / "index.html").write_text(entry.format("bark"))
+    with (config_dir / "settings.json").open() as stream:
+        users = json.load(stream)["users"]
+    feeds = Feeds(config_dir, render_dir, "fake-site", "https://localhost", users)
+    feeds.refresh({"dog"}, {"dog"})
+
+    assert "bark" in (render_dir / "dog" / "atom.xml").read_text()
+    assert "bark" in (render_dir / "atom.xml").read_text()
+    feeds.close()
+
+    store = UpdateStore(config_dir / "updates.sqlite3")
+    assert "bark" in store.entries("dog")["1"]["contents"]
+    assert store.page("dog") is not None
+    store.close()
+    assert not (config_dir / "cache" / "entries.json").exists()
+
+    # pages with a known digest aren't reparsed if they haven't changed
+    digest = sha256(entry.format("bark").encode("utf-8")).hexdigest()
+    (render_dir / "dog" / "index.html").write_text(entry.format("howl"))
+    feeds = Feeds(config_dir, render_dir, "fake-site", "https://localhost", users)
+    feeds.refresh({"dog"}, {"dog"}, {"dog": digest})
+    assert "bark" in (render_dir / "dog" / "atom.xml").read_text()
+
+    feeds.refresh({"dog"}, {"dog"}, {"dog": "different"})
+    assert "howl" in (render_dir / "dog" / "atom.xml").read_text()
+
+    # pages that were just rendered don't need to be read
+    feeds.refresh({"dog"}, {"dog"}, {"dog": "new"}, {"dog": entry.format("yip")})
+    assert "yip" in (render_dir / "dog" / "atom.xml").read_text()
+    feeds.close()
+
+
+def test_build_atom_archives(tmp_path: Path):
+    from xml.etree import ElementTree
+
+    from beocijies.render import build_atom, build_rss
+
+    namespaces = {
+        "atom": "http://www.w3.org/2005/Atom",
+        "fh": "http://purl.org/syndication/history/1.0",
+    }
+
+    def post(number):
+        return {
+            "id": str(number),
+            "url": f"https://localhost/dog/index.html#{number}",
+            "published": f"2025-01-{number:02}T00:00:00+0000",
+            "updated": f"2025-01-{number:02}T00:00:00+0000",
+            "contents": f"post {number}",
+        }
+
+    def read(name):
+        root = ElementTree.parse(tmp_path / "dog" / name).getroot()
+        links = {
+            link.get("rel"): link.get("href")
+            for link in root.findall("atom:link", namespaces)
+        }
+        ids = [entry.text for entry in root.findall("atom:entry/atom:id", namespaces)]
+        archived = root.find("fh:archive", namespaces) is not None
+
+        return links, [int(entry.rsplit("#", 1)[1]) for entry in ids], archived
+
+    (tmp_path / "dog").mkdir()
+    posts = [post(number) for number in range(7, 0, -1)]
+
+    build_atom(posts, tmp_path, "site", "https://localhost/dog/", user="dog", limit=3)
+
+    links, numbers, archived = read("atom.xml")
+    assert numbers == [7, 6, 5]
+    assert not archived
+    assert links == {
+        "self": "https://localhost/dog/atom.xml",
+        "prev-archive": "https://localhost/dog/atom-archive-2.xml",
+    }
+
+    # archives are filled from the oldest post
+    links, numbers, archived = read("atom-archive-1.xml")
+    assert numbers == [3, 2, 1]
+    assert archived
+    assert links == {
+        "self": "https://localhost/dog/atom-archive-1.xml",
+        "current": "https://localhost/dog/atom.xml",
+        "next-archive": "https://localhost/dog/atom-archive-2.xml",
+    }
+
+    links, numbers, archived = read("atom-archive-2.xml")
+    assert numbers == [4]
+    assert links == {
+        "self": "https://localhost/dog/atom-archive-2.xml",
+        "current": "https://localhost/dog/atom.xml",
+        "prev-archive": "https://localhost/dog/atom-archive-1.xml",
+    }
+
+    # feeds are only as new as their newest post, so unchanged feeds
+    # aren't rewritten
+    def updated(name):
+        root = ElementTree.parse(tmp_path / "dog" / name).getroot()
+        return root.find("atom:updated", namespaces).text
+
+    assert updated("atom.xml") == "2025-01-07T00:00:00Z"
+    assert updated("atom-archive-1.xml") == "2025-01-03T00:00:00Z"
+
+    os.utime(tmp_path / "dog" / "atom.xml", ns=(0, 0))
+    build_atom(posts, tmp_path, "site", "https://localhost/dog/", user="dog", limit=3)
+    assert (tmp_path / "dog" / "atom.xml").stat().st_mtime_ns == 0
+
+    # archives that aren't needed anymore are removed
+    build_atom(posts, tmp_path, "site", "https://localhost/dog/", user="dog", limit=5)
+    assert read("atom-archive-1.xml")[1] == [2, 1]
+    assert not (tmp_path / "dog" / "atom-archive-2.xml").exists()
+
+    build_atom(posts, tmp_path, "site", "https://localhost/dog/", user="dog")
+    links, numbers, _ = read("atom.xml")
+    assert numbers == [7, 6, 5, 4, 3, 2, 1]
+    assert "prev-archive" not in links
+    assert not (tmp_path / "dog" / "atom-archive-1.xml").exists()
+
+    # rss can't be paged
+    build_rss(posts, tmp_path, "site", "https://localhost/dog/", user="dog", limit=3)
+    root = ElementTree.parse(tmp_path / "dog" / "rss.xml").getroot()
+    assert [guid.text[-1] for guid in root.iter("guid")] == ["7", "6", "5"]
+    assert root.find("channel/lastBuildDate").text == "Tue, 07 Jan 2025 00:00:00 +0000"
+
+
+def test_feeds_global(tmp_path: Path):
+    from xml.etree import ElementTree
+
+    from beocijies.render import Feeds
+
+    def write_page(user, *days):
+        (tmp_path / "static" / user).mkdir(parents=True, exist_ok=True)
+        (tmp_path / "site" / user).mkdir(parents=True, exist_ok=True)
+        (tmp_path / "site" / user / "index.html").write_text(
+            "".join(
+                f'<article class="h-entry" id="{day}">'
+                '<time class="dt-published" '
+                f'datetime="2025-01-{day:02}T00:00:00+0000"></time>'
+                f'<div class="e-content">{user} {day}</div></article>'
+                for day in days
+            )
+        )
+
+    def global_feed():
+        root = ElementTree.parse(tmp_path / "site" / "atom.xml").getroot()
+        return [
+            content.text
+            for content in root.iter("{http://www.w3.org/2005/Atom}content")
+        ]
+
+    users = {
+        "index": {"feed": "public"},
+        "dog": {"feed": "public"},
+        "cat": {"feed": "public"},
+        "bird": {"feed": "personal"},
+    }
+    feeds = Feeds(
+        tmp_path, tmp_path / "site", "site", "https://localhost", users, entries=3
+    )
+
+    write_page("dog", 1, 4, 6)
+    write_page("cat", 2, 3, 5)
+    write_page("bird", 7, 8)
+    feeds.refresh({"dog", "cat", "bird"}, set())
+
+    # the newest posts from public users only
+    assert global_feed() == [
+        '<div class="e-content">dog 6</div>',
+        '<div class="e-content">cat 5</div>',
+        '<div class="e-content">dog 4</div>',
+    ]
+    assert not (tmp_path / "site" / "atom-archive-1.xml").exists()
+
+    # changes to users who aren't in the global feed don't rebuild it
+    (tmp_path / "site" / "atom.xml").unlink()
+    write_page("bird", 9)
+    feeds.refresh({"bird"}, {"bird"})
+    assert not (tmp_path / "site" / "atom.xml").exists()
+
+    write_page("cat", 2, 3, 5, 9)
+    feeds.refresh({"cat"}, {"cat"})
+    assert global_feed() == [
+        '<div class="e-content">cat 9</div>',
+        '<div class="e-content">dog 6</div>',
+        '<div class="e-content">cat 5</div>',
+    ]
+
+    feeds.close()
+
+    # a new process builds the global feed straight from the store
+    (tmp_path / "site" / "atom.xml").unlink()
+    feeds = Feeds(
+        tmp_path, tmp_path / "site", "site", "https://localhost", users, entries=3
+    )
+    feeds.refresh(set(), set())
+    assert global_feed() == [
+        '<div class="e-content">cat 9</div>',
+        '<div class="e-content">dog 6</div>',
+        '<div class="e-content">cat 5</div>',
+    ]
+
+    feeds.close()
+
+
+def test_feeds_index_archives(tmp_path: Path, caplog):
+    from xml.etree import ElementTree
+
+    from beocijies.configure import add_user, create
+    from beocijies.render import render
+
+    config_dir = tmp_path / "config"
+    render_dir = tmp_path / "render"
+
+    create(config_dir, render_dir, name="fake-site", compress=(), feed_entries=2)
+    add_user(config_dir, "dog", public=True)
+    (config_dir / "templates" / "index.html.jinja2").write_text(
+        "".join(
+            f'<article class="h-entry" id="{day}">'
+            '<time class="dt-published" '
+            f'datetime="2025-01-{day:02}T00:00:00+0000"></time>'
+            f'<div class="e-content">index {day}</div></article>'
+            for day in range(1, 6)
+        )
+    )
+
+    with caplog.at_level("INFO", logger="beocijies"):
+        render(config_dir)
+
+    # the index page's feed would be replaced by the global feed, so it
+    # isn't built (and doesn't leave archives nothing links to)
+    assert "rendering feed for index" not in caplog.messages
+    assert "rendering global feed" in caplog.messages
+    assert not list(render_dir.glob("*archive*"))
+
+    root = ElementTree.parse(render_dir / "atom.xml").getroot()
+    links = {
+        link.get("rel"): link.get("href")
+        for link in root.iter("{http://www.w3.org/2005/Atom}link")
+    }
+    assert "prev-archive" not in links
+    assert [
+        entry.find("{http://www.w3.org/2005/Atom}id").text
+        for entry in root.iter("{http://www.w3.org/2005/Atom}entry")
+    ] == ["https://www.localhost/index.html#5", "https://www.localhost/index.html#4"]
+
+    # users' feeds still link to their archives
+    (config_dir / "templates" / "dog.html.jinja2").write_text(
+        "".join(
+            f'<article class="h-entry" id="{day}">'
+            '<time class="dt-published" '
+            f'datetime="2025-02-{day:02}T00:00:00+0000"></time>'
+            f'<div class="e-content">dog {day}</div></article>'
+            for day in range(1, 4)
+        )
+    )
+    render(config_dir, users={"dog"})
+
+    root = ElementTree.parse(render_dir / "dog" / "atom.xml").getroot()
+    links = {
+        link.get("rel"): link.get("href")
+        for link in root.iter("{http://www.w3.org/2005/Atom}link")
+    }
+    assert links["prev-archive"].endswith("/dog/atom-archive-1.xml")
+    assert (render_dir / "dog" / "atom-archive-1.xml").exists()
+    assert not list(render_dir.glob("*archive*"))
+
+
+def test_render_profile(tmp_path: Path):
+    from beocijies.configure import add_user, create
+    from beocijies.render import render
+    from beocijies.timings import Profiler
+
+    config_dir = tmp_path / "config"
+    render_dir = tmp_path / "render"
+
+    create(config_dir, render_dir, name="fake-site")
+    add_user(config_dir, "dog")
+    (config_dir / "static" / "dog" / "bone.txt").write_text("bone")
+
+    render(config_dir, profile=tmp_path / "profile.json")
+
+    with (tmp_path / "profile.json").open() as stream:
+        report = json.load(stream)
+
+    assert report["total"] > 0
+    assert {"static", "pages", "entries", "feeds"} <= set(report["phases"])
+    assert report["counts"]["pages-rendered"] == 2
+    assert report["counts"]["files-copied"] >= 2
+    assert report["users"]["dog"]["counts"]["bytes-copied"] == 4
+    assert "template" in report["users"]["dog"]["times"]
+    assert set(report["templates"]) == {"dog.html.jinja2", "index.html.jinja2"}
+    assert {user for user, _ in report["slowest"]["users"]} == {"dog", "index"}
+
+    render(config_dir, profile=tmp_path / "cprofile.json", profiler=Profiler.CPROFILE)
+    with (tmp_path / "cprofile.json").open() as stream:
+        assert json.load(stream)["cprofile"]
+    assert (tmp_path / "cprofile.pstats").exists()
+
+    render(
+        config_dir,
+        profile=tmp_path / "tracemalloc.json",
+        profiler=Profiler.TRACEMALLOC,
+    )
+    with (tmp_path / "tracemalloc.json").open() as stream:
+        assert json.load(stream)["tracemalloc"]["peak"] > 0
+
+
+def _render_live(monkeypatch, directory: Path, steps, **kwargs):
+    """
+    Run a live render where each step makes some changes and returns
+    the users the (fake) watcher reports as changed
+    """
+    import beocijies.render
+    from beocijies.render import render
+
+    class FakeScheduler:
+        scan_duration = 0.0
+
+        def __init__(self, *args):
+            self.steps = iter(steps)
+
+        def wait(self, timeout=None):
+            step = next(self.steps, None)
+            if step is None:
+                raise KeyboardInterrupt()
+
+            return step()
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(beocijies.render, "get_watcher", lambda directories: None)
+    monkeypatch.setattr(beocijies.render, "Scheduler", FakeScheduler)
+
+    render(directory, live=True, **kwargs)
+
+
+def test_live_manifest(tmp_path: Path, monkeypatch):
+    import beocijies.render
+    from beocijies.configure import add_user, create
+    from beocijies.render import render
+
+    config_dir = tmp_path / "config"
+
+    create(config_dir, tmp_path / "render", name="fake-site", compress=())
+    add_user(config_dir, "dog")
+    render(config_dir)
+
+    saves = []
+    save_manifest = beocijies.render._save_manifest
+    monkeypatch.setattr(
+        beocijies.render,
+        "_save_manifest",
+        lambda *args: saves.append(1) or save_manifest(*args),
+    )
+
+    template = config_dir / "templates" / "dog.html.jinja2"
+
+    def edit():
+        template.write_text("woof")
+        return {"dog"}
+
+    # passes where nothing changed don't rewrite the manifest
+    _render_live(monkeypatch, config_dir, [lambda: {"dog"}, edit, lambda: {"dog"}])
+    assert len(saves) == 1
+
+
+def test_live_reload(tmp_path: Path, monkeypatch):
+    import beocijies.render
+    from beocijies.configure import add_user, create
+
+    config_dir = tmp_path / "config"
+
+    create(
+        config_dir,
+        tmp_path / "render",
+        name="fake-site",
+        compress=(),
+        test_destination=tmp_path / "test",
+    )
+    add_user(config_dir, "dog")
+
+    reloads = []
+
+    class FakeReloadServer:
+        url = "http://localhost:0/events"
+
+        def __init__(self, port):
+            pass
+
+        def start(self):
+            pass
+
+        def reload(self, users):
+            reloads.append(set(users))
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(beocijies.render, "ReloadServer", FakeReloadServer)
+
+    template = config_dir / "templates" / "dog.html.jinja2"
+
+    def comment():
+        template.write_text(f"{template.read_text()}{{# a comment #}}")
+        return {"dog"}
+
+    def edit():
+        template.write_text("woof")
+        return {"dog"}
+
+    _render_live(monkeypatch, config_dir, [comment, edit], reload_port=0)
+
+    # the comment doesn't change the page, so there's nothing to reload
+    assert reloads == [{"dog", "index"}, set(), {"dog"}]
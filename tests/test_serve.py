@@ -0,0 +1,189 @@
+from contextlib import contextmanager
+from http.client import HTTPConnection
+from pathlib import Path
+from threading import Thread
+from typing import Optional
+
+import pytest
+
+
+@contextmanager
+def _server(root: Path, **kwargs):
+    from beocijies.serve import SiteServer
+
+    with SiteServer(("127.0.0.1", 0), root, **kwargs) as server:
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server.server_address[1]
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+def _get(port: int, path: str, headers: Optional[dict[str, str]] = None, method="GET"):
+    connection = HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request(method, path, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def test_serve(tmp_path: Path):
+    import gzip
+
+    root = tmp_path / "site"
+    (root / "dog").mkdir(parents=True)
+    (root / ".site.generations").mkdir()
+    (root / ".site.generations" / "secret.txt").write_text("secret")
+    (root / "index.html").write_text("<p>index</p>")
+    (root / "index.html.gz").write_bytes(gzip.compress(b"<p>index</p>"))
+    (root / "dog" / "index.html").write_text("<p>dog</p>")
+    (root / "dog" / "bone.0123456789ab.jpg").write_bytes(bytes(range(100)))
+
+    with _server(root, users={"dog": "dog"}, fingerprint=True) as port:
+        response, body = _get(port, "/")
+        assert response.status == 200
+        assert body == b"<p>index</p>"
+        assert response.headers["Content-Type"] == "text/html; charset=utf-8"
+        assert response.headers["Cache-Control"] == "no-cache"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert response.headers["Content-Encoding"] is None
+        tag = response.headers["ETag"]
+        modified = response.headers["Last-Modified"]
+
+        # conditional requests
+        response, body = _get(port, "/index.html", {"If-None-Match": tag})
+        assert response.status == 304
+        assert body == b""
+        response, _ = _get(port, "/index.html", {"If-None-Match": '"other"'})
+        assert response.status == 200
+        response, _ = _get(port, "/index.html", {"If-Modified-Since": modified})
+        assert response.status == 304
+
+        # precompressed copies
+        response, body = _get(port, "/", {"Accept-Encoding": "br, gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(body) == b"<p>index</p>"
+        assert response.headers["ETag"] != tag
+        response, body = _get(port, "/", {"Accept-Encoding": "gzip;q=0"})
+        assert body == b"<p>index</p>"
+
+        # directories
+        response, _ = _get(port, "/dog")
+        assert response.status == 301
+        assert response.headers["Location"] == "/dog/"
+        response, body = _get(port, "/dog/")
+        assert body == b"<p>dog</p>"
+
+        # subdomains
+        response, body = _get(port, "/", {"Host": f"dog.localhost:{port}"})
+        assert body == b"<p>dog</p>"
+        response, body = _get(port, "/", {"Host": f"www.dog.localhost:{port}"})
+        assert body == b"<p>dog</p>"
+        response, body = _get(port, "/", {"Host": f"cat.localhost:{port}"})
+        assert body == b"<p>index</p>"
+
+        # ranges
+        path = "/dog/bone.0123456789ab.jpg"
+        response, body = _get(port, path, {"Range": "bytes=10-19"})
+        assert response.status == 206
+        assert body == bytes(range(10, 20))
+        assert response.headers["Content-Range"] == "bytes 10-19/100"
+        assert response.headers["Content-Type"] == "image/jpeg"
+        assert "immutable" in response.headers["Cache-Control"]
+        response, body = _get(port, path, {"Range": "bytes=-5"})
+        assert body == bytes(range(95, 100))
+        response, body = _get(port, path, {"Range": "bytes=90-"})
+        assert body == bytes(range(90, 100))
+        response, _ = _get(port, path, {"Range": "bytes=100-"})
+        assert response.status == 416
+        assert response.headers["Content-Range"] == "bytes */100"
+        response, body = _get(port, path, {"Range": "bytes=0-1", "If-Range": '"old"'})
+        assert response.status == 200
+        assert len(body) == 100
+        response, body = _get(port, path, {"Range": "bytes=0-1,5-6"})
+        assert response.status == 200
+
+        response, body = _get(port, path, method="HEAD")
+        assert response.headers["Content-Length"] == "100"
+        assert body == b""
+
+        # things that shouldn't be served
+        for missing in (
+            "/cat/",
+            "/../site/index.html",
+            "/.site.generations/secret.txt",
+        ):
+            response, _ = _get(port, missing)
+            assert response.status == 404, missing
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    (
+        (None, None),
+        ("bytes=0-9", (0, 9)),
+        ("bytes=5-", (5, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=-1000", (0, 99)),
+        ("bytes=90-1000", (90, 99)),
+        ("bytes=9-5", None),
+        ("lines=1-2", None),
+    ),
+)
+def test_parse_range(value, expected):
+    from beocijies.serve import _parse_range
+
+    assert _parse_range(value, 100) == expected
+
+
+def test_serve_lazy(tmp_path: Path):
+    from time import monotonic, sleep
+
+    from beocijies.configure import add_user, create
+    from beocijies.render import LazyRenderer, render
+
+    config_dir = tmp_path / "config"
+    lazy_dir = tmp_path / "lazy"
+    eager_dir = tmp_path / "eager"
+
+    create(config_dir, tmp_path / "render", name="fake-site")
+    add_user(config_dir, "dog", public=True)
+    add_user(config_dir, "cat")
+    (config_dir / "static" / "dog" / "bone.txt").write_text("bone")
+
+    with LazyRenderer(config_dir, lazy_dir, debounce=0.01) as renderer:
+        with _server(lazy_dir, renderer=renderer) as port:
+            # nothing is rendered until it's asked for
+            assert not (lazy_dir / "dog" / "index.html").exists()
+            assert not (lazy_dir / "cat").exists()
+
+            response, body = _get(port, "/dog/bone.txt")
+            assert body == b"bone"
+            assert (lazy_dir / "dog" / "index.html").exists()
+            assert not (lazy_dir / "cat").exists()
+
+            response, body = _get(port, "/")
+            assert response.status == 200
+            assert not (lazy_dir / "cat").exists()
+
+            # changes are picked up on the next request
+            template = config_dir / "templates" / "dog.html.jinja2"
+            template.write_text(template.read_text().replace("</h1>", "</h1>woof"))
+
+            start = monotonic()
+            while b"woof" not in _get(port, "/dog/")[1]:
+                assert monotonic() - start < 10
+                sleep(0.05)
+
+    render(config_dir, destination=eager_dir)
+
+    for path in ("index.html", "dog/index.html", "dog/bone.txt"):
+        assert (lazy_dir / path).read_bytes() == (eager_dir / path).read_bytes()
+
+    # what was rendered is remembered
+    with LazyRenderer(config_dir, lazy_dir) as renderer:
+        assert renderer.pages["dog"].last
@@ -0,0 +1,31 @@
+def test_timings():
+    from beocijies.timings import Timings, count, recording, slowest, timed
+
+    # nothing is recorded unless asked for
+    count("files")
+    with timed("copying"):
+        pass
+
+    timings = Timings()
+    with recording(timings):
+        count("files")
+        count("bytes", 100)
+        count("bytes", 50)
+
+        with timed("copying"):
+            pass
+
+        inner = Timings()
+        with recording(inner):
+            count("files")
+
+        count("files")
+
+    assert timings.counts == {"files": 2, "bytes": 150}
+    assert list(timings.times) == ["copying"]
+    assert inner.counts == {"files": 1}
+
+    timings.add(inner)
+    assert timings.counts == {"files": 3, "bytes": 150}
+
+    assert slowest({"a": 1.0, "b": 3.0, "c": 2.0}, 2) == ["b", "c"]
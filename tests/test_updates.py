@@ -0,0 +1,89 @@
+import json
+from pathlib import Path
+
+
+def entry(number: int, author: str = "dog", updated: int = 0) -> dict[str, str]:
+    return {
+        "id": str(number),
+        "url": f"https://localhost/{author}/index.html#{number}",
+        "author": author,
+        "published": f"2025-01-{number:02}T00:00:00+0000",
+        "updated": f"2025-01-{updated or number:02}T00:00:00+0000",
+        "contents": f"<p>{number}</p>",
+    }
+
+
+def test_update_store(tmp_path: Path):
+    from beocijies.updates import UpdateStore
+
+    store = UpdateStore(tmp_path / "updates.sqlite3")
+    assert store.users() == []
+    assert store.posts(["dog"]) == []
+
+    store.replace("dog", {"1": entry(1), "2": entry(2), "3": entry(3)})
+    store.replace("cat", {"4": entry(4, "cat"), "5": entry(5, "cat", updated=1)})
+
+    assert store.users() == ["cat", "dog"]
+    assert store.entries("cat") == {"4": entry(4, "cat"), "5": entry(5, "cat", 1)}
+
+    # newest (by update time) first
+    assert [post["id"] for post in store.posts(["dog"])] == ["3", "2", "1"]
+    assert [post["id"] for post in store.posts(["cat", "dog"])] == [
+        "4",
+        "3",
+        "2",
+        "5",
+        "1",
+    ]
+    assert [post["id"] for post in store.posts(["cat", "dog"], limit=2)] == [
+        "4",
+        "3",
+    ]
+
+    # replacing removes entries that are gone
+    store.replace("dog", {"2": entry(2, updated=9), "6": entry(6)})
+    assert [post["id"] for post in store.posts(["dog"])] == ["2", "6"]
+
+    # only the newest entries are kept
+    store.replace("dog", {str(number): entry(number) for number in range(1, 8)}, 3)
+    assert sorted(store.entries("dog")) == ["5", "6", "7"]
+
+    # which page entries were parsed from
+    assert store.page("dog") is None
+    store.replace("dog", store.entries("dog"), page=("abc", "/dog"))
+    assert store.page("dog") == ("abc", "/dog")
+    assert store.page("cat") is None
+
+    store.close()
+
+    # entries are saved
+    store = UpdateStore(tmp_path / "updates.sqlite3")
+    assert sorted(store.entries("dog")) == ["5", "6", "7"]
+    assert store.page("dog") == ("abc", "/dog")
+
+    store.forget_pages()
+    assert store.page("dog") is None
+    store.close()
+
+
+def test_update_store_migrate(tmp_path: Path):
+    from beocijies.updates import UpdateStore
+
+    updates = {
+        "dog": {"1": entry(1), "2": entry(2), "3": entry(3)},
+        "cat": {"4": entry(4, "cat")},
+    }
+    (tmp_path / "updates.json").write_text(json.dumps(updates))
+
+    store = UpdateStore(tmp_path / "updates.sqlite3")
+    store.migrate(tmp_path / "updates.json", retention=2)
+
+    assert store.entries("dog") == {"2": entry(2), "3": entry(3)}
+    assert store.entries("cat") == updates["cat"]
+
+    # migration only happens once
+    assert not (tmp_path / "updates.json").exists()
+    assert (tmp_path / "updates.json.migrated").exists()
+    store.migrate(tmp_path / "updates.json")
+
+    store.close()
@@ -0,0 +1,127 @@
+"""
+Tests for watching for changes
+"""
+
+import sys
+from pathlib import Path
+from time import sleep
+
+from pytest import mark, raises
+
+
+def test_watcher_needs_wait():
+    from beocijies.watch import Watcher
+
+    class Incomplete(Watcher):
+        pass
+
+    with raises(TypeError):
+        Incomplete()  # type: ignore[abstract]
+
+
+def test_polling_watcher():
+    from beocijies.watch import PollingWatcher
+
+    watcher = PollingWatcher(interval=0.01)
+
+    # polling can't tell what changed
+    assert watcher.wait() is None
+
+    # but timing out early means nothing changed
+    assert watcher.wait(timeout=0) == set()
+
+
+@mark.skipif(not sys.platform.startswith("linux"), reason="inotify is linux-only")
+def test_inotify_watcher(tmp_path: Path):
+    from beocijies.watch import InotifyWatcher
+
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    static = tmp_path / "static"
+    (static / "dog").mkdir(parents=True)
+
+    with InotifyWatcher((templates, static)) as watcher:
+        assert watcher.wait(timeout=0) == set()
+
+        (templates / "dog.html.jinja2").write_text("woof")
+        assert watcher.wait(timeout=1) == {templates / "dog.html.jinja2"}
+
+        (static / "dog" / "update-1.jpg").write_bytes(b"")
+        assert watcher.wait(timeout=1) == {static / "dog" / "update-1.jpg"}
+
+        # new directories are watched too
+        (static / "cat").mkdir()
+        assert watcher.wait(timeout=1) == {static / "cat"}
+        (static / "cat" / "update-1.jpg").write_bytes(b"")
+        assert watcher.wait(timeout=1) == {static / "cat" / "update-1.jpg"}
+
+        # nothing else happened
+        assert watcher.wait(timeout=0) == set()
+
+
+def test_get_watcher(tmp_path: Path):
+    from beocijies.watch import InotifyWatcher, PollingWatcher, get_watcher
+
+    with get_watcher((tmp_path,)) as watcher:
+        if sys.platform.startswith("linux"):
+            assert isinstance(watcher, InotifyWatcher)
+        else:
+            assert isinstance(watcher, PollingWatcher)
+
+
+def test_scheduler(tmp_path: Path):
+    from time import monotonic
+
+    from beocijies.watch import Scheduler, Watcher
+
+    class FakeWatcher(Watcher):
+        def __init__(self):
+            self.changes: list = []
+
+        def wait(self, timeout=None):
+            if self.changes:
+                change = self.changes.pop(0)
+                if callable(change):
+                    change = change()
+                return change
+
+            assert timeout is not None
+            sleep(timeout)
+            return set()
+
+    dog = tmp_path / "dog.jpg"
+    cat = tmp_path / "cat.jpg"
+    base = tmp_path / "base.html"
+    for path in (dog, cat, base):
+        path.write_bytes(b"")
+
+    def group(path: Path):
+        if path == base:
+            return {"dog", "cat"}
+        return {path.stem}
+
+    watcher = FakeWatcher()
+    with Scheduler(watcher, group, debounce=0.05) as scheduler:
+        assert scheduler.wait(timeout=0) == set()
+
+        # a burst of changes is only handed back once
+        watcher.changes = [{dog}, {dog, base}, {dog}]
+        start = monotonic()
+        assert scheduler.wait() == {"dog", "cat"}
+        assert monotonic() - start >= 0.05
+        assert scheduler.wait(timeout=0.1) == set()
+
+        # files that are still being written hold their group back
+        def grow():
+            dog.write_bytes(b"more")
+            return set()
+
+        watcher.changes = [{dog, cat}, grow]
+        assert scheduler.wait() == {"cat"}
+        assert scheduler.pending
+        assert scheduler.wait() == {"dog"}
+
+        # the watcher losing track of changes means checking everything
+        watcher.changes = [{dog}, None]
+        assert scheduler.wait() is None
+        assert not scheduler.pending